@@ -0,0 +1,41 @@
+from collections import defaultdict
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from accounts import suggestions
+from accounts.models import FriendShip
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = "フォローの関係から「おすすめユーザー」を計算し直す"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=10000, help="フォローの関係を一度に読む件数")
+        parser.add_argument("--batch-size", type=int, default=500, help="おすすめを一度に書き込むユーザー数")
+        parser.add_argument("--limit", type=int, default=suggestions.LIMIT, help="1 人あたりに保存するおすすめの件数")
+
+    def handle(self, *args, chunk_size, batch_size, limit, **options):
+        # モデルを作らずに (フォローする人, される人) の組だけを少しずつ読み、隣接リストにする
+        following, followers = defaultdict(set), defaultdict(set)
+        edges = 0
+        for follower_id, followee_id in FriendShip.objects.values_list("follower_id", "followee_id").iterator(
+            chunk_size=chunk_size
+        ):
+            following[follower_id].add(followee_id)
+            followers[followee_id].add(follower_id)
+            edges += 1
+
+        last_pk = 0
+        users = 0
+        while True:
+            pks = list(User.objects.filter(pk__gt=last_pk).order_by("pk").values_list("pk", flat=True)[:batch_size])
+            if not pks:
+                break
+            last_pk = pks[-1]
+            users += len(pks)
+            suggestions.replace({pk: suggestions.score(pk, following, followers, limit) for pk in pks})
+
+        self.stdout.write(self.style.SUCCESS(f"{edges} 件のフォローから {users} 人のおすすめを計算しました"))
@@ -0,0 +1,68 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Case, Count, F, OuterRef, Q, Subquery, Value, When
+from django.db.models.functions import Coalesce
+
+from accounts import user_cache
+from accounts.models import FriendShip
+from tweets.models import ArchivedTweet, Tweet
+
+User = get_user_model()
+
+
+def count_of(queryset, field):
+    subquery = queryset.filter(**{field: OuterRef("pk")}).order_by().values(field).annotate(n=Count("pk")).values("n")
+    return Coalesce(Subquery(subquery), Value(0))
+
+
+class Command(BaseCommand):
+    help = "フォロー数・フォロワー数・ツイート数のカウンタを実際の件数に合わせて修復する"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=1000)
+
+    def handle(self, *args, chunk_size, **options):
+        actual = {
+            "following_count": count_of(FriendShip.objects, "follower"),
+            "followers_count": count_of(FriendShip.objects, "followee"),
+            "tweets_count": count_of(Tweet.objects, "user"),
+        }
+        drifted = Q()
+        for field in actual:
+            drifted |= ~Q(**{field: F(f"actual_{field}")})
+
+        last_pk = 0
+        checked = repaired = 0
+        while True:
+            pks = list(User.objects.filter(pk__gt=last_pk).order_by("pk").values_list("pk", flat=True)[:chunk_size])
+            if not pks:
+                break
+            last_pk = pks[-1]
+            checked += len(pks)
+
+            # アーカイブしたツイートもツイート数に含める。アーカイブは別のデータベースにありうるので先に数えておく
+            archived = (
+                ArchivedTweet.objects.filter(user_id__in=pks)
+                .order_by()
+                .values("user_id")
+                .annotate(n=Count("pk"))
+                .values_list("user_id", "n")
+            )
+            expected = {
+                **actual,
+                "tweets_count": actual["tweets_count"]
+                + Case(*(When(pk=pk, then=Value(n)) for pk, n in archived), default=Value(0)),
+            }
+            with transaction.atomic():
+                drifted_pks = list(
+                    User.objects.filter(pk__in=pks)
+                    .annotate(**{f"actual_{field}": expression for field, expression in expected.items()})
+                    .filter(drifted)
+                    .values_list("pk", flat=True)
+                )
+                if drifted_pks:
+                    repaired += User.objects.filter(pk__in=drifted_pks).update(**expected)
+                    user_cache.invalidate(*drifted_pks)
+
+        self.stdout.write(self.style.SUCCESS(f"{checked} 人中 {repaired} 人のカウンタを修復しました"))
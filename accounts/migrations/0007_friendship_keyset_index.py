@@ -0,0 +1,29 @@
+# Generated by Django 4.2.30 on 2026-10-18 02:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("accounts", "0006_user_profile_version"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="friendship",
+            name="friendship_follower_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="friendship",
+            name="friendship_followee_idx",
+        ),
+        migrations.AddIndex(
+            model_name="friendship",
+            index=models.Index(fields=["follower", "-created_at", "-id"], name="friendship_follower_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="friendship",
+            index=models.Index(fields=["followee", "-created_at", "-id"], name="friendship_followee_idx"),
+        ),
+    ]
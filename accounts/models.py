@@ -1,9 +1,12 @@
 from django.conf import settings
 from django.contrib.auth.models import AbstractUser
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F
 from django.urls import reverse
 from django.utils import timezone
 
+from accounts import user_cache
+
 
 class User(AbstractUser):
     email = models.EmailField()
@@ -14,10 +17,93 @@ class User(AbstractUser):
         through="FriendShip",
         through_fields=("follower", "followee"),
     )
+    # 以下のカウンタは F 式で更新するので save() では書き戻さない
+    following_count = models.PositiveIntegerField(default=0)
+    followers_count = models.PositiveIntegerField(default=0)
+    tweets_count = models.PositiveIntegerField(default=0)
+    # ユーザー名など他人の画面に出る情報が変わるたびに増える。キャッシュのキーに使う
+    profile_version = models.PositiveIntegerField(default=0)
+
+    COUNTER_FIELDS = ("following_count", "followers_count", "tweets_count")
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_username = instance.__dict__.get("username")
+        return instance
+
+    def save(self, *args, **kwargs):
+        loaded_username = getattr(self, "_loaded_username", None)
+        if loaded_username is not None and loaded_username != self.username:
+            self.profile_version += 1
+            if kwargs.get("update_fields") is not None:
+                kwargs["update_fields"] = {*kwargs["update_fields"], "profile_version"}
+        if not self._state.adding and kwargs.get("update_fields") is None:
+            kwargs["update_fields"] = [
+                field.name
+                for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.COUNTER_FIELDS
+            ]
+        adding = self._state.adding
+        super().save(*args, **kwargs)
+        self._loaded_username = self.username
+        if not adding:
+            # パスワードの変更などをログイン中のセッションにも反映させる
+            user_cache.invalidate(self.pk)
 
     def get_absolute_url(self):
         return reverse("accounts:user_profile", kwargs={"username": self.username})
 
+    def follow(self, user):
+        return user.pk in self.follow_many([user.pk])
+
+    def unfollow(self, user):
+        return user.pk in self.unfollow_many([user.pk])
+
+    def follow_many(self, user_ids):
+        """まだフォローしていないユーザーをまとめてフォローし、新しくフォローしたユーザーの id を返す。"""
+        # 呼び出し元のトランザクションに相乗りし、余分な SAVEPOINT を発行しない
+        with transaction.atomic(savepoint=False):
+            following_ids = set(
+                FriendShip.objects.filter(follower=self, followee_id__in=user_ids).values_list(
+                    "followee_id", flat=True
+                )
+            )
+            new_ids = {user_id for user_id in user_ids if user_id not in following_ids and user_id != self.pk}
+            if new_ids:
+                created_at = timezone.now()
+                FriendShip.objects.bulk_create(
+                    [FriendShip(follower=self, followee_id=user_id, created_at=created_at) for user_id in new_ids],
+                    ignore_conflicts=True,
+                )
+                # 同時にフォローされて読み飛ばされた行は数えないよう、この呼び出しで書いた行だけを読み直す
+                new_ids = set(
+                    FriendShip.objects.filter(
+                        follower=self, followee_id__in=new_ids, created_at=created_at
+                    ).values_list("followee_id", flat=True)
+                )
+            if new_ids:
+                User.objects.filter(pk=self.pk).update(following_count=F("following_count") + len(new_ids))
+                User.objects.filter(pk__in=new_ids).update(followers_count=F("followers_count") + 1)
+                user_cache.invalidate(self.pk, *new_ids)
+        return new_ids
+
+    def unfollow_many(self, user_ids):
+        """フォローしているユーザーをまとめてフォロー解除し、解除したユーザーの id を返す。"""
+        with transaction.atomic(savepoint=False):
+            friend_ships = FriendShip.objects.filter(follower=self, followee_id__in=user_ids)
+            unfollowed_ids = set(friend_ships.values_list("followee_id", flat=True))
+            if unfollowed_ids:
+                friend_ships.delete()
+                User.objects.filter(pk=self.pk, following_count__gte=len(unfollowed_ids)).update(
+                    following_count=F("following_count") - len(unfollowed_ids)
+                )
+                User.objects.filter(pk__in=unfollowed_ids, followers_count__gt=0).update(
+                    followers_count=F("followers_count") - 1
+                )
+                user_cache.invalidate(self.pk, *unfollowed_ids)
+        return unfollowed_ids
+
 
 class FriendShip(models.Model):
     # フォローしている人
@@ -28,3 +114,19 @@ class FriendShip(models.Model):
 
     class Meta:
         constraints = [models.UniqueConstraint(fields=["follower", "followee"], name="unique_friendship")]
+        indexes = [
+            models.Index(fields=["follower", "-created_at", "-id"], name="friendship_follower_idx"),
+            models.Index(fields=["followee", "-created_at", "-id"], name="friendship_followee_idx"),
+        ]
+
+
+class FollowSuggestion(models.Model):
+    """compute_suggestions コマンドで計算し、フォロー・フォロー解除のたびにそのユーザーの分を計算し直す「おすすめユーザー」。"""
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, related_name="+", on_delete=models.CASCADE)
+    candidate = models.ForeignKey(settings.AUTH_USER_MODEL, related_name="+", on_delete=models.CASCADE)
+    score = models.IntegerField()
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=["user", "candidate"], name="unique_follow_suggestion")]
+        indexes = [models.Index(fields=["user", "-score", "candidate"], name="follow_suggestion_score_idx")]
@@ -0,0 +1,76 @@
+import heapq
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Count
+
+from accounts.models import FollowSuggestion, FriendShip
+
+# 1 人あたりに保存するおすすめの件数
+LIMIT = 20
+
+
+def score(user_id, following, followers, limit=LIMIT):
+    """
+    following / followers はユーザー ID からフォロー中 / フォロワーの ID の集合への dict。
+    フォロー中のユーザーがフォローしている人 (友達の友達) と、自分のフォロワーがフォローしている人 (共通のフォロワー) を
+    経路 1 本につき 1 点として数え、まだフォローしていない上位 limit 人を (候補, 点数) のリストで返す。
+    """
+    followees = following.get(user_id, ())
+    scores = Counter()
+    for followee_id in followees:
+        scores.update(following.get(followee_id, ()))
+    for follower_id in followers.get(user_id, ()):
+        scores.update(following.get(follower_id, ()))
+    for user_id in (user_id, *followees):
+        scores.pop(user_id, None)
+    return heapq.nsmallest(limit, scores.items(), key=lambda item: (-item[1], item[0]))
+
+
+def replace(scored):
+    """scored ({ユーザー ID: [(候補, 点数), ...]}) のユーザーのおすすめを置き換える。"""
+    with transaction.atomic():
+        FollowSuggestion.objects.filter(user_id__in=scored).delete()
+        FollowSuggestion.objects.bulk_create(
+            FollowSuggestion(user_id=user_id, candidate_id=candidate_id, score=score)
+            for user_id, candidates in scored.items()
+            for candidate_id, score in candidates
+        )
+
+
+def score_one(user_id, limit=LIMIT):
+    """user_id 1 人の点数を score() と同じ数え方で DB から集計する。経路を数える対象ごとに GROUP BY を 1 回ずつ発行する。"""
+    following = FriendShip.objects.filter(follower_id=user_id).values("followee_id")
+    followers = FriendShip.objects.filter(followee_id=user_id).values("follower_id")
+    scores = Counter()
+    for via in (following, followers):
+        scores.update(
+            dict(
+                FriendShip.objects.filter(follower_id__in=via)
+                .exclude(followee_id=user_id)
+                .exclude(followee_id__in=following)
+                .values("followee_id")
+                .annotate(paths=Count("id"))
+                .values_list("followee_id", "paths")
+            )
+        )
+    return heapq.nsmallest(limit, scores.items(), key=lambda item: (-item[1], item[0]))
+
+
+def refresh(user_id):
+    """
+    user_id のおすすめを compute_suggestions と同じ点数で計算し直し、上位 LIMIT 人に置き換える。
+    フォロー・フォロー解除のたびに差分を足し引きすると、足していない点まで引いたり、
+    ジョブが再実行されたときに同じ点を二重に足したりするので、差分では扱わない。
+    """
+    replace({user_id: score_one(user_id)})
+
+
+def for_user(user_id, limit=5):
+    """おすすめのユーザーを点数の高い順に返すクエリセット。(user, -score, candidate) の索引を 1 回読むだけで済む。"""
+    suggestions = FollowSuggestion.objects.filter(user_id=user_id).select_related("candidate")
+    return suggestions.order_by("-score", "candidate_id")[:limit]
+
+
+async def afor_user(user_id, limit=5):
+    return [suggestion.candidate async for suggestion in for_user(user_id, limit)]
@@ -0,0 +1,9 @@
+from jobs import queue
+
+from . import suggestions
+
+
+@queue.register("accounts.update_suggestions")
+def update_suggestions(user_id, followed_ids=(), unfollowed_ids=()):
+    if followed_ids or unfollowed_ids:
+        suggestions.refresh(user_id)
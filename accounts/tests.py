@@ -1,11 +1,21 @@
+from io import StringIO
+from unittest import mock
+
+from asgiref.sync import sync_to_async
 from django.conf import settings
 from django.contrib.auth import SESSION_KEY, get_user_model
-from django.test import TestCase
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.utils import timezone
 
-from accounts.models import FriendShip
-from tweets.models import Tweet
+from accounts import suggestions, tasks, user_cache
+from accounts.models import FollowSuggestion, FriendShip
+from accounts.views import FollowingListView
+from mysite.testing import QueryBudgetTestMixin, QueryPlanTestMixin
+from tweets.models import TimelineEntry, Tweet
 
 User = get_user_model()
 
@@ -305,8 +315,9 @@ class TestUserProfileView(TestCase):
                 Tweet.objects.create(user=user, body=f"tweet{tweet_index} of user{user_index}")
 
         self.user = users[0]
-        self.user.following.add(users[1], users[2])
-        self.user.followers.add(users[3])
+        self.user.follow(users[1])
+        self.user.follow(users[2])
+        users[3].follow(self.user)
         self.user.save()
 
         self.tweets = Tweet.objects.filter(user=self.user).order_by("-created_at")
@@ -335,6 +346,49 @@ class TestUserProfileView(TestCase):
         for tweet in self.tweets:
             self.assertContains(response, tweet.body, count=1)
 
+    def test_success_get_with_cursor(self):
+        Tweet.objects.bulk_create(Tweet(user=self.user, body=f"bulk tweet{i}") for i in range(20))
+        tweets = list(Tweet.objects.filter(user=self.user).order_by("-created_at", "-id"))
+
+        response = self.client.get(self.url)
+        page = response.context["page_obj"]
+        self.assertEqual(response.context["tweets"], tweets[:20])
+
+        response = self.client.get(self.url, {"cursor": page.next_cursor})
+        self.assertEqual(response.context["tweets"], tweets[20:])
+        self.assertFalse(response.context["page_obj"].has_next())
+
+    def test_failure_get_without_login(self):
+        self.client.logout()
+        response = self.client.get(self.url)
+        self.assertRedirects(response, f"{settings.LOGIN_URL}?next={self.url}")
+
+    def test_not_modified(self):
+        etag = self.client.get(self.url).headers["ETag"]
+
+        # 対象ユーザー, フォロー状態, 最新のツイート, おすすめの SELECT だけで 304 を返す
+        with self.assertNumQueries(4):
+            response = self.client.get(self.url, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertTemplateNotUsed(response, "accounts/user_profile.html")
+
+    def test_modified_after_follow(self):
+        etag = self.client.get(self.url).headers["ETag"]
+        self.client.post(reverse("accounts:follow", kwargs={"username": self.user.username}))
+
+        response = self.client.get(self.url, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context["is_following"])
+
+    def test_modified_after_replacing_tweet(self):
+        etag = self.client.get(self.url).headers["ETag"]
+        # ツイート数が変わらないように、削除と投稿を 1 件ずつ行う
+        self.tweets.first().delete()
+        Tweet.objects.create(user=self.user, body="new tweet of user0")
+
+        response = self.client.get(self.url, headers={"If-None-Match": etag})
+        self.assertContains(response, "new tweet of user0", status_code=200)
+
 
 # class TestUserProfileEditView(TestCase):
 #     def test_success_get(self):
@@ -358,6 +412,7 @@ class TestFollowView(TestCase):
             email="elon@example.com",
             password="asdfg!@#$%22345",
         )
+        self.tweet = Tweet.objects.create(user=self.following_user, body="tweet of Elon Mask")
         self.url = lambda username: reverse("accounts:follow", kwargs={"username": username})
         self.client.force_login(self.user)
 
@@ -375,6 +430,24 @@ class TestFollowView(TestCase):
                 followee=self.following_user,
             ).exists()
         )
+        self.assertTrue(TimelineEntry.objects.filter(owner=self.user, tweet=self.tweet).exists())
+        self.assertEqual(User.objects.get(pk=self.user.pk).following_count, 1)
+        self.assertEqual(User.objects.get(pk=self.following_user.pk).followers_count, 1)
+
+    def test_num_queries(self):
+        # ログインユーザー, 相手, SAVEPOINT, フォロー済みかの SELECT, INSERT, 書き込めた行の SELECT,
+        # カウンタの UPDATE x 2, バックフィルの SELECT, タイムラインの INSERT,
+        # おすすめの更新 (SAVEPOINT, 計算し直す集計 x 2, 置き換えの SAVEPOINT, DELETE, RELEASE, RELEASE), RELEASE
+        # (セッションはキャッシュから読む)
+        with self.assertNumQueries(18):
+            self.client.post(self.url(self.following_user.username))
+
+    def test_success_post_with_following_user(self):
+        self.client.post(self.url(self.following_user.username))
+        self.client.post(self.url(self.following_user.username))
+        self.assertEqual(FriendShip.objects.count(), 1)
+        self.assertEqual(User.objects.get(pk=self.user.pk).following_count, 1)
+        self.assertEqual(User.objects.get(pk=self.following_user.pk).followers_count, 1)
 
     def test_failure_post_with_not_exist_user(self):
         response = self.client.post(self.url("not_exist_user"))
@@ -399,7 +472,9 @@ class TestUnfollowView(TestCase):
             email="elon@example.com",
             password="asdfg!@#$%22345",
         )
-        self.user.following.add(self.following_user)
+        self.user.follow(self.following_user)
+        tweet = Tweet.objects.create(user=self.following_user, body="tweet of Elon Mask")
+        TimelineEntry.objects.create(owner=self.user, tweet=tweet, created_at=tweet.created_at)
         self.url = lambda username: reverse("accounts:unfollow", kwargs={"username": username})
         self.client.force_login(self.user)
 
@@ -417,6 +492,9 @@ class TestUnfollowView(TestCase):
                 followee=self.following_user,
             ).exists()
         )
+        self.assertFalse(TimelineEntry.objects.filter(owner=self.user).exists())
+        self.assertEqual(User.objects.get(pk=self.user.pk).following_count, 0)
+        self.assertEqual(User.objects.get(pk=self.following_user.pk).followers_count, 0)
 
     def test_failure_post_with_not_exist_user(self):
         response = self.client.post(self.url("not_exist_user"))
@@ -428,8 +506,17 @@ class TestUnfollowView(TestCase):
             ).exists()
         )
 
+    def test_num_queries(self):
+        # ログインユーザー, 相手, SAVEPOINT, フォロー中かの SELECT, DELETE,
+        # カウンタの UPDATE x 2, タイムラインの DELETE,
+        # おすすめの更新 (SAVEPOINT, 計算し直す集計 x 2, 置き換えの SAVEPOINT, DELETE, RELEASE, RELEASE), RELEASE
+        with self.assertNumQueries(16):
+            self.client.post(self.url(self.following_user.username))
+
     def test_failure_post_with_self(self):
-        response = self.client.post(self.url(self.user.username))
+        # 自分自身は読み込み済みの request.user を使うので、相手を引く SELECT は発行しない
+        with self.assertNumQueries(1):
+            response = self.client.post(self.url(self.user.username))
         self.assertEqual(response.status_code, 400)
         self.assertTrue(
             FriendShip.objects.filter(
@@ -439,6 +526,104 @@ class TestUnfollowView(TestCase):
         )
 
 
+class TestBulkFollowView(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="user", email="user@example.com", password="asdfg!@#$%12345")
+        self.others = User.objects.bulk_create(
+            User(username=f"other{i}", email=f"other{i}@example.com") for i in range(60)
+        )
+        self.user.follow(self.others[0])
+        self.tweet = Tweet.objects.create(user=self.others[1], body="tweet of other1")
+        self.url = reverse("accounts:bulk_follow")
+        self.client.force_login(self.user)
+
+    def post(self, data):
+        return self.client.post(self.url, data, content_type="application/json")
+
+    def test_success_post(self):
+        response = self.post(
+            {
+                "follow": ["other1", "other2", "not_exist_user", "user"],
+                "unfollow": ["other0", "other3"],
+            }
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.json(),
+            {
+                "results": {
+                    "other1": "followed",
+                    "other2": "followed",
+                    "not_exist_user": "not_found",
+                    "user": "self",
+                    "other0": "unfollowed",
+                    "other3": "not_following",
+                },
+                "following_count": 2,
+                "followers_count": 0,
+            },
+        )
+        self.assertQuerySetEqual(
+            FriendShip.objects.filter(follower=self.user)
+            .order_by("followee__username")
+            .values_list("followee__username", flat=True),
+            ["other1", "other2"],
+        )
+        self.assertEqual(User.objects.get(username="other1").followers_count, 1)
+        self.assertEqual(User.objects.get(username="other0").followers_count, 0)
+        self.assertTrue(TimelineEntry.objects.filter(owner=self.user, tweet=self.tweet).exists())
+
+    def test_success_post_with_following_user(self):
+        response = self.post({"follow": ["other0"]})
+        self.assertEqual(response.json()["results"], {"other0": "already_following"})
+        self.assertEqual(response.json()["following_count"], 1)
+
+    def test_follow_many_skips_concurrently_created_rows(self):
+        bulk_create = FriendShip.objects.bulk_create
+
+        def follow_concurrently(objs, **kwargs):
+            # 読んでから書くまでの間に、別のリクエストが other2 のフォローを書き込んだ
+            FriendShip.objects.create(follower=self.user, followee=self.others[2])
+            return bulk_create(objs, **kwargs)
+
+        with mock.patch.object(FriendShip.objects, "bulk_create", side_effect=follow_concurrently):
+            new_ids = self.user.follow_many([self.others[1].pk, self.others[2].pk])
+        self.assertEqual(new_ids, {self.others[1].pk})
+        self.assertEqual(User.objects.get(pk=self.user.pk).following_count, 2)
+        self.assertEqual(User.objects.get(pk=self.others[2].pk).followers_count, 0)
+
+    def test_num_queries_independent_of_usernames(self):
+        def count_queries(usernames):
+            with CaptureQueriesContext(connection) as context:
+                self.post({"follow": usernames})
+            return len(context.captured_queries)
+
+        self.assertEqual(
+            count_queries([f"other{i}" for i in range(2, 7)]),
+            count_queries([f"other{i}" for i in range(7, 60)]),
+        )
+
+    def test_failure_post_with_invalid_json(self):
+        response = self.client.post(self.url, "follow", content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+
+    def test_failure_post_with_invalid_usernames(self):
+        response = self.post({"follow": "other1"})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(FriendShip.objects.count(), 1)
+
+    def test_failure_post_with_too_many_usernames(self):
+        response = self.post({"follow": [f"other{i}" for i in range(301)]})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(FriendShip.objects.count(), 1)
+
+    def test_failure_post_with_same_user_in_both(self):
+        response = self.post({"follow": ["other1"], "unfollow": ["other1"]})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(FriendShip.objects.count(), 1)
+
+
 class TestFollowingListView(TestCase):
     def setUp(self):
         self.users = []
@@ -471,6 +656,60 @@ class TestFollowingListView(TestCase):
         self.assertQuerysetEqual(actual_following, self.expected_following, ordered=True)
         self.assertTemplateUsed("accounts/following_list.html")
 
+    def test_num_queries(self):
+        # 他人の一覧: ログインユーザー, 対象ユーザー, フォロー一覧
+        with self.assertNumQueries(3):
+            self.client.get(self.url)
+        # 自分の一覧では対象ユーザーの SELECT を省く
+        self.client.force_login(self.user)
+        with self.assertNumQueries(2):
+            self.client.get(self.url)
+
+    @override_settings(FRIENDSHIP_LIST_STREAM_THRESHOLD=2)
+    def test_success_get_streaming(self):
+        User.objects.filter(pk=self.user.pk).update(following_count=3)
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        content = b"".join(response.streaming_content).decode()
+        positions = [content.index(user.get_absolute_url()) for user in self.expected_following]
+        self.assertEqual(positions, sorted(positions))
+        self.assertIn("<h1>フォロー中一覧</h1>", content)
+        self.assertTrue(content.rstrip().endswith("</html>"))
+
+    @override_settings(FRIENDSHIP_LIST_STREAM_THRESHOLD=2)
+    async def test_success_get_streaming_via_asgi(self):
+        await User.objects.filter(pk=self.user.pk).aupdate(following_count=3)
+        await sync_to_async(self.async_client.force_login)(self.users[2])
+        with mock.patch.object(FollowingListView, "chunk_size", 1):
+            response = await self.async_client.get(self.url)
+            self.assertTrue(response.is_async)
+            chunks = [chunk.decode() async for chunk in response.streaming_content]
+
+        # 先頭, 1 行ずつ 3 回, 末尾 に分かれて届く
+        self.assertEqual(len(chunks), 5)
+        self.assertIn("<h1>フォロー中一覧</h1>", chunks[0])
+        for chunk, user in zip(chunks[1:4], self.expected_following):
+            self.assertIn(user.get_absolute_url(), chunk)
+        self.assertTrue(chunks[-1].rstrip().endswith("</html>"))
+
+    def test_success_get_json(self):
+        response = self.client.get(self.url, {"format": "json"})
+
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(
+            [row["username"] for row in data["results"]], [user.username for user in self.expected_following]
+        )
+        self.assertIsNone(data["next_cursor"])
+        self.assertIsNone(data["prev_cursor"])
+
+    def test_failure_get_json_with_invalid_cursor(self):
+        response = self.client.get(self.url, {"format": "json", "cursor": "invalid"})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {"message": "不正なカーソルです"})
+
 
 class TestFollowerListView(TestCase):
     def setUp(self):
@@ -503,3 +742,234 @@ class TestFollowerListView(TestCase):
         actual_followers = [user for (user, _) in response.context["follower_list"]]
         self.assertQuerysetEqual(actual_followers, self.expected_followers, ordered=True)
         self.assertTemplateUsed("accounts/follower_list.html")
+
+    def test_num_queries(self):
+        with self.assertNumQueries(3):
+            self.client.get(self.url)
+        self.client.force_login(self.user)
+        with self.assertNumQueries(2):
+            self.client.get(self.url)
+
+    @override_settings(FRIENDSHIP_LIST_STREAM_THRESHOLD=0)
+    def test_success_get_streaming(self):
+        User.objects.filter(pk=self.user.pk).update(followers_count=len(self.expected_followers))
+        response = self.client.get(self.url)
+
+        self.assertTrue(response.streaming)
+        content = b"".join(response.streaming_content).decode()
+        for follower in self.expected_followers:
+            self.assertEqual(content.count(f'<a href="{follower.get_absolute_url()}">{follower.username}</a>'), 1)
+
+
+class TestUserProfileVersion(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="user", email="user@example.com", password="asdfg!@#$%12345")
+
+    def test_username_change(self):
+        user = User.objects.get(pk=self.user.pk)
+        user.username = "renamed"
+        user.save()
+        self.assertEqual(User.objects.get(pk=self.user.pk).profile_version, 1)
+
+        user.email = "renamed@example.com"
+        user.save()
+        self.assertEqual(User.objects.get(pk=self.user.pk).profile_version, 1)
+
+
+class TestRecountCommand(TestCase):
+    def setUp(self):
+        self.users = User.objects.bulk_create(
+            User(username=f"user{i}", email=f"user{i}@example.com") for i in range(3)
+        )
+        self.users[0].follow(self.users[1])
+        self.users[0].follow(self.users[2])
+        Tweet.objects.create(user=self.users[1], body="tweet of user1")
+        # カウンタを経由しない書き込みでずれを作る
+        FriendShip.objects.create(follower=self.users[1], followee=self.users[2])
+        User.objects.filter(pk=self.users[0].pk).update(following_count=10)
+
+    def test_recount(self):
+        stdout = StringIO()
+        call_command("recount", chunk_size=2, stdout=stdout)
+
+        counts = {
+            user.username: (user.following_count, user.followers_count, user.tweets_count)
+            for user in User.objects.all()
+        }
+        self.assertEqual(counts, {"user0": (2, 0, 0), "user1": (1, 1, 1), "user2": (0, 2, 0)})
+        self.assertIn("3 人中 3 人", stdout.getvalue())
+
+
+class TestFollowSuggestion(TestCase):
+    def setUp(self):
+        self.users = {
+            name: User.objects.create_user(username=name, email=f"{name}@example.com", password="asdfg!@#$%12345")
+            for name in ("alice", "bob", "carol", "dave", "erin")
+        }
+        for follower, followee in [
+            ("alice", "bob"),
+            ("bob", "carol"),
+            ("bob", "dave"),
+            ("erin", "alice"),
+            ("erin", "dave"),
+        ]:
+            FriendShip.objects.create(follower=self.users[follower], followee=self.users[followee])
+        call_command("compute_suggestions", batch_size=2, stdout=StringIO())
+        self.client.force_login(self.users["alice"])
+
+    def get_suggestions(self, name):
+        return [(s.candidate.username, s.score) for s in suggestions.for_user(self.users[name].pk, limit=20)]
+
+    def test_compute_suggestions(self):
+        # dave はフォロー中の bob と、フォロワーの erin の両方がフォローしている
+        self.assertEqual(self.get_suggestions("alice"), [("dave", 2), ("carol", 1)])
+        self.assertEqual(self.get_suggestions("erin"), [("bob", 1)])
+
+    def test_success_get_home_with_suggestions(self):
+        response = self.client.get(reverse("tweets:home"))
+        self.assertEqual(response.context["suggestions"], [self.users["dave"], self.users["carol"]])
+        self.assertContains(response, "おすすめユーザー")
+
+    def test_follow_updates_suggestions(self):
+        FriendShip.objects.create(follower=self.users["carol"], followee=self.users["erin"])
+        self.client.post(reverse("accounts:follow", kwargs={"username": "carol"}))
+        # フォローした carol は外れ、carol がフォローしている erin が加わる
+        self.assertEqual(self.get_suggestions("alice"), [("dave", 2), ("erin", 1)])
+
+    def test_follow_keeps_limit_and_rerun_is_idempotent(self):
+        others = User.objects.bulk_create(
+            User(username=f"user{i}", email=f"user{i}@example.com") for i in range(suggestions.LIMIT + 10)
+        )
+        FriendShip.objects.bulk_create(FriendShip(follower=self.users["carol"], followee=user) for user in others)
+        self.client.post(reverse("accounts:follow", kwargs={"username": "carol"}))
+        expected = self.get_suggestions("alice")
+        self.assertEqual(len(expected), suggestions.LIMIT)
+        self.assertEqual(expected[0], ("dave", 2))
+
+        # リースが切れて同じジョブがもう一度実行されても、点数は二重に足されない
+        for _ in range(2):
+            tasks.update_suggestions(self.users["alice"].pk, followed_ids=[self.users["carol"].pk])
+            self.assertEqual(self.get_suggestions("alice"), expected)
+        self.assertEqual(FollowSuggestion.objects.filter(user=self.users["alice"]).count(), suggestions.LIMIT)
+
+    def test_unfollow_updates_suggestions(self):
+        self.client.post(reverse("accounts:unfollow", kwargs={"username": "bob"}))
+        # bob を経由した点が引かれ、点の無くなった carol は消える
+        self.assertEqual(self.get_suggestions("alice"), [("dave", 1)])
+
+    def test_unfollow_after_followee_follows_someone_new(self):
+        frank = User.objects.create_user(username="frank", email="frank@example.com", password="asdfg!@#$%12345")
+        FriendShip.objects.create(follower=self.users["erin"], followee=frank)
+        call_command("compute_suggestions", stdout=StringIO())
+        self.assertEqual(self.get_suggestions("alice"), [("dave", 2), ("carol", 1), ("frank", 1)])
+
+        # bob が frank をフォローしても、alice のおすすめに bob を経由した frank の点は足されていない
+        FriendShip.objects.create(follower=self.users["bob"], followee=frank)
+        self.client.post(reverse("accounts:unfollow", kwargs={"username": "bob"}))
+        # 足していない点は引かれず、フォロワーの erin を経由して得た frank の点は残る
+        expected = [("dave", 1), ("frank", 1)]
+        self.assertEqual(self.get_suggestions("alice"), expected)
+        call_command("compute_suggestions", stdout=StringIO())
+        self.assertEqual(self.get_suggestions("alice"), expected)
+
+
+class TestQueryPlan(QueryPlanTestMixin, TestCase):
+    def setUp(self):
+        self.users = User.objects.bulk_create(
+            User(username=f"user{i}", email=f"user{i}@example.com") for i in range(30)
+        )
+        self.user = self.users[0]
+        FriendShip.objects.bulk_create(FriendShip(follower=self.user, followee=user) for user in self.users[1:])
+        FriendShip.objects.bulk_create(FriendShip(follower=user, followee=self.user) for user in self.users[1:])
+        Tweet.objects.bulk_create(Tweet(user=self.user, body=f"tweet{i}") for i in range(30))
+        self.client.force_login(self.users[1])
+
+    def test_user_profile(self):
+        url = reverse("accounts:user_profile", kwargs={"username": self.user.username})
+        response = self.assertIndexedQueries(url)
+        self.assertIndexedQueries(url, {"cursor": response.context["page_obj"].next_cursor})
+
+    def test_following_list(self):
+        self.assertIndexedQueries(reverse("accounts:following_list", kwargs={"username": self.user.username}))
+
+    def test_follower_list(self):
+        self.assertIndexedQueries(reverse("accounts:follower_list", kwargs={"username": self.user.username}))
+
+
+class TestQueryBudget(QueryBudgetTestMixin, TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="user", email="user@example.com", password="asdfg!@#$%12345")
+        self.viewer = User.objects.create_user(
+            username="viewer", email="viewer@example.com", password="asdfg!@#$%12345"
+        )
+        self.client.force_login(self.viewer)
+        self.kwargs = {"username": self.user.username}
+
+    def create_users(self, count):
+        start = User.objects.count()
+        return User.objects.bulk_create(
+            User(username=f"user{i}", email=f"user{i}@example.com") for i in range(start, start + count)
+        )
+
+    def add_following(self, count):
+        FriendShip.objects.bulk_create(
+            FriendShip(follower=self.user, followee=user) for user in self.create_users(count)
+        )
+
+    def add_followers(self, count):
+        FriendShip.objects.bulk_create(
+            FriendShip(follower=user, followee=self.user) for user in self.create_users(count)
+        )
+
+    def add_tweets(self, count):
+        Tweet.objects.bulk_create(Tweet(user=self.user, body="tweet of user") for _ in range(count))
+        self.add_followers(count)
+
+    def test_signup(self):
+        self.assertQueryBudget("accounts:signup", self.add_followers)
+
+    def test_user_profile(self):
+        self.assertQueryBudget("accounts:user_profile", self.add_tweets, kwargs=self.kwargs)
+
+    def test_following_list(self):
+        self.assertQueryBudget("accounts:following_list", self.add_following, kwargs=self.kwargs)
+
+    def test_follower_list(self):
+        self.assertQueryBudget("accounts:follower_list", self.add_followers, kwargs=self.kwargs)
+
+
+class TestCachedUser(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="user", email="user@example.com", password="asdfg!@#$%12345")
+        self.other = User.objects.create_user(username="other", email="other@example.com", password="asdfg!@#$%12345")
+        self.home_url = reverse("tweets:home")
+        self.client.force_login(self.user)
+
+    def test_cached_request_has_no_session_or_user_queries(self):
+        self.client.get(self.home_url)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(self.home_url)
+        self.assertEqual(response.context["user"], self.user)
+        # タイムラインとおすすめの SELECT だけで、セッションとユーザーの行は読まない
+        tables = sorted(query["sql"].split(" FROM ")[1].split()[0] for query in context.captured_queries)
+        self.assertEqual(tables, ['"accounts_followsuggestion"', '"tweets_timelineentry"'])
+
+    def test_password_change_logs_out_other_sessions(self):
+        self.client.get(self.home_url)
+        user = User.objects.get(pk=self.user.pk)
+        user.set_password("new-password!@#$1")
+        user.save()
+        response = self.client.get(self.home_url)
+        self.assertRedirects(response, f"{settings.LOGIN_URL}?next={self.home_url}")
+
+    def test_logout_invalidates(self):
+        self.client.get(self.home_url)
+        version = user_cache.get_version(user_cache.get_cache(), self.user.pk)
+        self.client.post(reverse("accounts:logout"))
+        self.assertNotEqual(user_cache.get_version(user_cache.get_cache(), self.user.pk), version)
+
+    def test_counters_are_fresh_after_follow(self):
+        profile_url = reverse("accounts:user_profile", kwargs={"username": "user"})
+        self.assertEqual(self.client.get(profile_url).context["following_count"], 0)
+        self.client.post(reverse("accounts:follow", kwargs={"username": "other"}))
+        self.assertEqual(self.client.get(profile_url).context["following_count"], 1)
@@ -0,0 +1,73 @@
+"""
+認証済みリクエストの request.user をキャッシュから読み込む。
+
+ユーザーごとにバージョン番号をキャッシュに持ち、ユーザーの行は auth_user:<pk>:<バージョン> に置く。
+パスワードの変更やカウンタの更新では invalidate() でバージョンを変えるだけなので、
+更新と同時に古い行を読み込んでいたリクエストが書き戻しても、古いバージョンのキーに入るだけで使われない。
+"""
+
+import secrets
+
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.contrib.auth import get_user as get_user_from_db
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.crypto import constant_time_compare
+
+
+def get_cache():
+    return caches[settings.AUTH_USER_CACHE]
+
+
+def version_key(user_id):
+    return f"auth_user_version:{user_id}"
+
+
+def get_version(cache, user_id):
+    version = cache.get(version_key(user_id))
+    if version is None:
+        # バージョンが追い出された後に、以前の番号のキーに残った古い行を拾わないよう乱数から始める
+        cache.add(version_key(user_id), secrets.randbits(32), timeout=None)
+        version = cache.get(version_key(user_id))
+    return version
+
+
+def _bump(user_ids):
+    # FileBasedCache の incr は読んでから書くので、他のプロセスと同時に上げると既に使われた番号に戻りうる。
+    # 新しい番号は乱数で選び、同時に変えても以前の番号 (古い行が入っているかもしれないキー) を再び使わないようにする
+    get_cache().set_many({version_key(user_id): secrets.randbits(32) for user_id in user_ids}, timeout=None)
+
+
+def invalidate(*user_ids):
+    _bump(user_ids)
+    # コミット前に読み込まれた行がキャッシュに入っても、コミット後にもう一度変えて使われないようにする
+    transaction.on_commit(lambda: _bump(user_ids))
+
+
+def get_user(request):
+    """django.contrib.auth.get_user() と同じ検証をして、ユーザーの行はキャッシュから読む。"""
+    try:
+        user_id = get_user_model()._meta.pk.to_python(request.session[SESSION_KEY])
+        backend_path = request.session[BACKEND_SESSION_KEY]
+    except KeyError:
+        return AnonymousUser()
+    if backend_path not in settings.AUTHENTICATION_BACKENDS:
+        return AnonymousUser()
+
+    cache = get_cache()
+    key = f"auth_user:{user_id}:{get_version(cache, user_id)}"
+    user = cache.get(key)
+    if user is not None:
+        session_hash = request.session.get(HASH_SESSION_KEY)
+        if session_hash and constant_time_compare(session_hash, user.get_session_auth_hash()):
+            return user
+
+    # キャッシュにない、またはセッションの検証に失敗した (古い SECRET_KEY で作られたセッションなど) ときは
+    # 通常の手順で読み込み、セッションの破棄や作り直しも任せる
+    user = get_user_from_db(request)
+    if user.is_authenticated:
+        cache.set(key, user, settings.AUTH_USER_CACHE_TIMEOUT)
+    return user
@@ -1,14 +1,31 @@
+import asyncio
+import json
+import uuid
+
 from django.conf import settings
 from django.contrib.auth import authenticate, get_user_model, login
+from django.contrib.auth import views as auth_views
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.http import Http404, HttpResponseRedirect, JsonResponse
+from django.core.handlers.asgi import ASGIRequest
+from django.db import transaction
+from django.http import Http404, HttpResponseRedirect, JsonResponse, StreamingHttpResponse
+from django.template import Context
+from django.template.loader import get_template
 from django.urls import reverse_lazy
+from django.utils.safestring import mark_safe
 from django.views.generic import CreateView, DetailView, View
 from django.views.generic.detail import SingleObjectMixin
 
-from tweets.models import Tweet
+from jobs import queue
+from mysite import conditional
+from mysite.mixins import AsyncLoginRequiredMixin, CachedObjectMixin
+from tweets import timeline
+from tweets.models import ArchivedTweet, Tweet
+from tweets.pagination import KeysetPaginator, MergedKeysetPaginator
 
+from . import suggestions, user_cache
 from .forms import SignupForm
+from .models import FriendShip
 
 User = get_user_model()
 
@@ -28,27 +45,80 @@ class SignupView(CreateView):
         return response
 
 
-class UserProfileView(LoginRequiredMixin, DetailView):
+class LogoutView(auth_views.LogoutView):
+    def post(self, request, *args, **kwargs):
+        if request.user.is_authenticated:
+            user_cache.invalidate(request.user.pk)
+        return super().post(request, *args, **kwargs)
+
+    get = post
+
+
+class UserObjectMixin(CachedObjectMixin):
+    """URL の username でユーザーを引く。ログイン中のユーザー自身なら読み込み済みの request.user を使う。"""
+
     model = User
     slug_field = "username"
     slug_url_kwarg = "username"
+
+    def get_uncached_object(self):
+        if self.request.user.is_authenticated and self.request.user.username == self.kwargs[self.slug_url_kwarg]:
+            return self.request.user
+        return super().get_uncached_object()
+
+
+class UserProfileView(AsyncLoginRequiredMixin, UserObjectMixin, DetailView):
     context_object_name = "user_profile"
     template_name = "accounts/user_profile.html"
+    replica_reads = True
+    paginate_by = 20
 
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-        user = context["user_profile"]
-        context["is_following"] = self.request.user.following.filter(pk=user.pk).exists()
-        context["following_count"] = user.following.count()
-        context["followers_count"] = user.followers.count()
-        context["tweets"] = Tweet.objects.select_related("user").filter(user=user).order_by("-created_at")
-        return context
+    async def get(self, request, *args, **kwargs):
+        self.object = user = await self.aget_object()
+        cursor = request.GET.get("cursor")
+        tweets = Tweet.objects.select_related("user").filter(user=user)
+        # ツイート一覧を読む前に、フォロー状態と最新のツイートから ETag を作る。
+        # 削除と投稿が同数あってもツイート数のカウンタは変わらないので、最新のツイートの ID も含める
+        is_following, latest_tweet_id, suggested_users = await asyncio.gather(
+            FriendShip.objects.filter(follower_id=request.user.pk, followee_id=user.pk).aexists(),
+            tweets.order_by("-created_at", "-id").values_list("pk", flat=True).afirst(),
+            suggestions.afor_user(request.user.pk),
+        )
+        etag = conditional.make_page_etag(
+            request,
+            user.pk,
+            user.profile_version,
+            user.tweets_count,
+            user.following_count,
+            user.followers_count,
+            is_following,
+            latest_tweet_id,
+            [(candidate.pk, candidate.profile_version) for candidate in suggested_users],
+            cursor,
+        )
+        response = conditional.get_not_modified(request, etag)
+        if response is not None:
+            return response
 
+        # 古いツイートはアーカイブから続けて読む。投稿者は全て user なので JOIN しない
+        archived = ArchivedTweet.objects.filter(user_id=user.pk)
+        page = await MergedKeysetPaginator([tweets, archived], self.paginate_by).apaginate(cursor)
+        for tweet in page.object_list:
+            if tweet.is_archived:
+                tweet.user = user
+        context = self.get_context_data(
+            object=user,
+            is_following=is_following,
+            following_count=user.following_count,
+            followers_count=user.followers_count,
+            page_obj=page,
+            tweets=page.object_list,
+            suggestions=suggested_users,
+        )
+        return conditional.set_validators(self.render_to_response(context), etag)
 
-class FollowView(LoginRequiredMixin, SingleObjectMixin, View):
-    model = User
-    slug_field = "username"
-    slug_url_kwarg = "username"
+
+class FollowView(LoginRequiredMixin, UserObjectMixin, SingleObjectMixin, View):
     redirect_url = reverse_lazy("tweets:home")
 
     def post(self, request, *args, **kwargs):
@@ -63,15 +133,14 @@ class FollowView(LoginRequiredMixin, SingleObjectMixin, View):
             response.status_code = 400
             return response
 
-        request.user.following.add(target_user)
-        request.user.save()
+        with transaction.atomic():
+            if request.user.follow(target_user):
+                timeline.backfill(request.user.pk, [target_user.pk])
+                queue.enqueue("accounts.update_suggestions", user_id=request.user.pk, followed_ids=[target_user.pk])
         return HttpResponseRedirect(self.redirect_url)
 
 
-class UnFollowView(LoginRequiredMixin, SingleObjectMixin, View):
-    model = User
-    slug_field = "username"
-    slug_url_kwarg = "username"
+class UnFollowView(LoginRequiredMixin, UserObjectMixin, SingleObjectMixin, View):
     redirect_url = reverse_lazy("tweets:home")
 
     def post(self, request, *args, **kwargs):
@@ -86,48 +155,188 @@ class UnFollowView(LoginRequiredMixin, SingleObjectMixin, View):
             response.status_code = 400
             return response
 
-        request.user.following.remove(target_user)
-        request.user.save()
+        with transaction.atomic():
+            if request.user.unfollow(target_user):
+                timeline.prune(request.user.pk, [target_user.pk])
+                queue.enqueue("accounts.update_suggestions", user_id=request.user.pk, unfollowed_ids=[target_user.pk])
         return HttpResponseRedirect(self.redirect_url)
 
 
-class FollowingListView(LoginRequiredMixin, DetailView):
-    template_name = "accounts/following_list.html"
-    model = User
-    slug_field = "username"
-    slug_url_kwarg = "username"
-    context_object_name = "target_user"
+class BulkFollowView(LoginRequiredMixin, View):
+    """
+    {"follow": [ユーザー名, ...], "unfollow": [ユーザー名, ...]} を受け取り、
+    ユーザーの解決を 1 回の SELECT、フォローを 1 回の INSERT、フォロー解除を 1 回の DELETE で行う。
+    """
 
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-        target_user = context[self.context_object_name]
-        friend_ships = (
-            target_user.following.through.objects.filter(
-                follower=target_user,
-            )
-            .select_related("followee")
-            .order_by("-created_at")
-        )
-        context["following_list"] = [(friend_ship.followee, friend_ship.created_at) for friend_ship in friend_ships]
-        return context
+    max_usernames = 300
+
+    def post(self, request, *args, **kwargs):
+        try:
+            data = json.loads(request.body)
+            follow = data.get("follow", [])
+            unfollow = data.get("unfollow", [])
+        except (ValueError, AttributeError):
+            return self.error("JSON のオブジェクトを送ってください")
+        if not all(isinstance(usernames, list) for usernames in (follow, unfollow)) or not all(
+            isinstance(username, str) for username in follow + unfollow
+        ):
+            return self.error("follow と unfollow にはユーザー名のリストを指定してください")
+        if len(follow) + len(unfollow) > self.max_usernames:
+            return self.error(f"一度に指定できるユーザーは {self.max_usernames} 人までです")
+        if set(follow) & set(unfollow):
+            return self.error("同じユーザーをフォローとフォロー解除の両方に指定することはできません")
 
+        user_ids = dict(User.objects.filter(username__in=follow + unfollow).values_list("username", "pk"))
+        results = {}
+        for username in follow + unfollow:
+            if username not in user_ids:
+                results[username] = "not_found"
+            elif user_ids[username] == request.user.pk:
+                results[username] = "self"
 
-class FollowerListView(LoginRequiredMixin, DetailView):
-    template_name = "accounts/follower_list.html"
-    model = User
-    slug_field = "username"
-    slug_url_kwarg = "username"
+        follow_ids = [user_ids[username] for username in follow if username not in results]
+        unfollow_ids = [user_ids[username] for username in unfollow if username not in results]
+        with transaction.atomic():
+            followed_ids = request.user.follow_many(follow_ids)
+            unfollowed_ids = request.user.unfollow_many(unfollow_ids)
+            timeline.backfill(request.user.pk, followed_ids)
+            timeline.prune(request.user.pk, unfollowed_ids)
+            if followed_ids or unfollowed_ids:
+                queue.enqueue(
+                    "accounts.update_suggestions",
+                    user_id=request.user.pk,
+                    followed_ids=list(followed_ids),
+                    unfollowed_ids=list(unfollowed_ids),
+                )
+
+        for username in follow:
+            if username not in results:
+                results[username] = "followed" if user_ids[username] in followed_ids else "already_following"
+        for username in unfollow:
+            if username not in results:
+                results[username] = "unfollowed" if user_ids[username] in unfollowed_ids else "not_following"
+
+        counts = User.objects.filter(pk=request.user.pk).values("following_count", "followers_count").get()
+        return JsonResponse({"results": results, **counts})
+
+    def error(self, message):
+        response = JsonResponse({"message": message})
+        response.status_code = 400
+        return response
+
+
+class FriendShipListView(LoginRequiredMixin, UserObjectMixin, DetailView):
+    """
+    フォロー中・フォロワーの一覧。件数が settings.FRIENDSHIP_LIST_STREAM_THRESHOLD を超えるユーザーは
+    FriendShip を chunk_size 件ずつ読みながら行を描画して送り、一覧全体をメモリに載せない。
+    ?format=json なら created_at の降順でキーセットページングした JSON を返す。
+    """
+
+    replica_reads = True
     context_object_name = "target_user"
+    row_template_name = "accounts/friendship_row.html"
+    chunk_size = 500
+    paginate_by = 100
+    # 一覧の持ち主を指すフィールド, 一覧に並ぶユーザーを指すフィールド, 件数のカウンタ, コンテキスト変数名
+    list_owner_field = list_user_field = count_field = list_name = None
 
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-        target_user = context[self.context_object_name]
-        friend_ships = (
-            target_user.followers.through.objects.filter(
-                followee=target_user,
-            )
-            .select_related("follower")
+    def get(self, request, *args, **kwargs):
+        self.object = target_user = self.get_object()
+        if request.GET.get("format") == "json":
+            return self.render_json(target_user)
+        if getattr(target_user, self.count_field) > settings.FRIENDSHIP_LIST_STREAM_THRESHOLD:
+            return self.render_stream(target_user)
+        return self.render_to_response(self.get_context_data(object=target_user))
+
+    def get_friend_ships(self, target_user):
+        return (
+            FriendShip.objects.filter(**{self.list_owner_field: target_user})
+            .select_related(self.list_user_field)
             .order_by("-created_at")
         )
-        context["follower_list"] = [(friend_ship.follower, friend_ship.created_at) for friend_ship in friend_ships]
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        if self.list_name not in context:
+            friend_ships = self.get_friend_ships(context[self.context_object_name])
+            context[self.list_name] = [
+                (getattr(friend_ship, self.list_user_field), friend_ship.created_at) for friend_ship in friend_ships
+            ]
         return context
+
+    def render_json(self, target_user):
+        paginator = KeysetPaginator(self.get_friend_ships(target_user), self.paginate_by)
+        try:
+            page = paginator.paginate(self.request.GET.get("cursor"))
+        except Http404 as e:
+            response = JsonResponse({"message": str(e)})
+            response.status_code = 400
+            return response
+        results = [
+            {"username": getattr(friend_ship, self.list_user_field).username, "followed_at": friend_ship.created_at}
+            for friend_ship in page
+        ]
+        return JsonResponse({"results": results, "next_cursor": page.next_cursor, "prev_cursor": page.prev_cursor})
+
+    def render_stream(self, target_user):
+        # 行の位置に目印を入れてページ全体を描画し、その前後の間に行を流し込む
+        marker = mark_safe(f"<!-- {uuid.uuid4().hex} -->")
+        context = self.get_context_data(object=target_user, **{self.list_name: [], "streamed_rows": marker})
+        head, tail = self.response_class(self.request, self.get_template_names(), context).rendered_content.split(
+            marker
+        )
+        # ストリームはビューを抜けた後に読まれるので、レプリカへの振り分けをここで確定させておく
+        friend_ships = self.get_friend_ships(target_user)
+        friend_ships = friend_ships.using(friend_ships.db)
+        # ASGI では同期イテレータが最後まで読まれてから送られるので、非同期イテレータを渡す
+        stream = self.astream if isinstance(self.request, ASGIRequest) else self.stream
+        return StreamingHttpResponse(stream(head, friend_ships, tail))
+
+    def stream(self, head, friend_ships, tail):
+        yield head
+        render_row = self.row_renderer()
+        rows = []
+        for friend_ship in friend_ships.iterator(chunk_size=self.chunk_size):
+            rows.append(render_row(friend_ship))
+            if len(rows) >= self.chunk_size:
+                yield "".join(rows)
+                rows = []
+        yield "".join(rows) + tail
+
+    async def astream(self, head, friend_ships, tail):
+        yield head
+        render_row = self.row_renderer()
+        rows = []
+        async for friend_ship in friend_ships.aiterator(chunk_size=self.chunk_size):
+            rows.append(render_row(friend_ship))
+            if len(rows) >= self.chunk_size:
+                yield "".join(rows)
+                rows = []
+        yield "".join(rows) + tail
+
+    def row_renderer(self):
+        template = get_template(self.row_template_name).template
+        context = Context(autoescape=True)
+
+        def render_row(friend_ship):
+            user_profile = getattr(friend_ship, self.list_user_field)
+            with context.push(user_profile=user_profile, followed_at=friend_ship.created_at):
+                return template.render(context)
+
+        return render_row
+
+
+class FollowingListView(FriendShipListView):
+    template_name = "accounts/following_list.html"
+    list_owner_field = "follower"
+    list_user_field = "followee"
+    count_field = "following_count"
+    list_name = "following_list"
+
+
+class FollowerListView(FriendShipListView):
+    template_name = "accounts/follower_list.html"
+    list_owner_field = "followee"
+    list_user_field = "follower"
+    count_field = "followers_count"
+    list_name = "follower_list"
@@ -0,0 +1,240 @@
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.http import http_date
+
+from accounts.models import FriendShip
+from mysite.testing import QueryBudgetTestMixin, QueryPlanTestMixin
+from tweets import timeline
+from tweets.models import TimelineEntry, Tweet
+
+User = get_user_model()
+
+
+class TestHomeTimelineView(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="user", email="user@example.com", password="asdfg!@#$%12345")
+        self.author = User.objects.create_user(
+            username="author", email="author@example.com", password="asdfg!@#$%12345"
+        )
+        self.user.follow(self.author)
+        now = timezone.now()
+        self.tweets = [
+            Tweet.objects.create(user=self.author, body=f"tweet{i}", created_at=now - timezone.timedelta(minutes=i))
+            for i in range(3)
+        ]
+        for tweet in self.tweets:
+            timeline.fan_out(tweet)
+        self.client.force_login(self.user)
+        self.url = reverse("api:v1:home")
+
+    def test_success_get(self):
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual([row["id"] for row in data["results"]], [tweet.pk for tweet in self.tweets])
+        self.assertEqual(data["results"][0]["username"], "author")
+        self.assertEqual(data["results"][0]["body"], "tweet0")
+        self.assertIsNone(data["next_cursor"])
+        self.assertTrue(response.headers["ETag"].startswith('"'))
+        self.assertNotIn("Last-Modified", response.headers)
+
+    def test_success_get_paginated(self):
+        older = timezone.now() - timezone.timedelta(days=1)
+        for i in range(20):
+            timeline.fan_out(Tweet.objects.create(user=self.author, body=f"older{i}", created_at=older))
+
+        data = self.client.get(self.url).json()
+        self.assertEqual(len(data["results"]), 20)
+        data = self.client.get(self.url, {"cursor": data["next_cursor"]}).json()
+        self.assertEqual(len(data["results"]), 3)
+        self.assertIsNone(data["next_cursor"])
+        self.assertIsNotNone(data["prev_cursor"])
+
+    def test_not_modified(self):
+        response = self.client.get(self.url)
+        etag = response.headers["ETag"]
+
+        response = self.client.get(self.url, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b"")
+        self.assertEqual(response.headers["ETag"], etag)
+
+    def test_modified_since_is_ignored(self):
+        # 最新の行の日時は削除や同じ秒に増えた行では変わらないので、If-Modified-Since では 304 を返さない
+        since = http_date(timezone.now().timestamp() + 60)
+        response = self.client.get(self.url, headers={"If-Modified-Since": since})
+        self.assertEqual(response.status_code, 200)
+
+    def test_modified_after_new_tweet(self):
+        etag = self.client.get(self.url).headers["ETag"]
+        timeline.fan_out(Tweet.objects.create(user=self.author, body="new tweet"))
+
+        response = self.client.get(self.url, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["results"][0]["body"], "new tweet")
+
+    def test_modified_after_username_change(self):
+        etag = self.client.get(self.url).headers["ETag"]
+        author = User.objects.get(pk=self.author.pk)
+        author.username = "renamed"
+        author.save()
+
+        response = self.client.get(self.url, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["results"][0]["username"], "renamed")
+
+    def test_failure_get_without_login(self):
+        self.client.logout()
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.json(), {"message": "ログインしてください"})
+
+    def test_failure_get_with_invalid_cursor(self):
+        response = self.client.get(self.url, {"cursor": "invalid"})
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json(), {"message": "不正なカーソルです"})
+
+
+class TestTweetDetailView(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="user", email="user@example.com", password="asdfg!@#$%12345")
+        self.tweet = Tweet.objects.create(user=self.user, body="tweet of user")
+        self.client.force_login(self.user)
+
+    def test_success_get(self):
+        response = self.client.get(reverse("api:v1:tweet_detail", kwargs={"pk": self.tweet.pk}))
+
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual((data["id"], data["username"], data["body"]), (self.tweet.pk, "user", "tweet of user"))
+
+        response = self.client.get(
+            reverse("api:v1:tweet_detail", kwargs={"pk": self.tweet.pk}),
+            headers={"If-None-Match": response.headers["ETag"]},
+        )
+        self.assertEqual(response.status_code, 304)
+
+    def test_failure_get_with_not_exist_tweet(self):
+        response = self.client.get(reverse("api:v1:tweet_detail", kwargs={"pk": self.tweet.pk + 1}))
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json(), {"message": "指定されたツイートは存在しません"})
+
+
+class TestUserListViews(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="user", email="user@example.com", password="asdfg!@#$%12345")
+        self.others = User.objects.bulk_create(
+            User(username=f"user{i}", email=f"user{i}@example.com") for i in range(3)
+        )
+        now = timezone.now()
+        for i, other in enumerate(self.others):
+            created_at = now - timezone.timedelta(minutes=i)
+            FriendShip.objects.create(follower=self.user, followee=other, created_at=created_at)
+            FriendShip.objects.create(follower=other, followee=self.user, created_at=created_at)
+        Tweet.objects.create(user=self.user, body="tweet of user")
+        self.client.force_login(self.others[0])
+        self.kwargs = {"username": self.user.username}
+
+    def test_user_tweets(self):
+        data = self.client.get(reverse("api:v1:user_tweets", kwargs=self.kwargs)).json()
+        self.assertEqual([(row["username"], row["body"]) for row in data["results"]], [("user", "tweet of user")])
+
+    def test_following_list(self):
+        data = self.client.get(reverse("api:v1:following_list", kwargs=self.kwargs)).json()
+        self.assertEqual([row["username"] for row in data["results"]], ["user0", "user1", "user2"])
+
+    def test_follower_list(self):
+        response = self.client.get(reverse("api:v1:follower_list", kwargs=self.kwargs))
+        self.assertEqual([row["username"] for row in response.json()["results"]], ["user0", "user1", "user2"])
+
+        FriendShip.objects.filter(follower=self.others[1]).delete()
+        response = self.client.get(
+            reverse("api:v1:follower_list", kwargs=self.kwargs), headers={"If-None-Match": response.headers["ETag"]}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row["username"] for row in response.json()["results"]], ["user0", "user2"])
+
+    def test_failure_get_with_not_exist_user(self):
+        response = self.client.get(reverse("api:v1:following_list", kwargs={"username": "nobody"}))
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json(), {"message": "指定されたユーザーは存在しません"})
+
+
+class TestQueryPlan(QueryPlanTestMixin, TestCase):
+    def setUp(self):
+        self.users = User.objects.bulk_create(
+            User(username=f"user{i}", email=f"user{i}@example.com") for i in range(30)
+        )
+        self.user = self.users[0]
+        FriendShip.objects.bulk_create(FriendShip(follower=self.user, followee=user) for user in self.users[1:])
+        FriendShip.objects.bulk_create(FriendShip(follower=user, followee=self.user) for user in self.users[1:])
+        tweets = Tweet.objects.bulk_create(Tweet(user=user, body="tweet") for user in self.users)
+        TimelineEntry.objects.bulk_create(
+            TimelineEntry(owner=self.user, tweet=tweet, created_at=tweet.created_at) for tweet in tweets
+        )
+        self.client.force_login(self.user)
+        self.kwargs = {"username": self.users[1].username}
+
+    def test_home(self):
+        response = self.assertIndexedQueries(reverse("api:v1:home"))
+        self.assertIndexedQueries(reverse("api:v1:home"), {"cursor": response.json()["next_cursor"]})
+
+    def test_user_tweets(self):
+        self.assertIndexedQueries(reverse("api:v1:user_tweets", kwargs=self.kwargs))
+
+    def test_following_list(self):
+        self.assertIndexedQueries(reverse("api:v1:following_list", kwargs={"username": self.user.username}))
+
+    def test_follower_list(self):
+        self.assertIndexedQueries(reverse("api:v1:follower_list", kwargs={"username": self.user.username}))
+
+
+class TestQueryBudget(QueryBudgetTestMixin, TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="user", email="user@example.com", password="asdfg!@#$%12345")
+        self.viewer = User.objects.create_user(
+            username="viewer", email="viewer@example.com", password="asdfg!@#$%12345"
+        )
+        self.client.force_login(self.viewer)
+        self.kwargs = {"username": self.user.username}
+
+    def create_users(self, count):
+        start = User.objects.count()
+        return User.objects.bulk_create(
+            User(username=f"user{i}", email=f"user{i}@example.com") for i in range(start, start + count)
+        )
+
+    def add_tweets(self, count):
+        tweets = Tweet.objects.bulk_create(Tweet(user=self.user, body="tweet of user") for _ in range(count))
+        TimelineEntry.objects.bulk_create(
+            TimelineEntry(owner=self.viewer, tweet=tweet, created_at=tweet.created_at) for tweet in tweets
+        )
+
+    def add_following(self, count):
+        FriendShip.objects.bulk_create(
+            FriendShip(follower=self.user, followee=user) for user in self.create_users(count)
+        )
+
+    def add_followers(self, count):
+        FriendShip.objects.bulk_create(
+            FriendShip(follower=user, followee=self.user) for user in self.create_users(count)
+        )
+
+    def test_home(self):
+        self.assertQueryBudget("api:v1:home", self.add_tweets)
+
+    def test_tweet_detail(self):
+        tweet = Tweet.objects.create(user=self.user, body="tweet of user")
+        self.assertQueryBudget("api:v1:tweet_detail", self.add_tweets, kwargs={"pk": tweet.pk})
+
+    def test_user_tweets(self):
+        self.assertQueryBudget("api:v1:user_tweets", self.add_tweets, kwargs=self.kwargs)
+
+    def test_following_list(self):
+        self.assertQueryBudget("api:v1:following_list", self.add_following, kwargs=self.kwargs)
+
+    def test_follower_list(self):
+        self.assertQueryBudget("api:v1:follower_list", self.add_followers, kwargs=self.kwargs)
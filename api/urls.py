@@ -0,0 +1,20 @@
+from django.urls import include, path
+
+from . import views
+
+app_name = "api"
+
+v1 = (
+    [
+        path("home/", views.HomeTimelineView.as_view(), name="home"),
+        path("tweets/<int:pk>/", views.TweetDetailView.as_view(), name="tweet_detail"),
+        path("users/<str:username>/tweets/", views.UserTweetsView.as_view(), name="user_tweets"),
+        path("users/<str:username>/following/", views.FollowingListView.as_view(), name="following_list"),
+        path("users/<str:username>/followers/", views.FollowerListView.as_view(), name="follower_list"),
+    ],
+    "v1",
+)
+
+urlpatterns = [
+    path("v1/", include(v1)),
+]
@@ -0,0 +1,168 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.mixins import LoginRequiredMixin
+from django.db.models import F
+from django.http import Http404, JsonResponse
+from django.views.generic import View
+
+from accounts.models import FriendShip
+from mysite import conditional
+from tweets.models import ArchivedTweet, TimelineEntry, Tweet
+from tweets.pagination import KeysetPage, KeysetPaginator, MergedKeysetPaginator
+
+User = get_user_model()
+
+
+class ApiView(LoginRequiredMixin, View):
+    """
+    JSON API の基底クラス。サブクラスは表示する行の KeysetPage を返す get_page() を定義する。
+    行は .values() で dict のまま取り出し、モデルのインスタンスを作らない。
+    表示する行の ID と投稿者の profile_version から強い ETag を作り、一致すれば JSON を組み立てずに 304 を返す。
+    """
+
+    replica_reads = True
+    paginate_by = 20
+    keys = ("created_at", "id")
+    id_field = "id"
+
+    def handle_no_permission(self):
+        return self.error("ログインしてください", 401)
+
+    def get(self, request, *args, **kwargs):
+        try:
+            page = self.get_page()
+        except Http404 as e:
+            return self.error(str(e), 404)
+
+        etag = self.get_etag(page)
+        response = conditional.get_not_modified(request, etag)
+        if response is None:
+            response = conditional.set_validators(JsonResponse(self.serialize(page)), etag)
+        return response
+
+    def paginate(self, rows):
+        return KeysetPaginator(rows, self.paginate_by, keys=self.keys).paginate(self.request.GET.get("cursor"))
+
+    def get_user(self):
+        """URL の username のユーザーを dict で返す。ログイン中のユーザー自身なら SELECT しない。"""
+        username = self.kwargs["username"]
+        if username == self.request.user.username:
+            user = self.request.user
+            return {"pk": user.pk, "username": user.username, "profile_version": user.profile_version}
+        user = User.objects.filter(username=username).values("pk", "username", "profile_version").first()
+        if user is None:
+            raise Http404("指定されたユーザーは存在しません")
+        return user
+
+    def get_etag(self, page):
+        # ツイートの本文は変更できないので、行の ID と投稿者のユーザー名の版が同じなら同じ JSON になる
+        return conditional.make_etag(
+            self.request.user.pk,
+            page.next_cursor,
+            page.prev_cursor,
+            [(row[self.id_field], row["profile_version"]) for row in page],
+        )
+
+    def serialize(self, page):
+        results = [self.serialize_row(row) for row in page]
+        return {"results": results, "next_cursor": page.next_cursor, "prev_cursor": page.prev_cursor}
+
+    def serialize_row(self, row):
+        return {
+            "id": row[self.id_field],
+            "username": row["username"],
+            "body": row["body"],
+            "created_at": row["created_at"],
+        }
+
+    def error(self, message, status):
+        response = JsonResponse({"message": message})
+        response.status_code = status
+        return response
+
+
+class HomeTimelineView(ApiView):
+    keys = ("created_at", "tweet_id")
+    id_field = "tweet_id"
+
+    def get_page(self):
+        rows = TimelineEntry.objects.filter(owner_id=self.request.user.pk).values(
+            "tweet_id",
+            "created_at",
+            body=F("tweet__body"),
+            username=F("tweet__user__username"),
+            profile_version=F("tweet__user__profile_version"),
+        )
+        return self.paginate(rows)
+
+
+class TweetDetailView(ApiView):
+    def get_page(self):
+        row = (
+            Tweet.objects.filter(pk=self.kwargs["pk"])
+            .values(
+                "id",
+                "created_at",
+                "body",
+                username=F("user__username"),
+                profile_version=F("user__profile_version"),
+            )
+            .first()
+        ) or self.get_archived_row()
+        if row is None:
+            raise Http404("指定されたツイートは存在しません")
+        return KeysetPage([row])
+
+    def get_archived_row(self):
+        # 古いツイートはアーカイブに移されている。別のデータベースにありうるので、投稿者は JOIN せずに読む
+        row = ArchivedTweet.objects.filter(pk=self.kwargs["pk"]).values("id", "created_at", "body", "user_id").first()
+        if row is None:
+            return None
+        user = User.objects.filter(pk=row.pop("user_id")).values("username", "profile_version").first()
+        return user and {**row, **user}
+
+    def serialize(self, page):
+        return self.serialize_row(page.object_list[0])
+
+
+class UserTweetsView(ApiView):
+    def get_page(self):
+        user = self.get_user()
+        # 古いツイートはアーカイブから続けて読む。投稿者は全て user なので JOIN しない
+        fields = ("id", "created_at", "body")
+        querysets = [
+            Tweet.objects.filter(user_id=user["pk"]).values(*fields),
+            ArchivedTweet.objects.filter(user_id=user["pk"]).values(*fields),
+        ]
+        paginator = MergedKeysetPaginator(querysets, self.paginate_by, keys=self.keys)
+        page = paginator.paginate(self.request.GET.get("cursor"))
+        for row in page:
+            row.update(username=user["username"], profile_version=user["profile_version"])
+        return page
+
+
+class FriendShipListView(ApiView):
+    # 一覧の持ち主を指すフィールド, 一覧に並ぶユーザーを指すフィールド
+    list_owner_field = list_user_field = None
+
+    def get_page(self):
+        user = self.get_user()
+        rows = FriendShip.objects.filter(**{f"{self.list_owner_field}_id": user["pk"]}).values(
+            "id",
+            "created_at",
+            username=F(f"{self.list_user_field}__username"),
+            profile_version=F(f"{self.list_user_field}__profile_version"),
+        )
+        return self.paginate(rows)
+
+    def serialize_row(self, row):
+        return {"username": row["username"], "followed_at": row["created_at"]}
+
+
+class FollowingListView(FriendShipListView):
+    list_owner_field = "follower"
+    list_user_field = "followee"
+
+
+class FollowerListView(FriendShipListView):
+    list_owner_field = "followee"
+    list_user_field = "follower"
@@ -0,0 +1,79 @@
+import signal
+import subprocess
+import sys
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import OperationalError
+
+from jobs import queue
+from mysite.sqlite3.base import is_locked
+
+
+class Command(BaseCommand):
+    help = "バックグラウンドジョブを実行するワーカーを起動する。SIGINT / SIGTERM で実行中のジョブを終えてから止まる"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--processes", type=int, default=1, help="ワーカーのプロセス数")
+        parser.add_argument("--batch-size", type=int, default=10, help="1 回に取るジョブの件数")
+        parser.add_argument("--poll-interval", type=float, default=1.0, help="ジョブが無いときに待つ秒数")
+        parser.add_argument("--burst", action="store_true", help="実行できるジョブが無くなったら終了する")
+        parser.add_argument("--retry-dead", action="store_true", help="失敗したジョブを待機中に戻して終了する")
+
+    def handle(self, *args, **options):
+        if options["retry_dead"]:
+            count = queue.retry_dead()
+            self.stdout.write(self.style.SUCCESS(f"{count} 件のジョブを待機中に戻しました"))
+            return
+
+        self.stopping = threading.Event()
+        handlers = {signum: signal.signal(signum, self.stop) for signum in (signal.SIGINT, signal.SIGTERM)}
+        try:
+            if options["processes"] > 1:
+                self.run_processes(options)
+            else:
+                # 1 プロセスなら子プロセスを作らず、このプロセスで実行する
+                self.work(options)
+        finally:
+            for signum, handler in handlers.items():
+                signal.signal(signum, handler)
+
+    def stop(self, signum, frame):
+        self.stopping.set()
+        for process in getattr(self, "processes", ()):
+            process.send_signal(signal.SIGTERM)
+
+    def run_processes(self, options):
+        command = [
+            sys.executable,
+            str(settings.BASE_DIR / "manage.py"),
+            "run_workers",
+            f"--batch-size={options['batch_size']}",
+            f"--poll-interval={options['poll_interval']}",
+            *(["--burst"] if options["burst"] else []),
+        ]
+        self.processes = [subprocess.Popen(command) for _ in range(options["processes"])]
+        for process in self.processes:
+            process.wait()
+
+    def work(self, options):
+        worker = queue.worker_name()
+        succeeded = failed = 0
+        while not self.stopping.is_set():
+            try:
+                done, errors = queue.run_pending(worker, options["batch_size"])
+            except OperationalError as e:
+                # 書き込みが混んでいてロックを取れなかった。少し待って取り直す
+                if not is_locked(e):
+                    raise
+                self.stopping.wait(options["poll_interval"])
+                continue
+            succeeded += done
+            failed += errors
+            if done or errors:
+                continue
+            if options["burst"]:
+                break
+            self.stopping.wait(options["poll_interval"])
+        self.stdout.write(self.style.SUCCESS(f"{worker}: {succeeded} 件のジョブが成功し、{failed} 件が失敗しました"))
@@ -0,0 +1,32 @@
+from django.db import models
+from django.utils import timezone
+
+
+class Job(models.Model):
+    """
+    jobs.queue で実行するバックグラウンドジョブ。成功したら行を消し、max_attempts 回失敗したら DEAD にして残す。
+    locked_until を過ぎた RUNNING の行は、ワーカーが途中で落ちたものとして別のワーカーが取り直す。
+    """
+
+    class Status(models.TextChoices):
+        PENDING = "pending", "待機中"
+        RUNNING = "running", "実行中"
+        DEAD = "dead", "失敗"
+
+    name = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField()
+    # この日時を過ぎたら実行してよい。失敗したら再試行の日時に進める
+    run_at = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_until = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [models.Index(fields=["status", "run_at"], name="job_status_run_at_idx")]
+
+    def __str__(self):
+        return f"{self.name} ({self.get_status_display()})"
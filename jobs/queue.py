@@ -0,0 +1,137 @@
+import json
+import logging
+import os
+import socket
+import traceback
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from jobs.models import Job
+
+logger = logging.getLogger(__name__)
+
+_handlers = {}
+
+
+def register(name):
+    """関数を name のジョブのハンドラとして登録するデコレータ。ハンドラは JSON にできる値をキーワード引数で受け取る。"""
+
+    def decorator(func):
+        if _handlers.setdefault(name, func) is not func:
+            raise ValueError(f"ジョブ {name} は既に登録されています")
+        return func
+
+    return decorator
+
+
+def enqueue(name, *, delay=0, max_attempts=None, **payload):
+    """
+    name のジョブを登録する。行は呼び出し元のトランザクションと一緒にコミットされるので、
+    ワーカーがコミット前のデータを読むことはなく、ロールバックされればジョブも消える。
+    settings.JOBS_ALWAYS_EAGER が真なら、ワーカーを使わずにその場で実行する。
+    ワーカーで実行するときと同じく、失敗してもハンドラの書き込みだけを取り消して記録し、呼び出し元には伝えない。
+    """
+    if name not in _handlers:
+        raise LookupError(f"ジョブ {name} は登録されていません")
+    # ワーカーで実行するときと同じく、JSON を経由した値をハンドラに渡す
+    payload = json.loads(json.dumps(payload))
+    if settings.JOBS_ALWAYS_EAGER:
+        try:
+            with transaction.atomic():
+                _handlers[name](**payload)
+        except Exception:
+            logger.exception("ジョブ %s の実行に失敗しました", name)
+        return None
+    return Job.objects.create(
+        name=name,
+        payload=payload,
+        run_at=timezone.now() + timedelta(seconds=delay),
+        max_attempts=max_attempts or settings.JOBS_MAX_ATTEMPTS,
+    )
+
+
+def worker_name():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def claim(worker, limit):
+    """
+    実行できるジョブを最大 limit 件取り、RUNNING にして返す。
+    SELECT ... FOR UPDATE SKIP LOCKED が使える DB では取った行をロックしてから更新し、
+    SQLite では 1 回の UPDATE の中で選んで書き換える (書き込みは直列なので、同じ行を 2 つのワーカーが取ることはない)。
+    """
+    now = timezone.now()
+    token = f"{worker}:{uuid.uuid4().hex}"
+    ready = Q(status=Job.Status.PENDING, run_at__lte=now) | Q(status=Job.Status.RUNNING, locked_until__lt=now)
+    candidates = Job.objects.filter(ready).order_by("run_at", "id").values("pk")[:limit]
+    with transaction.atomic():
+        if connection.features.has_select_for_update_skip_locked:
+            candidates = list(candidates.select_for_update(skip_locked=True).values_list("pk", flat=True))
+        claimed = Job.objects.filter(pk__in=candidates).update(
+            status=Job.Status.RUNNING,
+            locked_by=token,
+            locked_until=now + timedelta(seconds=settings.JOBS_LEASE_SECONDS),
+            attempts=F("attempts") + 1,
+        )
+    if not claimed:
+        return []
+    return list(Job.objects.filter(status=Job.Status.RUNNING, locked_by=token).order_by("run_at", "id"))
+
+
+def backoff(attempts):
+    """attempts 回目の失敗の後、再試行するまでの秒数。"""
+    return min(settings.JOBS_BACKOFF_SECONDS * 2 ** (attempts - 1), settings.JOBS_BACKOFF_MAX_SECONDS)
+
+
+def run(job):
+    """
+    取ったジョブを実行する。ハンドラの書き込みと行の削除は同じトランザクションで行う。
+    リースが切れて別のワーカーが取り直すと同じジョブが 2 回実行されうるので、ハンドラは何度実行しても同じ結果になるように書く。
+    """
+    try:
+        if job.attempts > job.max_attempts:
+            # 実行中にワーカーごと落ち続けている
+            raise RuntimeError(f"{job.max_attempts} 回の試行で完了しませんでした")
+        handler = _handlers.get(job.name)
+        if handler is None:
+            raise LookupError(f"ジョブ {job.name} は登録されていません")
+        with transaction.atomic():
+            handler(**job.payload)
+            Job.objects.filter(pk=job.pk, locked_by=job.locked_by).delete()
+    except Exception:
+        fail(job, traceback.format_exc())
+        return False
+    return True
+
+
+def fail(job, error):
+    """再試行の回数が残っていれば間隔を倍にしながら PENDING に戻し、残っていなければ DEAD にする。"""
+    changes = {"locked_by": "", "locked_until": None, "last_error": error}
+    if job.attempts >= job.max_attempts:
+        changes["status"] = Job.Status.DEAD
+    else:
+        changes.update(status=Job.Status.PENDING, run_at=timezone.now() + timedelta(seconds=backoff(job.attempts)))
+    Job.objects.filter(pk=job.pk, locked_by=job.locked_by).update(**changes)
+
+
+def run_pending(worker=None, limit=10):
+    """実行できるジョブを最大 limit 件取って実行し、(成功した数, 失敗した数) を返す。"""
+    succeeded = failed = 0
+    for job in claim(worker or worker_name(), limit):
+        if run(job):
+            succeeded += 1
+        else:
+            failed += 1
+    return succeeded, failed
+
+
+def retry_dead(**filters):
+    """DEAD のジョブを試行回数を戻して PENDING に戻し、その件数を返す。"""
+    return Job.objects.filter(status=Job.Status.DEAD, **filters).update(
+        status=Job.Status.PENDING, attempts=0, run_at=timezone.now(), last_error=""
+    )
@@ -0,0 +1,177 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import transaction
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from jobs import queue
+from jobs.models import Job
+from tweets.models import TimelineEntry, Tweet
+
+User = get_user_model()
+
+calls = []
+
+
+@queue.register("tests.record")
+def record(value):
+    calls.append(value)
+
+
+@queue.register("tests.fail")
+def fail(value):
+    raise ValueError(f"failed with {value}")
+
+
+@queue.register("tests.create_then_fail")
+def create_then_fail(user_id):
+    Tweet.objects.create(user_id=user_id, body="rolled back")
+    raise ValueError
+
+
+@override_settings(JOBS_ALWAYS_EAGER=False, JOBS_BACKOFF_SECONDS=2, JOBS_BACKOFF_MAX_SECONDS=5)
+class TestQueue(TestCase):
+    def setUp(self):
+        calls.clear()
+
+    def test_enqueue_and_run(self):
+        job = queue.enqueue("tests.record", value=(1, 2))
+        self.assertEqual(calls, [])
+        self.assertEqual(job.status, Job.Status.PENDING)
+
+        self.assertEqual(queue.run_pending("worker"), (1, 0))
+        self.assertEqual(calls, [[1, 2]])
+        self.assertFalse(Job.objects.exists())
+
+    def test_enqueue_is_rolled_back_with_transaction(self):
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            queue.enqueue("tests.record", value=1)
+            raise RuntimeError
+        self.assertFalse(Job.objects.exists())
+
+    def test_enqueue_delayed(self):
+        queue.enqueue("tests.record", value=1, delay=60)
+        self.assertEqual(queue.run_pending("worker"), (0, 0))
+        self.assertEqual(calls, [])
+
+    def test_enqueue_unknown_job(self):
+        with self.assertRaises(LookupError):
+            queue.enqueue("tests.unknown")
+
+    @override_settings(JOBS_ALWAYS_EAGER=True)
+    def test_eager(self):
+        self.assertIsNone(queue.enqueue("tests.record", value=1))
+        self.assertEqual(calls, [1])
+        self.assertFalse(Job.objects.exists())
+
+    @override_settings(JOBS_ALWAYS_EAGER=True)
+    def test_eager_failure_is_logged_and_rolled_back(self):
+        user = User.objects.create_user(username="user", email="user@example.com", password="asdfg!@#$%12345")
+        # ワーカーと同じく、失敗は呼び出し元に伝えずハンドラの書き込みだけを取り消す
+        with self.assertLogs("jobs.queue", "ERROR") as logs:
+            self.assertIsNone(queue.enqueue("tests.create_then_fail", user_id=user.pk))
+        self.assertIn("ジョブ tests.create_then_fail の実行に失敗しました", logs.output[0])
+        self.assertFalse(Tweet.objects.exists())
+        self.assertTrue(User.objects.filter(pk=user.pk).exists())
+
+    def test_claim_is_exclusive(self):
+        for i in range(3):
+            queue.enqueue("tests.record", value=i)
+
+        first = queue.claim("worker1", 2)
+        second = queue.claim("worker2", 2)
+        self.assertEqual([job.payload["value"] for job in first], [0, 1])
+        self.assertEqual([job.payload["value"] for job in second], [2])
+        self.assertEqual(queue.claim("worker3", 2), [])
+        self.assertTrue(all(job.status == Job.Status.RUNNING and job.attempts == 1 for job in first + second))
+
+    def test_expired_lease_is_claimed_again(self):
+        queue.enqueue("tests.record", value=1)
+        [job] = queue.claim("worker1", 1)
+        Job.objects.filter(pk=job.pk).update(locked_until=timezone.now() - timedelta(seconds=1))
+
+        [reclaimed] = queue.claim("worker2", 1)
+        self.assertEqual(reclaimed.pk, job.pk)
+        self.assertEqual(reclaimed.attempts, 2)
+        # 先に取ったワーカーの結果は反映されない
+        queue.fail(job, "late")
+        self.assertEqual(Job.objects.get(pk=job.pk).status, Job.Status.RUNNING)
+
+    def test_retry_with_backoff_and_dead_letter(self):
+        job = queue.enqueue("tests.fail", value=1, max_attempts=3)
+
+        for attempts, delay in ((1, 2), (2, 4)):
+            before = timezone.now()
+            self.assertEqual(queue.run_pending("worker"), (0, 1))
+            job.refresh_from_db()
+            self.assertEqual((job.status, job.attempts), (Job.Status.PENDING, attempts))
+            self.assertIn("ValueError: failed with 1", job.last_error)
+            self.assertGreaterEqual(job.run_at, before + timedelta(seconds=delay))
+            self.assertEqual(queue.run_pending("worker"), (0, 0))
+            Job.objects.filter(pk=job.pk).update(run_at=timezone.now())
+
+        self.assertEqual(queue.run_pending("worker"), (0, 1))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.Status.DEAD, 3))
+        self.assertEqual(queue.run_pending("worker"), (0, 0))
+
+        self.assertEqual(queue.retry_dead(), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.Status.PENDING, 0))
+
+    def test_backoff_is_capped(self):
+        self.assertEqual([queue.backoff(attempts) for attempts in range(1, 5)], [2, 4, 5, 5])
+
+    def test_failed_handler_is_rolled_back(self):
+        user = User.objects.create_user(username="user", email="user@example.com", password="asdfg!@#$%12345")
+        queue.enqueue("tests.create_then_fail", user_id=user.pk)
+        self.assertEqual(queue.run_pending("worker"), (0, 1))
+        self.assertFalse(Tweet.objects.exists())
+
+
+@override_settings(JOBS_ALWAYS_EAGER=False)
+class TestRunWorkers(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="user", email="user@example.com", password="asdfg!@#$%12345")
+        self.follower = User.objects.create_user(
+            username="follower", email="follower@example.com", password="asdfg!@#$%12345"
+        )
+        self.follower.follow(self.user)
+        self.client.force_login(self.user)
+
+    def test_fan_out_in_worker(self):
+        response = self.client.post(reverse("tweets:create"), {"body": "tweet of user"}, follow=True)
+        tweet = Tweet.objects.get()
+        # 自分のタイムラインにはワーカーを待たずに載る
+        self.assertContains(response, "tweet of user")
+        self.assertEqual(list(TimelineEntry.objects.values_list("owner_id", "tweet_id")), [(self.user.pk, tweet.pk)])
+        self.assertEqual(Job.objects.get().name, "tweets.fan_out")
+
+        stdout = StringIO()
+        call_command("run_workers", burst=True, stdout=stdout)
+        self.assertIn("1 件のジョブが成功し、0 件が失敗しました", stdout.getvalue())
+        self.assertEqual(
+            set(TimelineEntry.objects.values_list("owner_id", "tweet_id")),
+            {(self.user.pk, tweet.pk), (self.follower.pk, tweet.pk)},
+        )
+        self.assertFalse(Job.objects.exists())
+
+    def test_fan_out_of_deleted_tweet(self):
+        self.client.post(reverse("tweets:create"), {"body": "tweet of user"})
+        Tweet.objects.all().delete()
+
+        call_command("run_workers", burst=True, stdout=StringIO())
+        self.assertFalse(TimelineEntry.objects.exists())
+        self.assertFalse(Job.objects.exists())
+
+    def test_retry_dead(self):
+        Job.objects.create(name="tests.record", payload={"value": 1}, status=Job.Status.DEAD, max_attempts=1)
+
+        stdout = StringIO()
+        call_command("run_workers", retry_dead=True, stdout=stdout)
+        self.assertIn("1 件のジョブを待機中に戻しました", stdout.getvalue())
+        self.assertEqual(Job.objects.get().status, Job.Status.PENDING)
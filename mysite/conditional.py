@@ -0,0 +1,41 @@
+import hashlib
+import json
+
+from django.middleware.csrf import get_token
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import quote_etag
+
+
+def make_etag(*parts):
+    """JSON にできる値から強い ETag を作る。"""
+    return quote_etag(hashlib.sha1(json.dumps(parts, separators=(",", ":"), default=str).encode()).hexdigest())
+
+
+def make_page_etag(request, *parts):
+    """
+    HTML ページ用の ETag。ナビゲーションのリンクにログイン中のユーザー名が、ログアウトのフォームに CSRF トークンが
+    入るので、ページ固有の版に加えてそれらの版も含める。
+    """
+    # CSRF の Cookie がまだ無ければここで発行し、テンプレートの {% csrf_token %} と同じ秘密を ETag に含める
+    get_token(request)
+    user = request.user
+    return make_etag(user.pk, user.profile_version, request.META["CSRF_COOKIE"], *parts)
+
+
+def get_not_modified(request, etag):
+    """If-None-Match が一致すれば 304 のレスポンスを、そうでなければ None を返す。"""
+    response = get_conditional_response(request, etag=etag)
+    if response is not None:
+        set_validators(response, etag)
+    return response
+
+
+def set_validators(response, etag):
+    # Last-Modified は付けない。削除やユーザー名の変更、同じ秒に増えた行では最新の日時が変わらず、
+    # If-Modified-Since だけを送るクライアントに古い内容の 304 を返してしまう
+    response.headers["ETag"] = etag
+    # ログインユーザーごとに内容が変わるので共有キャッシュには置かせず、ブラウザには毎回問い合わせてもらう。
+    # 手前のリバースプロキシは条件付きのリクエストをそのまま通し、304 を返すかはアプリが決める
+    patch_cache_control(response, private=True, no_cache=True)
+    patch_vary_headers(response, ["Cookie"])
+    return response
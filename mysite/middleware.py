@@ -0,0 +1,98 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.contrib.auth import SESSION_KEY
+from django.contrib.auth.middleware import AuthenticationMiddleware
+from django.http import JsonResponse
+from django.urls import Resolver404, resolve
+from django.utils.deprecation import MiddlewareMixin
+from django.utils.functional import SimpleLazyObject
+
+from accounts import user_cache
+from mysite import ratelimit
+from mysite.routers import replica_reads
+
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+
+class ReplicaRoutingMiddleware:
+    """
+    replica_reads = True のビューへの GET と HEAD の読み取りをレプリカに送る。
+    書き込みに成功したクライアントには REPLICA_STICKY_SECONDS の間 Cookie を付け、
+    その間はレプリカの遅延で自分の書き込みが見えなくならないようプライマリから読む。
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with replica_reads(self.use_replica(request)):
+            response = self.get_response(request)
+        return self.process_response(request, response)
+
+    async def __acall__(self, request):
+        with replica_reads(self.use_replica(request)):
+            response = await self.get_response(request)
+        return self.process_response(request, response)
+
+    def use_replica(self, request):
+        if not settings.DATABASE_REPLICAS or request.method not in ("GET", "HEAD"):
+            return False
+        if settings.REPLICA_STICKY_COOKIE in request.COOKIES:
+            return False
+        try:
+            match = resolve(request.path_info, getattr(request, "urlconf", None))
+        except Resolver404:
+            return False
+        return getattr(getattr(match.func, "view_class", None), "replica_reads", False)
+
+    def process_response(self, request, response):
+        if settings.DATABASE_REPLICAS and request.method not in SAFE_METHODS and response.status_code < 400:
+            response.set_cookie(
+                settings.REPLICA_STICKY_COOKIE,
+                "1",
+                max_age=settings.REPLICA_STICKY_SECONDS,
+                httponly=True,
+                samesite="Lax",
+            )
+        return response
+
+
+class CachedAuthenticationMiddleware(AuthenticationMiddleware):
+    """request.user を accounts.user_cache から読み込む AuthenticationMiddleware。"""
+
+    def process_request(self, request):
+        super().process_request(request)
+        request.user = SimpleLazyObject(lambda: user_cache.get_user(request))
+
+
+class RateLimitMiddleware(MiddlewareMixin):
+    """
+    settings.RATE_LIMITS に (回数, 秒数) を指定した URL 名への書き込みを、ログイン中ならユーザーごとに、
+    そうでなければ IP アドレスごとに制限する。超えたら 429 と Retry-After を返し、ビューを呼ばない。
+    ユーザーはセッション (キャッシュから読む) のユーザー ID で見分け、request.user は読み込まないので、
+    断るリクエストは DB に触れない。
+    """
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if request.method in SAFE_METHODS:
+            return None
+        rule = settings.RATE_LIMITS.get(request.resolver_match.view_name)
+        if rule is None:
+            return None
+
+        user_id = request.session.get(SESSION_KEY)
+        ident = f"user:{user_id}" if user_id is not None else f"ip:{request.META.get('REMOTE_ADDR')}"
+        retry_after = ratelimit.hit(request.resolver_match.view_name, ident, *rule)
+        if not retry_after:
+            return None
+        response = JsonResponse({"message": "リクエストが多すぎます。しばらくしてから再度お試しください"})
+        response.status_code = 429
+        response.headers["Retry-After"] = str(retry_after)
+        return response
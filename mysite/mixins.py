@@ -0,0 +1,45 @@
+from asgiref.sync import sync_to_async
+from django.contrib.auth.mixins import LoginRequiredMixin
+
+
+class AsyncLoginRequiredMixin(LoginRequiredMixin):
+    """
+    async def get() を持つビュー用の LoginRequiredMixin。
+    request.user の読み込みは同期の ORM なので、スレッドに逃がしてから判定する。
+    """
+
+    async def dispatch(self, request, *args, **kwargs):
+        if not await sync_to_async(lambda: request.user.is_authenticated)():
+            return self.handle_no_permission()
+        return await super(LoginRequiredMixin, self).dispatch(request, *args, **kwargs)
+
+
+class CachedObjectMixin:
+    """
+    SingleObjectMixin の get_object() の結果をリクエストの間だけ覚えておく。
+    test_func() や get_context_data() から何度呼んでも SELECT は 1 回で済む。
+    owner_field を指定すると、所有者のリレーションを同じ SELECT で読み込む。
+    """
+
+    owner_field = None
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.owner_field:
+            queryset = queryset.select_related(self.owner_field)
+        return queryset
+
+    def get_object(self, queryset=None):
+        if queryset is not None:
+            return super().get_object(queryset)
+        if getattr(self, "_cached_object", None) is None:
+            self._cached_object = self.get_uncached_object()
+        return self._cached_object
+
+    async def aget_object(self):
+        if getattr(self, "_cached_object", None) is None:
+            self._cached_object = await sync_to_async(self.get_uncached_object)()
+        return self._cached_object
+
+    def get_uncached_object(self):
+        return super().get_object()
@@ -0,0 +1,19 @@
+# URL 名ごとの GET 1 回あたりの SQL 件数の上限。
+# セッションとログインユーザーはキャッシュから読むので含まない。表示する行数が増えても件数は増えてはいけない
+QUERY_BUDGETS = {
+    "accounts:signup": 0,
+    # プロフィール (API を含む) と検索はアーカイブ (tweets.archive) も 1 回ずつ引く
+    "accounts:user_profile": 6,
+    "accounts:following_list": 2,
+    "accounts:follower_list": 2,
+    "tweets:home": 2,
+    "tweets:create": 0,
+    "tweets:detail": 1,
+    "tweets:delete": 1,
+    "tweets:search": 3,
+    "api:v1:home": 1,
+    "api:v1:tweet_detail": 1,
+    "api:v1:user_tweets": 3,
+    "api:v1:following_list": 2,
+    "api:v1:follower_list": 2,
+}
@@ -0,0 +1,40 @@
+import math
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+
+def get_cache():
+    return caches[settings.RATE_LIMIT_CACHE]
+
+
+def hit(scope, ident, limit, period, now=None):
+    """
+    scope (URL 名など) への ident (ユーザーや IP アドレス) のリクエストを 1 回数え、
+    直近 period 秒の回数が limit を超えていれば再試行までの秒数を、超えていなければ 0 を返す。
+
+    直近 period 秒の回数は、今の固定窓の回数に直前の窓の回数を重なっている割合だけ足して見積もる (スライディングウィンドウ)。
+    キャッシュへの問い合わせは incr と get の 2 回だけで、DB には触れない。
+    """
+    cache = get_cache()
+    now = time.time() if now is None else now
+    window, offset = divmod(now, period)
+    key = f"ratelimit:{scope}:{ident}:{int(window)}"
+    try:
+        count = cache.incr(key)
+    except ValueError:
+        # 窓の最初のリクエスト。同時に作られたら add が失敗するので、もう一度数える
+        if cache.add(key, 1, timeout=period * 2):
+            count = 1
+        else:
+            count = cache.incr(key)
+    if count > limit:
+        return math.ceil(period - offset)
+
+    previous = cache.get(f"ratelimit:{scope}:{ident}:{int(window) - 1}", 0)
+    overlap = 1 - offset / period
+    if count + previous * overlap <= limit:
+        return 0
+    # 直前の窓の重なりが減って limit に収まるまでの秒数
+    return math.ceil((overlap - (limit - count) / previous) * period)
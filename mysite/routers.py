@@ -0,0 +1,52 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+
+_replica_reads = ContextVar("replica_reads", default=False)
+
+# settings.ARCHIVE_DATABASE に置くモデル
+ARCHIVE_MODELS = {"tweets.archivedtweet"}
+# アーカイブ用のデータベースの別名。テストでは ARCHIVE_DATABASE が default でもこの別名にテーブルを作っておく
+ARCHIVE_ALIAS = "archive"
+
+
+@contextmanager
+def replica_reads(enabled=True):
+    """この中の読み取りを DATABASE_REPLICAS のいずれかに振り分ける。"""
+    token = _replica_reads.set(enabled)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+class PrimaryReplicaRouter:
+    """
+    書き込みは常に default (プライマリ) に送る。読み取りは replica_reads() の中でだけレプリカに送り、
+    それ以外 (書き込みを行うビューの中の読み取りなど) はプライマリから読む。
+    """
+
+    def db_for_read(self, model, **hints):
+        if model._meta.label_lower in ARCHIVE_MODELS and settings.ARCHIVE_DATABASE != "default":
+            return settings.ARCHIVE_DATABASE
+        if _replica_reads.get() and settings.DATABASE_REPLICAS:
+            return random.choice(settings.DATABASE_REPLICAS)
+        return "default"
+
+    def db_for_write(self, model, **hints):
+        if model._meta.label_lower in ARCHIVE_MODELS:
+            return settings.ARCHIVE_DATABASE
+        return "default"
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # レプリカはプライマリの複製なので、どの組み合わせでも同じデータを指す。
+        # アーカイブのツイートと投稿者は別のデータベースにありうるが、外部キー制約を張らずに ID で結ぶ
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if model_name is not None and f"{app_label}.{model_name}" in ARCHIVE_MODELS:
+            return db in (settings.ARCHIVE_DATABASE, ARCHIVE_ALIAS)
+        # レプリカのスキーマはレプリケーションで揃う
+        return db == "default"
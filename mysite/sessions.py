@@ -0,0 +1,29 @@
+from django.conf import settings
+from django.contrib.sessions.backends import cached_db
+
+
+class SessionStore(cached_db.SessionStore):
+    """
+    キャッシュを正とするセッション。読み込みはキャッシュだけで済み、DB への書き込みは
+    新規作成時 (ログイン・ログアウト・パスワード変更ではキーを作り直すので必ず書く)、キーの追加や削除があったとき、
+    前回の書き込みから SESSION_WRITE_BEHIND_SECONDS 以上経ってからの保存時だけ行う。
+    キャッシュから追い出されても DB には遅くとも SESSION_WRITE_BEHIND_SECONDS 前の値が、キーの過不足なく残る。
+    """
+
+    def persisted_key(self, session_key):
+        return f"{self.cache_key_prefix}{session_key}:persisted"
+
+    def save(self, must_create=False):
+        # 書き戻しの印には DB に書いた時点のキーの一覧を入れておき、値が変わっただけならキャッシュだけを書き換える
+        keys = sorted(self._get_session())
+        if must_create or self.session_key is None or self._cache.get(self.persisted_key(self.session_key)) != keys:
+            super().save(must_create)
+            self._cache.set(self.persisted_key(self.session_key), keys, settings.SESSION_WRITE_BEHIND_SECONDS)
+        else:
+            self._cache.set(self.cache_key, self._get_session(), self.get_expiry_age())
+
+    def delete(self, session_key=None):
+        session_key = session_key or self.session_key
+        if session_key is not None:
+            self._cache.delete(self.persisted_key(session_key))
+        super().delete(session_key)
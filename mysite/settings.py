@@ -10,14 +10,19 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.0/ref/settings/
 """
 
+import os
 import sys
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
 from django.urls import reverse_lazy
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
+# DJANGO_PROFILE=production で本番用の設定 (DEBUG 無効、SQLite のチューニング) になる
+PRODUCTION = os.environ.get("DJANGO_PROFILE") == "production"
+
 
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/4.0/howto/deployment/checklist/
@@ -26,9 +31,15 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 SECRET_KEY = "django-insecure-x+hlabr82)0gfep+bo%6nsehz_n%5_w4*9u*pd9tllw10dj1s1"
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+DEBUG = not PRODUCTION
 
 ALLOWED_HOSTS = []
+if PRODUCTION:
+    if not os.environ.get("DJANGO_ALLOWED_HOSTS"):
+        raise ImproperlyConfigured(
+            "DJANGO_PROFILE=production では DJANGO_ALLOWED_HOSTS にホスト名をカンマ区切りで指定してください"
+        )
+    ALLOWED_HOSTS = os.environ["DJANGO_ALLOWED_HOSTS"].split(",")
 
 
 # Application definition
@@ -43,14 +54,18 @@ INSTALLED_APPS = [
     "accounts.apps.AccountsConfig",
     "tweets.apps.TweetsConfig",
     "welcome.apps.WelcomeConfig",
+    "api.apps.ApiConfig",
+    "jobs.apps.JobsConfig",
 ]
 
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
+    "mysite.middleware.ReplicaRoutingMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
-    "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "mysite.middleware.CachedAuthenticationMiddleware",
+    "mysite.middleware.RateLimitMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
@@ -73,6 +88,19 @@ TEMPLATES = [
     },
 ]
 
+if PRODUCTION:
+    # コンパイル済みのテンプレートをプロセス内に保持し、ファイルの探索と構文解析を初回だけにする
+    TEMPLATES[0]["APP_DIRS"] = False
+    TEMPLATES[0]["OPTIONS"]["loaders"] = [
+        (
+            "django.template.loaders.cached.Loader",
+            [
+                "django.template.loaders.filesystem.Loader",
+                "django.template.loaders.app_directories.Loader",
+            ],
+        ),
+    ]
+
 WSGI_APPLICATION = "mysite.wsgi.application"
 
 
@@ -86,6 +114,139 @@ DATABASES = {
     }
 }
 
+if PRODUCTION:
+    DATABASES["default"].update(
+        {
+            "ENGINE": "mysite.sqlite3",
+            # リクエストをまたいで接続を使い回し、PRAGMA の設定や接続のコストを毎回払わない
+            "CONN_MAX_AGE": 600,
+            "CONN_HEALTH_CHECKS": True,
+            "OPTIONS": {
+                "pragmas": {
+                    # 読み取りが書き込みを待たなくなる。WAL なら synchronous=NORMAL でもコミット済みのデータは壊れない
+                    "journal_mode": "WAL",
+                    "synchronous": "NORMAL",
+                    "cache_size": -64000,
+                    "mmap_size": 256 * 1024 * 1024,
+                    "busy_timeout": 5000,
+                },
+                "transaction_mode": "IMMEDIATE",
+                "lock_retries": 5,
+                "lock_retry_delay": 0.05,
+            },
+        }
+    )
+
+# 読み取り専用のレプリカ。DJANGO_DB_REPLICAS にプライマリの複製の SQLite ファイルをカンマ区切りで指定する。
+# replica_reads = True のビューの GET だけがレプリカを読む (mysite.routers, mysite.middleware)
+DATABASE_REPLICAS = []
+for index, name in enumerate(filter(None, os.environ.get("DJANGO_DB_REPLICAS", "").split(",")), start=1):
+    DATABASES[f"replica{index}"] = {**DATABASES["default"], "NAME": name, "TEST": {"MIRROR": "default"}}
+    DATABASE_REPLICAS.append(f"replica{index}")
+if "test" in sys.argv and not DATABASE_REPLICAS:
+    # テストでルーティングを確かめるためのレプリカ。振り分けは DATABASE_REPLICAS を上書きしたテストでだけ行う
+    DATABASES["replica1"] = {**DATABASES["default"], "TEST": {"MIRROR": "default"}}
+
+# 古いツイートの移動先 (tweets.archive)。DJANGO_ARCHIVE_DB に SQLite のファイルを指定すると default とは別のデータベースに置く
+# (manage.py migrate --database archive でテーブルを作る)。指定しなければ default の別のテーブルに置く
+ARCHIVE_DATABASE = "default"
+if os.environ.get("DJANGO_ARCHIVE_DB"):
+    DATABASES["archive"] = {**DATABASES["default"], "NAME": os.environ["DJANGO_ARCHIVE_DB"]}
+    ARCHIVE_DATABASE = "archive"
+elif "test" in sys.argv:
+    # 別のデータベースに置いた場合のテスト用。ARCHIVE_DATABASE を上書きしたテストでだけ使う
+    DATABASES["archive"] = {**DATABASES["default"]}
+
+# この日数より前に投稿されたツイートを archive_tweets コマンドでアーカイブに移す
+TWEET_ARCHIVE_AFTER_DAYS = 365
+
+DATABASE_ROUTERS = ["mysite.routers.PrimaryReplicaRouter"]
+
+# 書き込みの後、この秒数だけはそのクライアントの読み取りもプライマリに送る
+REPLICA_STICKY_COOKIE = "replica_sticky"
+REPLICA_STICKY_SECONDS = 10
+
+
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+
+# セッションとログインユーザーは 1 人あたり 2 件ずつ (本体と版・書き戻しの印) 置く。
+# 追い出されると DB から読み直すことになるので、同時にログインしている人数の 2 倍より多めに確保する
+SESSION_CACHE_MAX_ENTRIES = int(os.environ.get("DJANGO_SESSION_CACHE_MAX_ENTRIES", 200000))
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "sessions": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "sessions",
+        "OPTIONS": {"MAX_ENTRIES": SESSION_CACHE_MAX_ENTRIES},
+    },
+    "users": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "users",
+        "OPTIONS": {"MAX_ENTRIES": SESSION_CACHE_MAX_ENTRIES},
+    },
+    # ツイート一覧の描画済み HTML 断片。プロセス間で共有したい場合は FileBasedCache などに差し替える
+    "fragments": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "fragments",
+        "TIMEOUT": 60 * 60 * 24,
+        "OPTIONS": {"MAX_ENTRIES": 10000},
+    },
+    # mysite.ratelimit の回数。消えても制限が緩むだけなので、失ってよいキャッシュに置く
+    "ratelimit": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "ratelimit",
+    },
+}
+
+if PRODUCTION:
+    # セッションとログインユーザーのキャッシュは無効化を全プロセスで共有する必要がある
+    CACHE_DIR = Path(os.environ.get("DJANGO_CACHE_DIR", BASE_DIR / "cache"))
+    CACHES["default"] = {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": CACHE_DIR,
+    }
+    for alias in ("sessions", "users"):
+        CACHES[alias] = {
+            "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+            "LOCATION": CACHE_DIR / alias,
+            "OPTIONS": {"MAX_ENTRIES": SESSION_CACHE_MAX_ENTRIES},
+        }
+    # 書き込みの回数制限も全プロセスで合算する
+    CACHES["ratelimit"] = {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": CACHE_DIR / "ratelimit",
+    }
+
+TWEET_FRAGMENT_CACHE = "fragments"
+
+# ツイートごとのいいね数を分けて持つ行数 (tweets.likes)
+LIKE_COUNTER_SHARDS = 8
+
+# セッションはキャッシュから読み、DB へはこの秒数に 1 回だけ書き戻す (mysite.sessions)
+SESSION_ENGINE = "mysite.sessions"
+SESSION_CACHE_ALIAS = "sessions"
+SESSION_WRITE_BEHIND_SECONDS = 60
+
+# request.user として使うユーザーの行のキャッシュ (accounts.user_cache)
+AUTH_USER_CACHE = "users"
+AUTH_USER_CACHE_TIMEOUT = 60 * 5
+
+# バックグラウンドジョブ (jobs.queue)。本番以外ではワーカーを起動しなくて済むよう、enqueue() がその場で実行する
+JOBS_ALWAYS_EAGER = not PRODUCTION
+JOBS_MAX_ATTEMPTS = 5
+# 失敗するたびに 2, 4, 8, ... 秒後に再試行する (上限 JOBS_BACKOFF_MAX_SECONDS)
+JOBS_BACKOFF_SECONDS = 2
+JOBS_BACKOFF_MAX_SECONDS = 60 * 60
+# ワーカーがジョブを取ってからこの秒数で終わらなければ、落ちたものとして別のワーカーが取り直す
+JOBS_LEASE_SECONDS = 60 * 5
+
+# フォロー中・フォロワーがこの人数を超える一覧は、全件をメモリに載せずに少しずつ描画して送る
+FRIENDSHIP_LIST_STREAM_THRESHOLD = 1000
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.0/ref/settings/#auth-password-validators
@@ -134,9 +295,29 @@ LOGIN_URL = reverse_lazy("accounts:login")
 LOGIN_REDIRECT_URL = reverse_lazy("tweets:home")
 LOGOUT_REDIRECT_URL = reverse_lazy("accounts:login")
 
+BENCH_COMMANDS = {"bench", "bench_asgi", "bench_sqlite", "bench_templates", "bench_likes", "bench_ratelimit"}
+
+# 書き込みの回数制限 (mysite.middleware.RateLimitMiddleware)。URL 名: (回数, 秒数)
+# テストや計測では同じユーザーで続けて書き込むので無効にし、制限のテストでは override_settings で指定する
+RATE_LIMIT_CACHE = "ratelimit"
+RATE_LIMITS = (
+    {}
+    if {"test", *BENCH_COMMANDS} & set(sys.argv)
+    else {
+        "accounts:signup": (5, 60 * 60),
+        "accounts:follow": (30, 60),
+        "accounts:unfollow": (30, 60),
+        "accounts:bulk_follow": (10, 60),
+        "tweets:create": (10, 60),
+        "tweets:like": (60, 60),
+        "tweets:unlike": (60, 60),
+    }
+)
+
 
 # テスト実行する際はここをFalseにすればOK。従って全てコメントアウトする必要なし
-SQL_DEBUG = DEBUG and "test" not in sys.argv
+# manage.py bench などの計測にも debug toolbar の処理時間を含めない
+SQL_DEBUG = DEBUG and not {"test", *BENCH_COMMANDS} & set(sys.argv)
 if SQL_DEBUG:
 
     def show_toolbar(request):
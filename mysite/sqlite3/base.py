@@ -0,0 +1,73 @@
+"""
+本番用の SQLite バックエンド。DATABASES の OPTIONS で次を指定できる。
+
+- pragmas: 接続ごとに実行する PRAGMA (journal_mode, synchronous, cache_size など)
+- transaction_mode: "IMMEDIATE" にすると atomic() の開始時に書き込みロックを取る
+- lock_retries, lock_retry_delay: database is locked で失敗した文をやり直す回数と最初の待ち時間 (秒)
+"""
+
+import random
+import sqlite3
+import time
+
+from django.db.backends.sqlite3 import base
+
+
+def is_locked(error):
+    return "database is locked" in str(error)
+
+
+class SQLiteCursorWrapper(base.SQLiteCursorWrapper):
+    """
+    トランザクションの外で実行した文 (BEGIN を含む) が database is locked で失敗したら、
+    待ち時間を倍にしながらやり直す。トランザクションの途中の文はやり直せないのでそのまま失敗させる。
+    """
+
+    retries = 0
+    retry_delay = 0.0
+
+    def execute(self, query, params=None):
+        return self._retry(super().execute, query, params)
+
+    def executemany(self, query, param_list):
+        return self._retry(super().executemany, query, list(param_list))
+
+    def _retry(self, method, *args):
+        delay = self.retry_delay
+        for attempt in range(self.retries + 1):
+            try:
+                return method(*args)
+            except sqlite3.OperationalError as e:
+                if attempt == self.retries or self.connection.in_transaction or not is_locked(e):
+                    raise
+            time.sleep(delay * random.uniform(0.5, 1.5))
+            delay *= 2
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def get_connection_params(self):
+        kwargs = super().get_connection_params()
+        self.pragmas = kwargs.pop("pragmas", {})
+        self.transaction_mode = kwargs.pop("transaction_mode", None)
+        self.lock_retries = kwargs.pop("lock_retries", 0)
+        self.lock_retry_delay = kwargs.pop("lock_retry_delay", 0.05)
+        return kwargs
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name} = {value}")
+        return conn
+
+    def create_cursor(self, name=None):
+        cursor = self.connection.cursor(factory=SQLiteCursorWrapper)
+        cursor.retries = self.lock_retries
+        cursor.retry_delay = self.lock_retry_delay
+        return cursor
+
+    def _start_transaction_under_autocommit(self):
+        # DEFERRED のままだと読み取りから書き込みへの昇格が busy_timeout を待たずに失敗する
+        if self.transaction_mode:
+            self.cursor().execute(f"BEGIN {self.transaction_mode}")
+        else:
+            super()._start_transaction_under_autocommit()
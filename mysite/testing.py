@@ -0,0 +1,60 @@
+import re
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from mysite.query_budgets import QUERY_BUDGETS
+
+# EXPLAIN QUERY PLAN の出力のうち、テーブルやインデックスを先頭から読むもの・ソートし直すもの
+FULL_SCAN = re.compile(r"^SCAN |USE TEMP B-TREE")
+
+
+def explain(sql):
+    with connection.cursor() as cursor:
+        cursor.execute(f"EXPLAIN QUERY PLAN {sql}")
+        return [row[-1] for row in cursor.fetchall()]
+
+
+class QueryPlanTestMixin:
+    """ビューが発行した SELECT を全て EXPLAIN して、全件走査や一時ソートがないことを確かめる。"""
+
+    def assertIndexedQueries(self, url, data=None):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url, data)
+        self.assertEqual(response.status_code, 200)
+
+        selects = [query["sql"] for query in context.captured_queries if query["sql"].startswith("SELECT")]
+        self.assertTrue(selects)
+        for sql in selects:
+            for step in explain(sql):
+                self.assertIsNone(FULL_SCAN.search(step), f"{step}\n{sql}")
+        return response
+
+
+class QueryBudgetTestMixin:
+    """
+    行を 1 件だけ用意したときと 100 件用意したときの SQL 件数を比べ、
+    件数が行数に比例していないこと (N+1 がないこと) と QUERY_BUDGETS に収まることを確かめる。
+    セッションとログインユーザーがキャッシュに載った状態で数えるため、数える前に 1 回リクエストしておく。
+    """
+
+    def count_queries(self, url, data=None):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url, data)
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries)
+
+    def assertQueryBudget(self, url_name, add_rows, kwargs=None, data=None):
+        """add_rows(n) は表示対象の行を n 件追加する。"""
+        budget = QUERY_BUDGETS[url_name]
+        url = reverse(url_name, kwargs=kwargs)
+
+        add_rows(1)
+        self.client.get(url, data)
+        small = self.count_queries(url, data)
+        add_rows(99)
+        large = self.count_queries(url, data)
+
+        self.assertEqual(small, large, f"{url_name}: 行数が増えると SQL が {small} 件から {large} 件に増えます")
+        self.assertLessEqual(large, budget, f"{url_name}: SQL が {large} 件で予算 {budget} 件を超えています")
@@ -0,0 +1,256 @@
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.sessions.models import Session
+from django.core.cache import caches
+from django.db import connections
+from django.db.utils import ConnectionHandler
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from mysite import ratelimit
+from mysite.routers import PrimaryReplicaRouter, replica_reads
+from mysite.sessions import SessionStore
+from tweets.models import Tweet
+
+User = get_user_model()
+
+
+class TestSQLiteBackend(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = Path(directory.name) / "db.sqlite3"
+        self.connections = ConnectionHandler(
+            {
+                "default": {
+                    "ENGINE": "mysite.sqlite3",
+                    "NAME": self.path,
+                    "OPTIONS": {
+                        "pragmas": {"journal_mode": "WAL", "synchronous": "NORMAL", "busy_timeout": 10},
+                        "transaction_mode": "IMMEDIATE",
+                        "lock_retries": 10,
+                        "lock_retry_delay": 0.02,
+                    },
+                }
+            }
+        )
+        self.connection = self.connections["default"]
+        self.addCleanup(self.connections.close_all)
+
+    def pragma(self, name):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"PRAGMA {name}")
+            return cursor.fetchone()[0]
+
+    def test_pragmas(self):
+        self.assertEqual(self.pragma("journal_mode"), "wal")
+        self.assertEqual(self.pragma("synchronous"), 1)
+        self.assertEqual(self.pragma("busy_timeout"), 10)
+
+    def test_retry_begin_while_locked(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute("CREATE TABLE counter (value INTEGER)")
+            cursor.execute("INSERT INTO counter VALUES (0)")
+
+        # 別の接続が書き込みロックを 0.2 秒握っている間に書き込みのトランザクションを始める
+        other = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+        self.addCleanup(other.close)
+        other.execute("BEGIN IMMEDIATE")
+        timer = threading.Timer(0.2, other.execute, ["COMMIT"])
+        timer.start()
+        self.addCleanup(timer.cancel)
+
+        with self.connection.cursor() as cursor:
+            cursor.execute("BEGIN IMMEDIATE")
+            cursor.execute("UPDATE counter SET value = value + 1")
+            cursor.execute("COMMIT")
+        self.assertEqual(other.execute("SELECT value FROM counter").fetchone()[0], 1)
+
+
+class TestProductionSettings(SimpleTestCase):
+    def import_settings(self, **environ):
+        env = {key: value for key, value in os.environ.items() if not key.startswith("DJANGO_")}
+        return subprocess.run(
+            [sys.executable, "-c", "import mysite.settings"],
+            cwd=settings.BASE_DIR,
+            env={**env, "DJANGO_PROFILE": "production", **environ},
+            capture_output=True,
+            text=True,
+        )
+
+    def test_allowed_hosts_is_required(self):
+        result = self.import_settings()
+        self.assertNotEqual(result.returncode, 0)
+        self.assertIn("ImproperlyConfigured: DJANGO_PROFILE=production では DJANGO_ALLOWED_HOSTS", result.stderr)
+
+        self.assertEqual(self.import_settings(DJANGO_ALLOWED_HOSTS="example.com").returncode, 0)
+
+
+@override_settings(DATABASE_REPLICAS=["replica1"])
+class TestReplicaRouting(TransactionTestCase):
+    databases = {"default", "replica1"}
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="user", email="user@example.com", password="asdfg!@#$%12345")
+        self.other = User.objects.create_user(username="other", email="other@example.com", password="asdfg!@#$%12345")
+        self.client.force_login(self.user)
+
+    def request(self, method, url):
+        with CaptureQueriesContext(connections["default"]) as primary:
+            with CaptureQueriesContext(connections["replica1"]) as replica:
+                response = getattr(self.client, method)(url)
+        return response, len(primary), len(replica)
+
+    def test_router(self):
+        router = PrimaryReplicaRouter()
+        self.assertEqual(router.db_for_read(Tweet), "default")
+        with replica_reads():
+            self.assertEqual(router.db_for_read(Tweet), "replica1")
+            self.assertEqual(router.db_for_write(Tweet), "default")
+        self.assertFalse(router.allow_migrate("replica1", "tweets"))
+
+    def test_read_only_view_reads_from_replica(self):
+        response, primary, replica = self.request("get", reverse("tweets:home"))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(primary, 0)
+        self.assertGreater(replica, 0)
+
+    def test_search_reads_index_and_rows_from_replica(self):
+        Tweet.objects.create(user=self.other, body="いい天気ですね")
+        url = reverse("tweets:search") + "?q=いい天気"
+        response, primary, replica = self.request("get", url)
+        self.assertEqual([tweet.body for tweet in response.context["tweet_list"]], ["いい天気ですね"])
+        self.assertEqual(primary, 0)
+        self.assertGreater(replica, 0)
+
+    def test_write_view_uses_primary_and_sticks(self):
+        response, primary, replica = self.request("post", reverse("accounts:follow", kwargs={"username": "other"}))
+        self.assertEqual(response.status_code, 302)
+        self.assertGreater(primary, 0)
+        self.assertEqual(replica, 0)
+        self.assertIn(settings.REPLICA_STICKY_COOKIE, response.cookies)
+
+        # 書き込みの直後は自分の書き込みが見えるようプライマリから読む
+        profile_url = reverse("accounts:user_profile", kwargs={"username": "other"})
+        response, primary, replica = self.request("get", profile_url)
+        self.assertTrue(response.context["is_following"])
+        self.assertEqual(replica, 0)
+
+        self.client.cookies.pop(settings.REPLICA_STICKY_COOKIE)
+        response, primary, replica = self.request("get", profile_url)
+        self.assertEqual(primary, 0)
+        self.assertGreater(replica, 0)
+
+
+class TestWriteBehindSession(TestCase):
+    def stored(self, session):
+        return Session.objects.get(pk=session.session_key).get_decoded()
+
+    def test_save(self):
+        session = SessionStore()
+        session["value"] = 1
+        session.save()
+        self.assertEqual(self.stored(session), {"value": 1})
+
+        # SESSION_WRITE_BEHIND_SECONDS の間はキャッシュだけを書き換える
+        session["value"] = 2
+        with self.assertNumQueries(0):
+            session.save()
+        self.assertEqual(self.stored(session), {"value": 1})
+        self.assertEqual(SessionStore(session.session_key).load(), {"value": 2})
+
+        session._cache.delete(session.persisted_key(session.session_key))
+        session["value"] = 3
+        session.save()
+        self.assertEqual(self.stored(session), {"value": 3})
+
+    def test_save_writes_through_when_keys_change(self):
+        session = SessionStore()
+        session["value"] = 1
+        session.save()
+
+        # キーが増えたり減ったりしたら、間隔を待たずに DB へ書き戻す
+        session["other"] = 1
+        session.save()
+        self.assertEqual(self.stored(session), {"value": 1, "other": 1})
+        del session["value"]
+        session.save()
+        self.assertEqual(self.stored(session), {"other": 1})
+
+        session["other"] = 2
+        with self.assertNumQueries(0):
+            session.save()
+        self.assertEqual(self.stored(session), {"other": 1})
+
+    def test_cache_aliases(self):
+        self.assertEqual(SessionStore()._cache, caches["sessions"])
+        self.assertEqual(caches["sessions"]._max_entries, settings.SESSION_CACHE_MAX_ENTRIES)
+        self.assertEqual(caches["users"]._max_entries, settings.SESSION_CACHE_MAX_ENTRIES)
+
+    def test_delete(self):
+        session = SessionStore()
+        session["value"] = 1
+        session.save()
+        session.delete()
+        self.assertFalse(Session.objects.filter(pk=session.session_key).exists())
+        self.assertEqual(SessionStore(session.session_key).load(), {})
+
+
+class TestRateLimit(SimpleTestCase):
+    def setUp(self):
+        ratelimit.get_cache().clear()
+
+    def test_sliding_window(self):
+        for i in range(3):
+            self.assertEqual(ratelimit.hit("scope", "user:1", 3, 60, now=600 + i), 0)
+        # 4 回目は今の窓が終わる 58 秒後まで待つ
+        self.assertEqual(ratelimit.hit("scope", "user:1", 3, 60, now=602), 58)
+        # 次の窓の最初は直前の窓の 4 回がほぼ重なっているので、まだ制限される
+        self.assertEqual(ratelimit.hit("scope", "user:1", 3, 60, now=660), 30)
+        # 直前の窓の重なりが 1/4 になれば 4 * 1/4 + 2 = 3 回に収まる
+        self.assertEqual(ratelimit.hit("scope", "user:1", 3, 60, now=705), 0)
+        # 数える単位が違えば影響しない
+        self.assertEqual(ratelimit.hit("scope", "user:2", 3, 60, now=602), 0)
+        self.assertEqual(ratelimit.hit("other", "user:1", 3, 60, now=602), 0)
+
+
+@override_settings(RATE_LIMITS={"tweets:create": (2, 60), "accounts:signup": (1, 60)})
+class TestRateLimitMiddleware(TestCase):
+    def setUp(self):
+        ratelimit.get_cache().clear()
+        self.user = User.objects.create_user(username="user", email="user@example.com", password="asdfg!@#$%12345")
+        self.client.force_login(self.user)
+        self.url = reverse("tweets:create")
+
+    def test_too_many_requests(self):
+        for i in range(2):
+            self.assertEqual(self.client.post(self.url, {"body": f"tweet{i}"}).status_code, 302)
+
+        # 制限に達したらビューを呼ばずに 429 を返す。セッションはキャッシュから読み、ユーザーは読み込まない
+        with self.assertNumQueries(0):
+            response = self.client.post(self.url, {"body": "tweet2"})
+        self.assertEqual(response.status_code, 429)
+        self.assertGreater(int(response.headers["Retry-After"]), 0)
+        self.assertEqual(Tweet.objects.count(), 2)
+
+        # 読み取りと他のユーザーの書き込みは制限されない
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+        other = User.objects.create_user(username="other", email="other@example.com", password="asdfg!@#$%12345")
+        self.client.force_login(other)
+        self.assertEqual(self.client.post(self.url, {"body": "tweet of other"}).status_code, 302)
+
+    def test_anonymous_requests_are_limited_by_address(self):
+        self.client.logout()
+        data = {"username": "new", "email": "new@example.com", "password1": "asdfg!@#$%12345"}
+        self.client.post(reverse("accounts:signup"), data, REMOTE_ADDR="192.0.2.1")
+        self.assertEqual(self.client.post(reverse("accounts:signup"), data, REMOTE_ADDR="192.0.2.1").status_code, 429)
+        self.assertEqual(self.client.post(reverse("accounts:signup"), data, REMOTE_ADDR="192.0.2.2").status_code, 200)
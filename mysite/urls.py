@@ -22,5 +22,6 @@ urlpatterns = [
     path("admin/", admin.site.urls),
     path("accounts/", include("accounts.urls")),
     path("tweets/", include("tweets.urls")),
+    path("api/", include("api.urls")),
     path("", include("welcome.urls")),
 ] + debug_toolbar_urls()
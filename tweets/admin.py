@@ -1,5 +1,8 @@
 from django.contrib import admin
 
-from tweets.models import Tweet
+from tweets.models import ArchivedTweet, Like, TimelineEntry, Tweet
 
 admin.site.register(Tweet)
+admin.site.register(TimelineEntry)
+admin.site.register(Like)
+admin.site.register(ArchivedTweet)
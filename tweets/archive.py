@@ -0,0 +1,89 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import router, transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from tweets.models import ArchivedTweet, LikeCounterShard, Tweet
+
+User = get_user_model()
+
+BATCH_SIZE = 1000
+
+
+def cutoff(days=None):
+    """この日時より前に投稿されたツイートをアーカイブに移す。"""
+    return timezone.now() - timedelta(days=settings.TWEET_ARCHIVE_AFTER_DAYS if days is None else days)
+
+
+def archive_batch(before, after_pk=0, size=BATCH_SIZE):
+    """
+    主キーが after_pk より大きく、before より前に投稿されたツイートを主キー順に size 件まで ArchivedTweet に移し、
+    (移した件数, 最後に見た主キー) を返す。アーカイブが同じデータベースにあれば書き込みと削除を 1 つのトランザクションで行う。
+    別のデータベースなら先にアーカイブへコミットしてから元の行を消すので、途中で止まっても失われるツイートはないが、
+    その間は同じ ID が両方にある (読む側は重複を除き、次の実行で元の行が消える)。
+    元の行を消すとタイムラインの行といいねも消え、いいね数だけをアーカイブに残す。
+    """
+    rows = list(
+        Tweet.objects.filter(pk__gt=after_pk, created_at__lt=before)
+        .order_by("pk")
+        .values_list("pk", "user_id", "body", "created_at")[:size]
+    )
+    if not rows:
+        return 0, None
+    ids = [row[0] for row in rows]
+    likes = dict(
+        LikeCounterShard.objects.filter(tweet_id__in=ids)
+        .values("tweet_id")
+        .annotate(total=Sum("count"))
+        .values_list("tweet_id", "total")
+    )
+
+    archive_db = router.db_for_write(ArchivedTweet)
+    same_db = archive_db == router.db_for_write(Tweet)
+    with transaction.atomic(using=archive_db):
+        # 前回の実行が元の行を消す前に止まっていた場合は、既にアーカイブにある
+        ArchivedTweet.objects.bulk_create(
+            [
+                ArchivedTweet(
+                    id=pk, user_id=user_id, body=body, created_at=created_at, likes_count=max(likes.get(pk, 0), 0)
+                )
+                for pk, user_id, body, created_at in rows
+            ],
+            ignore_conflicts=True,
+        )
+        if same_db:
+            Tweet.objects.filter(pk__in=ids).delete()
+    if not same_db:
+        with transaction.atomic():
+            Tweet.objects.filter(pk__in=ids).delete()
+    return len(ids), ids[-1]
+
+
+def attach_users(tweets):
+    """
+    アーカイブは別のデータベースにありうるので、投稿者は JOIN せずに 1 回の SELECT でまとめて読んで付ける。
+    投稿者が削除されたツイートは除く。
+    """
+    users = User.objects.in_bulk({tweet.user_id for tweet in tweets})
+    attached = []
+    for tweet in tweets:
+        if tweet.user_id in users:
+            tweet.user = users[tweet.user_id]
+            attached.append(tweet)
+    return attached
+
+
+def get(pk):
+    """アーカイブしたツイートを投稿者付きで返す。無ければ None。"""
+    tweet = ArchivedTweet.objects.filter(pk=pk).first()
+    if tweet is None:
+        return None
+    return next(iter(attach_users([tweet])), None)
+
+
+def in_bulk(ids, using=None):
+    tweets = ArchivedTweet.objects.db_manager(using).filter(pk__in=ids)
+    return {tweet.pk: tweet for tweet in attach_users(list(tweets))}
@@ -0,0 +1,112 @@
+import threading
+
+from django.conf import settings
+from django.core.cache import caches
+from django.template import Context
+from django.template.loader import get_template
+
+TEMPLATE_NAME = "tweets/tweet_overview.html"
+STATS_KEYS = {"hits": "tweet_overview:stats:hits", "misses": "tweet_overview:stats:misses"}
+
+
+def get_cache():
+    return caches[settings.TWEET_FRAGMENT_CACHE]
+
+
+class FragmentCacheStats:
+    """
+    ヒット数・ミス数をプロセス内で数え、flush_every 回ごとにキャッシュへまとめて加算する。
+    キャッシュ上の値は全プロセスの合計になり、fragment_cache_stats コマンドで確認できる。
+    """
+
+    def __init__(self, flush_every=100):
+        self.flush_every = flush_every
+        self._lock = threading.Lock()
+        self.hits = self.misses = 0
+        self._pending = {"hits": 0, "misses": 0}
+
+    def record(self, hits=0, misses=0):
+        with self._lock:
+            self.hits += hits
+            self.misses += misses
+            self._pending["hits"] += hits
+            self._pending["misses"] += misses
+            if sum(self._pending.values()) < self.flush_every:
+                return
+            pending, self._pending = self._pending, {"hits": 0, "misses": 0}
+        self._flush(pending)
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {"hits": 0, "misses": 0}
+        self._flush(pending)
+
+    def _flush(self, pending):
+        cache = get_cache()
+        for name, count in pending.items():
+            if not count:
+                continue
+            key = STATS_KEYS[name]
+            # add は未登録のときだけ成功するので、初回の加算が他プロセスと競合しても数え漏れない
+            if cache.add(key, count, timeout=None):
+                continue
+            try:
+                cache.incr(key, count)
+            except ValueError:
+                # add と incr の間に追い出された。数え直しに失敗しても描画は止めない (統計が少し欠けるだけ)
+                cache.add(key, count, timeout=None)
+
+    def shared(self):
+        values = get_cache().get_many(STATS_KEYS.values())
+        return {name: values.get(key, 0) for name, key in STATS_KEYS.items()}
+
+    def reset(self):
+        with self._lock:
+            self.hits = self.misses = 0
+            self._pending = {"hits": 0, "misses": 0}
+        get_cache().delete_many(STATS_KEYS.values())
+
+
+def hit_rate(hits, misses):
+    total = hits + misses
+    return hits / total if total else 0.0
+
+
+stats = FragmentCacheStats()
+
+
+def cache_key(tweet):
+    # 投稿者のユーザー名が変わると profile_version が上がり、古い断片は参照されなくなる。
+    # SQLite は削除された末尾の id を再利用することがあるので、投稿日時もキーに含める
+    created_at = int(tweet.created_at.timestamp() * 1_000_000)
+    return f"tweet_overview:{tweet.pk}:{created_at}:{tweet.user.profile_version}"
+
+
+def render(tweet):
+    return render_many([tweet])[0]
+
+
+def render_many(tweets):
+    """
+    ツイートの一覧の断片をまとめて返す。キャッシュは get_many / set_many の 1 往復ずつで読み書きし、
+    キャッシュに無いものはコンパイル済みのテンプレートを 1 つの Context で使い回して描画する。
+    """
+    cache = get_cache()
+    keys = [cache_key(tweet) for tweet in tweets]
+    cached = cache.get_many(keys)
+    missed = {}
+    if len(cached) < len(keys):
+        template = get_template(TEMPLATE_NAME).template
+        context = Context(autoescape=True)
+        for key, tweet in zip(keys, tweets):
+            if key in cached or key in missed:
+                continue
+            with context.push(tweet=tweet):
+                missed[key] = template.render(context)
+        cache.set_many(missed)
+    stats.record(hits=len(keys) - len(missed), misses=len(missed))
+    return [cached[key] if key in cached else missed[key] for key in keys]
+
+
+def invalidate(tweet):
+    get_cache().delete(cache_key(tweet))
@@ -0,0 +1,57 @@
+import random
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Exists, F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+from tweets.models import Like, LikeCounterShard
+
+
+def _add(tweet_id, delta):
+    shard = random.randrange(settings.LIKE_COUNTER_SHARDS)
+    shards = LikeCounterShard.objects.filter(tweet_id=tweet_id, shard=shard)
+    if not shards.update(count=F("count") + delta):
+        # 初めて使う行は作ってから加算する。同時に作られても一意制約で 1 行にまとまる
+        LikeCounterShard.objects.bulk_create([LikeCounterShard(tweet_id=tweet_id, shard=shard)], ignore_conflicts=True)
+        shards.update(count=F("count") + delta)
+
+
+def like(user_id, tweet_id):
+    """いいねして、新しくいいねしたかを返す。いいねとカウンタは同じトランザクションで書くので、合計は常に正確。"""
+    with transaction.atomic():
+        try:
+            with transaction.atomic():
+                Like.objects.create(user_id=user_id, tweet_id=tweet_id)
+        except IntegrityError:
+            return False
+        _add(tweet_id, 1)
+    return True
+
+
+def unlike(user_id, tweet_id):
+    """いいねを取り消して、取り消したかを返す。"""
+    with transaction.atomic():
+        deleted, _ = Like.objects.filter(user_id=user_id, tweet_id=tweet_id).delete()
+        if deleted:
+            _add(tweet_id, -1)
+    return bool(deleted)
+
+
+def count(tweet_id):
+    return LikeCounterShard.objects.filter(tweet_id=tweet_id).aggregate(total=Coalesce(Sum("count"), 0))["total"]
+
+
+def annotate(queryset, user_id):
+    """Tweet のクエリセットに likes_count (いいね数) と liked (user_id のユーザーがいいね済みか) を足す。"""
+    totals = (
+        LikeCounterShard.objects.filter(tweet=OuterRef("pk"))
+        .order_by()
+        .values("tweet")
+        .annotate(total=Sum("count"))
+        .values("total")
+    )
+    return queryset.annotate(
+        likes_count=Coalesce(Subquery(totals), 0),
+        liked=Exists(Like.objects.filter(tweet=OuterRef("pk"), user_id=user_id)),
+    )
@@ -0,0 +1,41 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from tweets import archive
+
+
+class Command(BaseCommand):
+    help = (
+        "投稿から一定の日数が過ぎたツイートを batch-size 件ずつアーカイブに移す。"
+        "cron などで定期的に実行し、ツイートのテーブルと索引を小さく保つ"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=settings.TWEET_ARCHIVE_AFTER_DAYS,
+            help="この日数より前に投稿されたツイートを移す",
+        )
+        parser.add_argument("--batch-size", type=int, default=archive.BATCH_SIZE)
+        parser.add_argument(
+            "--pause", type=float, default=0.0, help="バッチの間に待つ秒数。書き込みのロックをリクエストに譲る"
+        )
+
+    def handle(self, *args, days, batch_size, pause, **options):
+        before = archive.cutoff(days)
+        start = time.perf_counter()
+        moved = 0
+        last_pk = 0
+        while True:
+            # 1 バッチごとに別のトランザクションでコミットする
+            count, last_pk = archive.archive_batch(before, last_pk, batch_size)
+            if not count:
+                break
+            moved += count
+            if pause:
+                time.sleep(pause)
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(f"{moved} 件のツイートをアーカイブに移しました ({elapsed:.2f} 秒)"))
@@ -0,0 +1,176 @@
+import json
+import statistics
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from tweets import fragment_cache
+from tweets.models import Tweet
+
+User = get_user_model()
+
+
+class QueryTimer:
+    """connection.execute_wrapper に渡して、SQL の件数と実行時間を高精度で数える。"""
+
+    def __init__(self):
+        self.count = 0
+        self.elapsed = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.elapsed += time.perf_counter() - start
+            self.count += 1
+
+
+def percentile(values, percent):
+    if not values:
+        raise CommandError("計測したリクエストがありません。--requests に 1 以上を指定してください")
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[percent - 1]
+
+
+def run_threads(func, *iterables):
+    """引数の組ごとに 1 スレッドで func を呼び、結果を順番どおりに返す。"""
+    args = list(zip(*iterables))
+    if len(args) == 1:
+        # 1 スレッドならスレッドを挟まず、呼び出し元と同じ DB 接続で実行する
+        return [func(*args[0])]
+
+    def worker(args):
+        try:
+            return func(*args)
+        finally:
+            connection.close()
+
+    with ThreadPoolExecutor(len(args)) as executor:
+        return list(executor.map(worker, args))
+
+
+def emit_report(command, report, options):
+    """計測結果を JSON にして --output のファイルか標準出力に書き出す。"""
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if options["output"]:
+        with open(options["output"], "w") as f:
+            f.write(output + "\n")
+    else:
+        command.stdout.write(output)
+
+
+class Command(BaseCommand):
+    help = "主要なビューをプロセス内で繰り返し呼び出し、レイテンシと SQL の統計を JSON で出力する"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=50, help="ビューごとのリクエスト数")
+        parser.add_argument("--warmup", type=int, default=5)
+        parser.add_argument("--prefix", default="bench", help="seed_bench で作ったユーザー名の接頭辞")
+        parser.add_argument("--output", help="結果の JSON を書き出すファイル (省略時は標準出力)")
+
+    def handle(self, *args, **options):
+        if options["requests"] < 1:
+            raise CommandError("--requests には 1 以上を指定してください")
+        users = User.objects.filter(username__startswith=options["prefix"])
+        viewer = users.order_by("-following_count", "pk").first()
+        celebrity = users.order_by("-followers_count", "pk").first()
+        if viewer is None:
+            raise CommandError("先に manage.py seed_bench を実行してください")
+        targets = list(
+            users.exclude(pk=viewer.pk)
+            .exclude(pk__in=viewer.following.values("pk"))
+            .values_list("username", flat=True)[: options["requests"] + options["warmup"]]
+        )
+        if not targets:
+            raise CommandError(f"{viewer.username} がまだフォローしていない {options['prefix']} のユーザーがいません")
+
+        self.client = Client()
+        self.client.force_login(viewer)
+        fragment_cache.stats.reset()
+
+        scenarios = {
+            "home": lambda i: self.client.get(reverse("tweets:home")),
+            "profile": lambda i: self.client.get(celebrity.get_absolute_url()),
+            "following_list": lambda i: self.client.get(
+                reverse("accounts:following_list", kwargs={"username": viewer.username})
+            ),
+            "follower_list": lambda i: self.client.get(
+                reverse("accounts:follower_list", kwargs={"username": celebrity.username})
+            ),
+            "follow": lambda i: self.client.post(
+                reverse("accounts:follow", kwargs={"username": targets[i % len(targets)]})
+            ),
+            "tweet_create": lambda i: self.client.post(reverse("tweets:create"), {"body": f"bench {i}"}),
+        }
+
+        started_at = timezone.now()
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"]):
+            results = {name: self.measure(scenario, options) for name, scenario in scenarios.items()}
+            self.cleanup(viewer, targets, started_at)
+
+        report = {
+            "commit": self.git_commit(),
+            "measured_at": started_at.isoformat(),
+            "viewer": viewer.username,
+            "rows": {"users": User.objects.count(), "tweets": Tweet.objects.count()},
+            "fragment_cache": {
+                "hits": fragment_cache.stats.hits,
+                "misses": fragment_cache.stats.misses,
+                "hit_rate": fragment_cache.hit_rate(fragment_cache.stats.hits, fragment_cache.stats.misses),
+            },
+            "views": results,
+        }
+        emit_report(self, report, options)
+
+    def measure(self, scenario, options):
+        latencies, query_counts, sql_times = [], [], []
+        for i in range(options["warmup"] + options["requests"]):
+            timer = QueryTimer()
+            with connection.execute_wrapper(timer):
+                start = time.perf_counter()
+                response = scenario(i)
+                elapsed = time.perf_counter() - start
+            if response.status_code >= 400:
+                raise CommandError(f"{response.status_code} が返りました: {response.request['PATH_INFO']}")
+            if i < options["warmup"]:
+                continue
+            latencies.append(elapsed * 1000)
+            query_counts.append(timer.count)
+            sql_times.append(timer.elapsed * 1000)
+
+        return {
+            "requests": len(latencies),
+            "p50_ms": round(percentile(latencies, 50), 3),
+            "p95_ms": round(percentile(latencies, 95), 3),
+            "p99_ms": round(percentile(latencies, 99), 3),
+            "queries": statistics.median(query_counts),
+            "sql_ms": round(statistics.median(sql_times), 3),
+        }
+
+    def cleanup(self, viewer, targets, started_at):
+        # 計測で増えたフォローとツイートをビュー経由で元に戻し、カウンタやタイムラインも整合させる
+        for username in targets:
+            self.client.post(reverse("accounts:unfollow", kwargs={"username": username}))
+        tweets = Tweet.objects.filter(user=viewer, created_at__gte=started_at).values_list("pk", flat=True)
+        for pk in list(tweets):
+            self.client.post(reverse("tweets:delete", kwargs={"pk": pk}))
+
+    @staticmethod
+    def git_commit():
+        try:
+            result = subprocess.run(
+                ["git", "rev-parse", "--short", "HEAD"], cwd=settings.BASE_DIR, capture_output=True, text=True
+            )
+        except OSError:
+            return None
+        return result.stdout.strip() or None
@@ -0,0 +1,98 @@
+import asyncio
+import time
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.test import AsyncClient, Client, override_settings
+from django.urls import reverse
+
+from tweets.management.commands.bench import emit_report, percentile, run_threads
+from tweets.models import Tweet
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = "読み取り系のビューを同時実行数を指定して WSGI と ASGI の両方で呼び出し、スループットを比較する"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=200, help="ビューごとのリクエスト数")
+        parser.add_argument("--concurrency", type=int, default=8, help="同時に処理するリクエスト数")
+        parser.add_argument("--prefix", default="bench", help="seed_bench で作ったユーザー名の接頭辞")
+        parser.add_argument("--output", help="結果の JSON を書き出すファイル (省略時は標準出力)")
+
+    def handle(self, *args, **options):
+        users = User.objects.filter(username__startswith=options["prefix"])
+        viewer = users.order_by("-following_count", "pk").first()
+        celebrity = users.order_by("-followers_count", "pk").first()
+        tweet = Tweet.objects.filter(user=celebrity).order_by("-created_at", "-id").first() if celebrity else None
+        if viewer is None or tweet is None:
+            raise CommandError("先に manage.py seed_bench を実行してください")
+
+        self.concurrency = max(1, options["concurrency"])
+        # ログインは同期の ORM を使うので、イベントループに入る前に済ませておく
+        self.clients = [Client() for _ in range(self.concurrency)]
+        self.async_clients = [AsyncClient() for _ in range(self.concurrency)]
+        for client in self.clients + self.async_clients:
+            client.force_login(viewer)
+        paths = {
+            "home": reverse("tweets:home"),
+            "detail": reverse("tweets:detail", kwargs={"pk": tweet.pk}),
+            "profile": celebrity.get_absolute_url(),
+        }
+
+        results = {}
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"]):
+            for name, path in paths.items():
+                results[name] = {
+                    "wsgi": self.summarize(*self.run_wsgi(path, options["requests"])),
+                    "asgi": self.summarize(*async_to_sync(self.run_asgi)(path, options["requests"])),
+                }
+
+        report = {"concurrency": self.concurrency, "viewer": viewer.username, "views": results}
+        emit_report(self, report, options)
+
+    def shares(self, total):
+        return [total // self.concurrency + (i < total % self.concurrency) for i in range(self.concurrency)]
+
+    def run_wsgi(self, path, total):
+        def worker(client, count):
+            return [self.timed(client.get, path) for _ in range(count)]
+
+        start = time.perf_counter()
+        latencies = run_threads(worker, self.clients, self.shares(total))
+        return [ms for chunk in latencies for ms in chunk], time.perf_counter() - start
+
+    async def run_asgi(self, path, total):
+        async def worker(client, count):
+            return [await self.atimed(client.get, path) for _ in range(count)]
+
+        start = time.perf_counter()
+        latencies = await asyncio.gather(*map(worker, self.async_clients, self.shares(total)))
+        return [ms for chunk in latencies for ms in chunk], time.perf_counter() - start
+
+    @staticmethod
+    def check_response(response, path):
+        if response.status_code >= 400:
+            raise CommandError(f"{response.status_code} が返りました: {path}")
+
+    def timed(self, get, path):
+        start = time.perf_counter()
+        self.check_response(get(path), path)
+        return (time.perf_counter() - start) * 1000
+
+    async def atimed(self, get, path):
+        start = time.perf_counter()
+        self.check_response(await get(path), path)
+        return (time.perf_counter() - start) * 1000
+
+    @staticmethod
+    def summarize(latencies, elapsed):
+        return {
+            "requests": len(latencies),
+            "requests_per_sec": round(len(latencies) / elapsed, 1),
+            "p50_ms": round(percentile(latencies, 50), 3),
+            "p95_ms": round(percentile(latencies, 95), 3),
+        }
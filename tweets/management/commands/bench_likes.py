@@ -0,0 +1,88 @@
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError
+from django.test import override_settings
+
+from mysite.sqlite3.base import is_locked
+from tweets import likes
+from tweets.management.commands.bench import emit_report, percentile, run_threads
+from tweets.models import Like, Tweet
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = "1 件のツイートに複数スレッドから同時にいいねと取り消しを繰り返し、いいね数のカウンタの行数ごとにスループットを測る"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=8)
+        parser.add_argument("--users", type=int, default=50, help="スレッドごとのいいねするユーザー数")
+        parser.add_argument(
+            "--shards",
+            type=int,
+            nargs="+",
+            help="比較するカウンタの行数 (省略時は 1 と settings.LIKE_COUNTER_SHARDS)",
+        )
+        parser.add_argument("--prefix", default="bench", help="seed_bench で作ったユーザー名の接頭辞")
+        parser.add_argument("--output", help="結果の JSON を書き出すファイル (省略時は標準出力)")
+
+    def handle(self, *args, **options):
+        threads = max(1, options["threads"])
+        user_ids = list(
+            User.objects.filter(username__startswith=options["prefix"]).values_list("pk", flat=True)[
+                : threads * options["users"]
+            ]
+        )
+        tweet = Tweet.objects.filter(user_id__in=user_ids).order_by("-created_at", "-id").first()
+        if tweet is None:
+            raise CommandError("先に manage.py seed_bench を実行してください")
+        # 計測中のいいねと取り消しが対になるように、既にいいねしているユーザーは使わない
+        liked_ids = set(Like.objects.filter(tweet=tweet).values_list("user_id", flat=True))
+        user_ids = [user_id for user_id in user_ids if user_id not in liked_ids]
+        slices = [user_ids[i::threads] for i in range(threads)]
+
+        results = {}
+        for shards in options["shards"] or sorted({1, settings.LIKE_COUNTER_SHARDS}):
+            with override_settings(LIKE_COUNTER_SHARDS=shards):
+                results[str(shards)] = self.run(tweet.pk, slices)
+
+        report = {"tweet": tweet.pk, "threads": threads, "users": len(user_ids), "shards": results}
+        emit_report(self, report, options)
+
+    def run(self, tweet_id, slices):
+        before = likes.count(tweet_id)
+
+        def worker(user_ids):
+            latencies, locked = [], 0
+            # 全員がいいねしてから全員が取り消すので、終わるといいね数は元に戻る
+            for action in (likes.like, likes.unlike):
+                for user_id in user_ids:
+                    start = time.perf_counter()
+                    try:
+                        action(user_id, tweet_id)
+                    except OperationalError as e:
+                        if not is_locked(e):
+                            raise
+                        locked += 1
+                        continue
+                    latencies.append((time.perf_counter() - start) * 1000)
+            return latencies, locked
+
+        start = time.perf_counter()
+        results = run_threads(worker, slices)
+        elapsed = time.perf_counter() - start
+
+        latencies = [ms for result in results for ms in result[0]]
+        return {
+            "operations_per_sec": round(len(latencies) / elapsed, 1),
+            "operations": len(latencies),
+            "locked_errors": sum(result[1] for result in results),
+            "p95_ms": round(percentile(latencies, 95), 3) if latencies else None,
+            # 同時に書き込んでも、カウンタの合計と Like の行数は一致していなければならない
+            "consistent": likes.count(tweet_id) == Like.objects.filter(tweet_id=tweet_id).count(),
+            "likes_before": before,
+            "likes_after": likes.count(tweet_id),
+        }
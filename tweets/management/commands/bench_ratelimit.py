@@ -0,0 +1,59 @@
+import statistics
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+
+from mysite import ratelimit
+from mysite.middleware import RateLimitMiddleware
+from mysite.sessions import SessionStore
+from tweets.management.commands.bench import emit_report, percentile
+
+
+class Command(BaseCommand):
+    help = "書き込みの回数制限の判定 1 回あたりの時間を、制限の関数単体とミドルウェア全体のそれぞれで測る"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=10000)
+        parser.add_argument("--cache", default=settings.RATE_LIMIT_CACHE, help="回数を数えるキャッシュの名前")
+        parser.add_argument("--output", help="結果の JSON を書き出すファイル (省略時は標準出力)")
+
+    def handle(self, *args, iterations, cache, **options):
+        # 計測中に制限へ達しないよう、上限を十分大きくする
+        rule = (iterations * 10, 60)
+        path = reverse("tweets:create")
+        request = RequestFactory().post(path, REMOTE_ADDR="192.0.2.1")
+        # ログインしていないセッション。ミドルウェアは IP アドレスで数える
+        request.session = SessionStore()
+        request.resolver_match = resolve(path)
+        middleware = RateLimitMiddleware(lambda request: None)
+
+        with override_settings(RATE_LIMIT_CACHE=cache, RATE_LIMITS={"tweets:create": rule}):
+            ratelimit.get_cache().clear()
+            with CaptureQueriesContext(connection) as queries:
+                results = {
+                    "hit": self.measure(lambda: ratelimit.hit("bench", "ip:192.0.2.1", *rule), iterations),
+                    "middleware": self.measure(lambda: middleware.process_view(request, None, (), {}), iterations),
+                }
+            ratelimit.get_cache().clear()
+
+        report = {"cache": cache, "iterations": iterations, "queries": len(queries), "results": results}
+        emit_report(self, report, options)
+
+    @staticmethod
+    def measure(func, iterations):
+        latencies = []
+        for _ in range(iterations):
+            start = time.perf_counter()
+            if func():
+                raise RuntimeError("計測中に回数制限に達しました")
+            latencies.append((time.perf_counter() - start) * 1_000_000)
+        return {
+            "mean_us": round(statistics.fmean(latencies), 2),
+            "p50_us": round(percentile(latencies, 50), 2),
+            "p99_us": round(percentile(latencies, 99), 2),
+        }
@@ -0,0 +1,126 @@
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection
+
+from mysite.sqlite3.base import is_locked
+from tweets import posting
+from tweets.management.commands.bench import emit_report, percentile, run_threads
+from tweets.models import TimelineEntry, Tweet
+from tweets.pagination import KeysetPaginator
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = "複数スレッドからタイムラインの読み込みとツイートの投稿を同時に行い、SQLite のスループットを測る"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=8)
+        parser.add_argument("--operations", type=int, default=200, help="スレッドごとの操作回数")
+        parser.add_argument("--write-ratio", type=float, default=0.2, help="操作のうちツイートの投稿の割合")
+        parser.add_argument("--prefix", default="bench", help="seed_bench で作ったユーザー名の接頭辞")
+        parser.add_argument(
+            "--compare",
+            action="store_true",
+            help="既定の設定と DJANGO_PROFILE=production の設定をそれぞれ別プロセスで計測して並べる",
+        )
+        parser.add_argument("--output", help="結果の JSON を書き出すファイル (省略時は標準出力)")
+
+    def handle(self, *args, **options):
+        if options["compare"]:
+            report = {profile: self.run_profile(profile, options) for profile in ("default", "production")}
+        else:
+            report = self.run(options)
+
+        emit_report(self, report, options)
+
+    def run_profile(self, profile, options):
+        env = {**os.environ, "DJANGO_PROFILE": profile}
+        env.setdefault("DJANGO_ALLOWED_HOSTS", "localhost")
+        command = [
+            sys.executable,
+            str(settings.BASE_DIR / "manage.py"),
+            "bench_sqlite",
+            f"--threads={options['threads']}",
+            f"--operations={options['operations']}",
+            f"--write-ratio={options['write_ratio']}",
+            f"--prefix={options['prefix']}",
+        ]
+        result = subprocess.run(command, env=env, capture_output=True, text=True)
+        if result.returncode:
+            raise CommandError(result.stderr)
+        return json.loads(result.stdout)
+
+    def run(self, options):
+        users = list(User.objects.filter(username__startswith=options["prefix"]))
+        if not users:
+            raise CommandError("先に manage.py seed_bench を実行してください")
+        threads = max(1, options["threads"])
+
+        def worker(seed):
+            rng = random.Random(seed)
+            reads, writes, created = [], [], []
+            locked = 0
+            for _ in range(options["operations"]):
+                user = rng.choice(users)
+                start = time.perf_counter()
+                try:
+                    if rng.random() < options["write_ratio"]:
+                        created.append(self.write(user))
+                        writes.append((time.perf_counter() - start) * 1000)
+                    else:
+                        self.read(user.pk)
+                        reads.append((time.perf_counter() - start) * 1000)
+                except OperationalError as e:
+                    if not is_locked(e):
+                        raise
+                    locked += 1
+            return reads, writes, created, locked
+
+        start = time.perf_counter()
+        results = run_threads(worker, range(threads))
+        elapsed = time.perf_counter() - start
+
+        reads = [ms for result in results for ms in result[0]]
+        writes = [ms for result in results for ms in result[1]]
+        created = [tweet for result in results for tweet in result[2]]
+        self.cleanup(created)
+
+        with connection.cursor() as cursor:
+            cursor.execute("PRAGMA journal_mode")
+            journal_mode = cursor.fetchone()[0]
+        return {
+            "profile": "production" if settings.PRODUCTION else "default",
+            "journal_mode": journal_mode,
+            "threads": threads,
+            "operations_per_sec": round((len(reads) + len(writes)) / elapsed, 1),
+            "reads": len(reads),
+            "writes": len(writes),
+            "locked_errors": sum(result[3] for result in results),
+            "read_p95_ms": round(percentile(reads, 95), 3) if reads else None,
+            "write_p95_ms": round(percentile(writes, 95), 3) if writes else None,
+        }
+
+    @staticmethod
+    def read(user_id):
+        entries = TimelineEntry.objects.filter(owner_id=user_id).select_related("tweet__user")
+        return KeysetPaginator(entries, 20, keys=("created_at", "tweet_id")).paginate()
+
+    @staticmethod
+    def write(user):
+        # ビューと同じ処理で投稿する
+        return posting.post(Tweet(user=user, body="bench_sqlite"))
+
+    @staticmethod
+    def cleanup(created):
+        # 計測で投稿したツイートを、ツイート数のカウンタも含めてビューと同じ処理で消す
+        for tweet in created:
+            posting.delete(tweet)
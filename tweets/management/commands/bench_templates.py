@@ -0,0 +1,57 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.template import engines
+
+from tweets import fragment_cache
+from tweets.management.commands.bench import emit_report
+from tweets.models import Tweet
+
+TEMPLATES = {
+    # 行ごとに include する、断片キャッシュ導入前の描画
+    "include": '{% for tweet in tweets %}{% include "tweets/tweet_overview.html" %}{% endfor %}',
+    # 行ごとにキャッシュを引くタグ
+    "tweet_overview": "{% load tweet_tags %}{% for tweet in tweets %}{% tweet_overview tweet %}{% endfor %}",
+    # 一覧をまとめて描画するタグ
+    "tweet_list": "{% load tweet_tags %}{% tweet_list tweets %}",
+}
+
+
+class Command(BaseCommand):
+    help = "ツイートの一覧の描画方法ごとに、キャッシュが空のときと温まっているときの描画時間を測る"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--tweets", type=int, default=1000, help="一度に描画するツイート数")
+        parser.add_argument("--repeat", type=int, default=5, help="描画方法ごとの計測回数 (中央値を出力する)")
+        parser.add_argument("--output", help="結果の JSON を書き出すファイル (省略時は標準出力)")
+
+    def handle(self, *args, **options):
+        tweets = list(Tweet.objects.select_related("user").order_by("-created_at", "-id")[: options["tweets"]])
+        if len(tweets) < options["tweets"]:
+            raise CommandError("ツイートが足りません。先に manage.py seed_bench を実行してください")
+        keys = [fragment_cache.cache_key(tweet) for tweet in tweets]
+        engine = engines["django"]
+
+        results = {}
+        for name, source in TEMPLATES.items():
+            template = engine.from_string(source)
+            cold, warm = [], []
+            for _ in range(max(1, options["repeat"])):
+                # 計測対象の断片だけを消し、他の断片のキャッシュには触れない
+                fragment_cache.get_cache().delete_many(keys)
+                cold.append(self.timed(template, tweets))
+                warm.append(self.timed(template, tweets))
+            results[name] = {
+                "cold_ms": round(statistics.median(cold), 3),
+                "warm_ms": round(statistics.median(warm), 3),
+            }
+
+        report = {"tweets": len(tweets), "results": results}
+        emit_report(self, report, options)
+
+    @staticmethod
+    def timed(template, tweets):
+        start = time.perf_counter()
+        template.render({"tweets": tweets})
+        return (time.perf_counter() - start) * 1000
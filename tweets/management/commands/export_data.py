@@ -0,0 +1,53 @@
+import time
+from functools import partial
+from itertools import chain
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+
+from tweets import transfer
+
+
+class Command(BaseCommand):
+    help = "ユーザー・ツイート・フォロー関係を gzip で圧縮した JSONL または CSV に書き出す"
+
+    def add_arguments(self, parser):
+        parser.add_argument("directory", help="書き出す先のディレクトリ")
+        parser.add_argument("--format", choices=transfer.FORMATS, default="jsonl")
+        parser.add_argument("--batch-size", type=int, default=5000, help="1 回の SELECT で読む行数")
+
+    def handle(self, *args, directory, format, batch_size, **options):
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        for name, (model, fields) in transfer.TABLES.items():
+            start = time.perf_counter()
+            rows = self.rows(model, fields, batch_size)
+            if name in transfer.ARCHIVES:
+                # アーカイブへ移している途中で両方にあるツイートは、元のテーブルの方だけを書き出す
+                rows = chain(
+                    rows,
+                    self.rows(transfer.ARCHIVES[name], fields, batch_size, exclude=partial(self.existing_pks, model)),
+                )
+            count = transfer.write_rows(transfer.path_for(directory, name, format), format, fields, rows)
+            elapsed = time.perf_counter() - start
+            self.stdout.write(f"{name}: {count} 行 ({elapsed:.2f} 秒, {count / elapsed:.0f} 行/秒)")
+        self.stdout.write(self.style.SUCCESS(f"{directory} に書き出しました"))
+
+    @staticmethod
+    def rows(model, fields, batch_size, exclude=None):
+        """exclude は主キーのリストを受け取り、そのうち書き出さないものの集合を返す関数。"""
+        # 主キーの範囲で batch_size 行ずつ読み、全件をメモリに載せず、長い読み取りトランザクションも開かない
+        last_pk = 0
+        while True:
+            rows = list(model.objects.filter(pk__gt=last_pk).order_by("pk").values_list("pk", *fields)[:batch_size])
+            if not rows:
+                break
+            last_pk = rows[-1][0]
+            excluded = exclude([row[0] for row in rows]) if exclude else ()
+            for row in rows:
+                if row[0] not in excluded:
+                    yield row[1:]
+
+    @staticmethod
+    def existing_pks(model, pks):
+        return set(model.objects.filter(pk__in=pks).values_list("pk", flat=True))
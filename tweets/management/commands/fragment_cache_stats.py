@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from tweets import fragment_cache
+
+
+class Command(BaseCommand):
+    help = "ツイート断片キャッシュのヒット率を表示する"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--reset", action="store_true", help="表示したあと集計を 0 に戻す")
+
+    def handle(self, *args, reset, **options):
+        shared = fragment_cache.stats.shared()
+        rate = fragment_cache.hit_rate(shared["hits"], shared["misses"])
+        self.stdout.write(f"hits: {shared['hits']}  misses: {shared['misses']}  hit rate: {rate:.1%}")
+        if reset:
+            fragment_cache.stats.reset()
@@ -0,0 +1,134 @@
+import time
+from contextlib import nullcontext
+from pathlib import Path
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from accounts.models import FriendShip
+from tweets import transfer
+from tweets.models import Tweet
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        "export_data で書き出したユーザー・ツイート・フォロー関係を読み込む。"
+        "ユーザーには新しい ID を振り、ツイートの投稿者とフォロー関係をその ID に付け替える"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("directory", help="export_data で書き出したディレクトリ")
+        parser.add_argument("--format", choices=transfer.FORMATS, default="jsonl")
+        parser.add_argument("--batch-size", type=int, default=1000, help="1 回の INSERT で書き込む行数")
+        parser.add_argument("--chunk-size", type=int, default=50000, help="1 回のトランザクションで書き込む行数")
+        parser.add_argument(
+            "--defer-indexes",
+            action="store_true",
+            help="ツイートとフォロー関係の索引を消してから読み込み、最後に作り直す (サイトを止めて使う)",
+        )
+        parser.add_argument(
+            "--merge-existing",
+            action="store_true",
+            help="ユーザー名が既にあるユーザーを作らず、そのユーザーにツイートとフォロー関係を付け替える",
+        )
+
+    def handle(self, *args, directory, format, batch_size, chunk_size, defer_indexes, merge_existing, **options):
+        directory = Path(directory)
+        paths = {name: transfer.path_for(directory, name, format) for name in transfer.TABLES}
+        missing = [str(path) for path in paths.values() if not path.exists()]
+        if missing:
+            raise CommandError(f"ファイルがありません: {', '.join(missing)}")
+        if not merge_existing:
+            # 別人のアカウントに読み込んでしまわないよう、書き込みを始める前に確かめる
+            existing = self.existing_usernames(paths["users"], format, chunk_size)
+            if existing:
+                raise CommandError(
+                    f"ユーザー名が既にあるユーザーが {len(existing)} 人います ({', '.join(existing[:10])} など)。"
+                    "既にあるユーザーに付け替えるなら --merge-existing を指定してください"
+                )
+
+        self.batch_size = batch_size
+        # 書き出し元のユーザー ID から、読み込んだ先のユーザー ID への対応表
+        self.user_ids = {}
+        loaders = {"users": self.load_users, "tweets": self.load_tweets, "follows": self.load_follows}
+        with transfer.deferred_indexes(Tweet, FriendShip) if defer_indexes else nullcontext():
+            for name, (model, fields) in transfer.TABLES.items():
+                start = time.perf_counter()
+                loaded = skipped = 0
+                for chunk in transfer.batched(transfer.read_rows(paths[name], format, model, fields), chunk_size):
+                    # チャンクごとにコミットして、書き込みのロックを長く握らない
+                    with transaction.atomic():
+                        count = loaders[name](chunk)
+                    loaded += count
+                    skipped += len(chunk) - count
+                elapsed = time.perf_counter() - start
+                rate = (loaded + skipped) / elapsed
+                self.stdout.write(f"{name}: {loaded} 行, スキップ {skipped} 行 ({elapsed:.2f} 秒, {rate:.0f} 行/秒)")
+
+        call_command("recount", stdout=self.stdout)
+        self.stdout.write(
+            self.style.SUCCESS(
+                "読み込みました。rebuild_timelines と compute_suggestions でタイムラインとおすすめを作り直してください"
+            )
+        )
+
+    @staticmethod
+    def existing_usernames(path, format, chunk_size):
+        model, fields = transfer.TABLES["users"]
+        usernames = []
+        for chunk in transfer.batched(transfer.read_rows(path, format, model, fields), chunk_size):
+            usernames += User.objects.filter(username__in=[row["username"] for row in chunk]).values_list(
+                "username", flat=True
+            )
+        return sorted(usernames)
+
+    def load_users(self, rows):
+        """
+        ユーザー名が既にあるユーザーは作らずにそのユーザーに対応付け、作ったユーザーの数を返す。
+        --merge-existing を指定しないときは handle() で先に断っているので、既にあるユーザーはいない。
+        """
+        existing = dict(
+            User.objects.filter(username__in=[row["username"] for row in rows]).values_list("username", "pk")
+        )
+        users = User.objects.bulk_create(
+            [
+                User(**{field: value for field, value in row.items() if field != "id"})
+                for row in rows
+                if row["username"] not in existing
+            ],
+            batch_size=self.batch_size,
+        )
+        existing.update((user.username, user.pk) for user in users)
+        for row in rows:
+            self.user_ids[row["id"]] = existing[row["username"]]
+        return len(users)
+
+    def load_tweets(self, rows):
+        # ツイートの ID は引き継がず、投稿者が読み込まれていないツイートは捨てる
+        tweets = [
+            Tweet(user_id=self.user_ids[row["user_id"]], body=row["body"], created_at=row["created_at"])
+            for row in rows
+            if row["user_id"] in self.user_ids
+        ]
+        Tweet.objects.bulk_create(tweets, batch_size=self.batch_size)
+        return len(tweets)
+
+    def load_follows(self, rows):
+        friend_ships = [
+            FriendShip(
+                follower_id=self.user_ids[row["follower_id"]],
+                followee_id=self.user_ids[row["followee_id"]],
+                created_at=row["created_at"],
+            )
+            for row in rows
+            if row["follower_id"] in self.user_ids and row["followee_id"] in self.user_ids
+        ]
+        # 既にあるフォロー関係は一意制約で読み飛ばすので、書き込めた行数は前後の行数の差で数える
+        friend_ships_of = FriendShip.objects.filter(follower_id__in={row.follower_id for row in friend_ships})
+        before = friend_ships_of.count()
+        FriendShip.objects.bulk_create(friend_ships, batch_size=self.batch_size, ignore_conflicts=True)
+        return friend_ships_of.count() - before
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from tweets.models import Tweet
+from tweets.search import TABLE
+
+
+class Command(BaseCommand):
+    help = "ツイート本文の全文検索索引を作り直す。テーブルを主キー順に batch-size 件ずつ読み込み、最後にまとめてコミットする"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, batch_size, **options):
+        # 空にしてから読み込み終えるまでを 1 つのトランザクションにする。途中でツイートが削除されると、
+        # トリガーが索引に無い行の 'delete' を発行して外部コンテンツ型の索引が壊れるため、その間の書き込みを待たせる
+        indexed = 0
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {TABLE}({TABLE}) VALUES ('delete-all')")
+            last_pk = 0
+            while True:
+                rows = list(Tweet.objects.filter(pk__gt=last_pk).order_by("pk").values_list("pk", "body")[:batch_size])
+                if not rows:
+                    break
+                last_pk = rows[-1][0]
+                cursor.executemany(f"INSERT INTO {TABLE}(rowid, body) VALUES (%s, %s)", rows)
+                indexed += len(rows)
+
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {TABLE}({TABLE}) VALUES ('optimize')")
+        self.stdout.write(self.style.SUCCESS(f"{indexed} 件のツイートを索引しました"))
@@ -0,0 +1,26 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from tweets import timeline
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = "フォロー関係からホームタイムラインを作り直す"
+
+    def add_arguments(self, parser):
+        parser.add_argument("usernames", nargs="*", help="対象のユーザー (省略時は全員)")
+
+    def handle(self, *args, usernames, **options):
+        users = User.objects.order_by("pk")
+        if usernames:
+            users = users.filter(username__in=usernames)
+
+        count = 0
+        for user_id in users.values_list("pk", flat=True).iterator():
+            with transaction.atomic():
+                timeline.rebuild(user_id)
+            count += 1
+        self.stdout.write(self.style.SUCCESS(f"{count} 人のタイムラインを作り直しました"))
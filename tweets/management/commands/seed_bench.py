@@ -0,0 +1,98 @@
+import random
+from datetime import timedelta
+from itertools import accumulate
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from accounts.models import FriendShip
+from tweets.models import Tweet
+
+User = get_user_model()
+
+BENCH_PASSWORD = "bench!@#$1234"
+
+
+def zipf_weights(size, alpha):
+    return list(accumulate(1 / (rank + 1) ** alpha for rank in range(size)))
+
+
+class Command(BaseCommand):
+    help = "ベンチマーク用に大量のユーザー・ツイート・べき乗則に従うフォロー関係を作る"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=1000)
+        parser.add_argument("--tweets", type=int, default=20000)
+        parser.add_argument("--follows", type=int, default=20, help="1 人あたりの平均フォロー数")
+        parser.add_argument("--alpha", type=float, default=1.1, help="人気度の Zipf 分布の指数")
+        parser.add_argument("--days", type=int, default=30, help="ツイートの投稿日時をばらつかせる日数")
+        parser.add_argument("--prefix", default="bench")
+        parser.add_argument("--batch-size", type=int, default=2000)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        prefix = options["prefix"]
+        if User.objects.filter(username__startswith=prefix).exists():
+            raise CommandError(f"ユーザー名が {prefix} で始まるユーザーがすでに存在します")
+
+        rng = random.Random(options["seed"])
+        batch_size = options["batch_size"]
+
+        password = make_password(BENCH_PASSWORD)
+        User.objects.bulk_create(
+            (
+                User(username=f"{prefix}{index}", email=f"{prefix}{index}@example.com", password=password)
+                for index in range(options["users"])
+            ),
+            batch_size=batch_size,
+        )
+        user_ids = list(User.objects.filter(username__startswith=prefix).values_list("pk", flat=True))
+        # 人気度 (フォローされやすさ・投稿の多さ) の順位をユーザーに割り当てる
+        ranked = user_ids[:]
+        rng.shuffle(ranked)
+        weights = zipf_weights(len(ranked), options["alpha"])
+        self.stdout.write(f"users: {len(user_ids)}")
+
+        follows = 0
+        for follower_ids in self.batched(user_ids, batch_size):
+            friend_ships = []
+            for follower_id in follower_ids:
+                # フォロー数は平均 --follows の指数分布に従わせる
+                count = int(rng.expovariate(1 / options["follows"])) if options["follows"] else 0
+                followee_ids = set(rng.choices(ranked, cum_weights=weights, k=count)) - {follower_id}
+                friend_ships += [
+                    FriendShip(follower_id=follower_id, followee_id=followee_id) for followee_id in followee_ids
+                ]
+            with transaction.atomic():
+                FriendShip.objects.bulk_create(friend_ships, ignore_conflicts=True)
+            follows += len(friend_ships)
+        self.stdout.write(f"follows: {follows}")
+
+        now = timezone.now()
+        span = timedelta(days=options["days"]).total_seconds()
+        for start in range(0, options["tweets"], batch_size):
+            size = min(batch_size, options["tweets"] - start)
+            authors = rng.choices(ranked, cum_weights=weights, k=size)
+            with transaction.atomic():
+                Tweet.objects.bulk_create(
+                    Tweet(
+                        user_id=author_id,
+                        body=f"bench tweet {start + index}",
+                        created_at=now - timedelta(seconds=rng.uniform(0, span)),
+                    )
+                    for index, author_id in enumerate(authors)
+                )
+        self.stdout.write(f"tweets: {options['tweets']}")
+
+        call_command("recount", stdout=self.stdout)
+        call_command("rebuild_timelines", stdout=self.stdout)
+        self.stdout.write(self.style.SUCCESS(f"パスワード {BENCH_PASSWORD} でログインできます"))
+
+    @staticmethod
+    def batched(items, size):
+        for start in range(0, len(items), size):
+            yield items[start : start + size]
@@ -0,0 +1,55 @@
+from django.db import migrations
+
+# 外部コンテンツ型の FTS5 テーブル。本文は tweets_tweet にだけ持ち、索引はトリガーで同期する
+CREATE_SQL = [
+    """
+    CREATE VIRTUAL TABLE tweets_tweet_fts USING fts5(
+        body, content='tweets_tweet', content_rowid='id', tokenize='trigram'
+    )
+    """,
+    """
+    CREATE TRIGGER tweets_tweet_fts_insert AFTER INSERT ON tweets_tweet BEGIN
+        INSERT INTO tweets_tweet_fts(rowid, body) VALUES (new.id, new.body);
+    END
+    """,
+    """
+    CREATE TRIGGER tweets_tweet_fts_delete AFTER DELETE ON tweets_tweet BEGIN
+        INSERT INTO tweets_tweet_fts(tweets_tweet_fts, rowid, body) VALUES ('delete', old.id, old.body);
+    END
+    """,
+    """
+    CREATE TRIGGER tweets_tweet_fts_update AFTER UPDATE OF body ON tweets_tweet BEGIN
+        INSERT INTO tweets_tweet_fts(tweets_tweet_fts, rowid, body) VALUES ('delete', old.id, old.body);
+        INSERT INTO tweets_tweet_fts(rowid, body) VALUES (new.id, new.body);
+    END
+    """,
+    "INSERT INTO tweets_tweet_fts(tweets_tweet_fts) VALUES ('rebuild')",
+]
+
+DROP_SQL = [
+    "DROP TRIGGER IF EXISTS tweets_tweet_fts_update",
+    "DROP TRIGGER IF EXISTS tweets_tweet_fts_delete",
+    "DROP TRIGGER IF EXISTS tweets_tweet_fts_insert",
+    "DROP TABLE IF EXISTS tweets_tweet_fts",
+]
+
+
+def run(statements):
+    def operation(apps, schema_editor):
+        if schema_editor.connection.vendor != "sqlite":
+            return
+        for sql in statements:
+            schema_editor.execute(sql)
+
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tweets", "0004_tweet_created_at_default"),
+    ]
+
+    operations = [
+        migrations.RunPython(run(CREATE_SQL), run(DROP_SQL)),
+    ]
@@ -0,0 +1,74 @@
+# Generated by Django 4.2.30 on 2026-10-18 03:11
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+# アーカイブしたツイートの全文検索索引。tweets_tweet_fts と同じく外部コンテンツ型で、トリガーで同期する
+CREATE_SQL = [
+    """
+    CREATE VIRTUAL TABLE tweets_archivedtweet_fts USING fts5(
+        body, content='tweets_archivedtweet', content_rowid='id', tokenize='trigram'
+    )
+    """,
+    """
+    CREATE TRIGGER tweets_archivedtweet_fts_insert AFTER INSERT ON tweets_archivedtweet BEGIN
+        INSERT INTO tweets_archivedtweet_fts(rowid, body) VALUES (new.id, new.body);
+    END
+    """,
+    """
+    CREATE TRIGGER tweets_archivedtweet_fts_delete AFTER DELETE ON tweets_archivedtweet BEGIN
+        INSERT INTO tweets_archivedtweet_fts(tweets_archivedtweet_fts, rowid, body) VALUES ('delete', old.id, old.body);
+    END
+    """,
+]
+
+DROP_SQL = [
+    "DROP TRIGGER IF EXISTS tweets_archivedtweet_fts_delete",
+    "DROP TRIGGER IF EXISTS tweets_archivedtweet_fts_insert",
+    "DROP TABLE IF EXISTS tweets_archivedtweet_fts",
+]
+
+
+def run(statements):
+    def operation(apps, schema_editor):
+        if schema_editor.connection.vendor != "sqlite":
+            return
+        for sql in statements:
+            schema_editor.execute(sql)
+
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("tweets", "0006_like"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ArchivedTweet",
+            fields=[
+                ("id", models.BigIntegerField(primary_key=True, serialize=False)),
+                ("created_at", models.DateTimeField()),
+                ("body", models.TextField(max_length=140)),
+                ("likes_count", models.PositiveIntegerField(default=0)),
+                (
+                    "user",
+                    models.ForeignKey(
+                        db_constraint=False,
+                        on_delete=django.db.models.deletion.DO_NOTHING,
+                        related_name="+",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [models.Index(fields=["user", "-created_at", "-id"], name="archived_tweet_user_idx")],
+            },
+        ),
+        # ArchivedTweet と同じデータベースにだけ作る (mysite.routers)
+        migrations.RunPython(run(CREATE_SQL), run(DROP_SQL), hints={"model_name": "archivedtweet"}),
+    ]
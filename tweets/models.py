@@ -1,15 +1,84 @@
 from django.conf import settings
 from django.db import models
 from django.urls import reverse
+from django.utils import timezone
 
 
 class Tweet(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
-    created_at = models.DateTimeField(auto_now_add=True)
+    created_at = models.DateTimeField(default=timezone.now)
     body = models.TextField(max_length=140)
 
+    is_archived = False
+
+    class Meta:
+        indexes = [models.Index(fields=["user", "-created_at", "-id"], name="tweet_user_created_idx")]
+
     def __str__(self):
         return f"{self.user.username}'s post"
 
     def get_absolute_url(self):
         return reverse("tweets:detail", kwargs={"pk": self.pk})
+
+
+class ArchivedTweet(models.Model):
+    """
+    archive_tweets コマンドで Tweet から移した古いツイート。ID は元のツイートのものを引き継ぐ。
+    settings.ARCHIVE_DATABASE (mysite.routers) に置き、別のデータベースでもよいようにユーザーへの外部キー制約は張らない。
+    """
+
+    id = models.BigIntegerField(primary_key=True)
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, related_name="+", on_delete=models.DO_NOTHING, db_constraint=False
+    )
+    created_at = models.DateTimeField()
+    body = models.TextField(max_length=140)
+    # 移した時点のいいね数。アーカイブしたツイートにはいいねできない
+    likes_count = models.PositiveIntegerField(default=0)
+
+    is_archived = True
+    liked = False
+
+    class Meta:
+        indexes = [models.Index(fields=["user", "-created_at", "-id"], name="archived_tweet_user_idx")]
+
+    def __str__(self):
+        return f"{self.user.username}'s archived post"
+
+    def get_absolute_url(self):
+        return reverse("tweets:detail", kwargs={"pk": self.pk})
+
+
+class TimelineEntry(models.Model):
+    # タイムラインの持ち主
+    owner = models.ForeignKey(settings.AUTH_USER_MODEL, related_name="+", on_delete=models.CASCADE)
+    tweet = models.ForeignKey(Tweet, related_name="+", on_delete=models.CASCADE)
+    # 並び替えのために Tweet.created_at を複製して持つ
+    created_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=["owner", "tweet"], name="unique_timeline_entry")]
+        indexes = [models.Index(fields=["owner", "-created_at", "-tweet"], name="timeline_owner_created_idx")]
+
+
+class Like(models.Model):
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, related_name="+", on_delete=models.CASCADE)
+    tweet = models.ForeignKey(Tweet, related_name="+", on_delete=models.CASCADE)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=["user", "tweet"], name="unique_like")]
+
+
+class LikeCounterShard(models.Model):
+    """
+    ツイートのいいね数を settings.LIKE_COUNTER_SHARDS 行に分けて持つ。いいねのたびにランダムな 1 行だけを更新するので、
+    同じツイートへの同時のいいねが 1 行の更新を待ち合わせない。いいね数は全ての行の count の合計。
+    """
+
+    tweet = models.ForeignKey(Tweet, related_name="+", on_delete=models.CASCADE)
+    shard = models.PositiveSmallIntegerField()
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=["tweet", "shard"], name="unique_like_counter_shard")]
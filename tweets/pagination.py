@@ -0,0 +1,162 @@
+import base64
+import heapq
+import json
+from dataclasses import dataclass
+from datetime import datetime
+from itertools import groupby, islice
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from django.http import Http404
+
+NEXT = "n"
+PREV = "p"
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+def encode_cursor(direction, values):
+    payload = [direction] + [{"dt": value.isoformat()} if isinstance(value, datetime) else value for value in values]
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor, converters):
+    """converters はキーごとに値を検査して変換する関数 (モデルのフィールドの to_python など)。"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        direction, *values = json.loads(raw)
+        values = [datetime.fromisoformat(value["dt"]) if isinstance(value, dict) else value for value in values]
+        if direction not in (NEXT, PREV) or len(values) != len(converters) or None in values:
+            raise InvalidCursor(cursor)
+        return direction, [convert(value) for convert, value in zip(converters, values)]
+    except (ValueError, TypeError, KeyError, ValidationError):
+        raise InvalidCursor(cursor)
+
+
+@dataclass
+class KeysetPage:
+    object_list: list
+    next_cursor: str = None
+    prev_cursor: str = None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.prev_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class KeysetPaginator:
+    """
+    (created_at, id) のような単調なキーの降順でページングする。
+    OFFSET を使わないので、何ページ目でもインデックスの範囲検索 1 回で済む。
+    """
+
+    def __init__(self, queryset, page_size, keys=("created_at", "id")):
+        self.queryset = queryset
+        self.page_size = page_size
+        self.keys = keys
+
+    def get_queryset(self, cursor=None):
+        """1 件多く取得して次のページの有無を判定する。"""
+        if not cursor:
+            return NEXT, self.queryset.order_by(*(f"-{key}" for key in self.keys))[: self.page_size + 1]
+
+        direction, values = decode_cursor(cursor, self.key_converters())
+        lookup = "lt" if direction == NEXT else "gt"
+        condition = Q()
+        for index, key in enumerate(self.keys):
+            condition |= Q(**dict(zip(self.keys[:index], values[:index])), **{f"{key}__{lookup}": values[index]})
+        # 先頭キーの範囲条件を AND で明示し、SQLite がインデックスで範囲を絞れるようにする
+        queryset = self.queryset.filter(**{f"{self.keys[0]}__{lookup}e": values[0]}).filter(condition)
+        if direction == NEXT:
+            ordering = [f"-{key}" for key in self.keys]
+        else:
+            ordering = list(self.keys)
+        return direction, queryset.order_by(*ordering)[: self.page_size + 1]
+
+    def key_converters(self):
+        # .values() のクエリセットでも model は元のモデルを指す。get_field は tweet_id のような attname も引ける
+        return [self.queryset.model._meta.get_field(key).to_python for key in self.keys]
+
+    def build_page(self, direction, rows, cursor=None):
+        rows = list(rows)
+        has_more = len(rows) > self.page_size
+        rows = rows[: self.page_size]
+        if direction == PREV:
+            rows.reverse()
+            has_next, has_prev = True, has_more
+        else:
+            has_next, has_prev = has_more, bool(cursor)
+
+        page = KeysetPage(rows)
+        if rows and has_next:
+            page.next_cursor = encode_cursor(NEXT, self.key_values(rows[-1]))
+        if rows and has_prev:
+            page.prev_cursor = encode_cursor(PREV, self.key_values(rows[0]))
+        return page
+
+    def key_values(self, row):
+        # .values() で取得した行は dict になる
+        if isinstance(row, dict):
+            return [row[key] for key in self.keys]
+        return [getattr(row, key) for key in self.keys]
+
+    def paginate(self, cursor=None):
+        direction, queryset = self._get_queryset_or_404(cursor)
+        return self.build_page(direction, queryset, cursor)
+
+    async def apaginate(self, cursor=None):
+        direction, queryset = self._get_queryset_or_404(cursor)
+        return self.build_page(direction, [row async for row in queryset.aiterator()], cursor)
+
+    def _get_queryset_or_404(self, cursor):
+        try:
+            return self.get_queryset(cursor)
+        except InvalidCursor:
+            raise Http404("不正なカーソルです")
+
+
+class MergedKeysetPaginator(KeysetPaginator):
+    """
+    同じキーを持つ複数のクエリセット (別のデータベースのものでもよい) を、1 つの列としてページングする。
+    それぞれからカーソルの先の page_size + 1 件を読み、キーの順に併合する。
+    キーが同じ行 (アーカイブへ移している途中で両方にあるツイートなど) は、先に渡したクエリセットのものだけを残す。
+    """
+
+    def __init__(self, querysets, page_size, keys=("created_at", "id")):
+        super().__init__(querysets[0], page_size, keys)
+        self.querysets = querysets
+
+    def get_queryset(self, cursor=None):
+        pairs = [
+            KeysetPaginator(queryset, self.page_size, self.keys).get_queryset(cursor) for queryset in self.querysets
+        ]
+        return pairs[0][0], [queryset for _, queryset in pairs]
+
+    def merge(self, direction, row_lists):
+        # heapq.merge は同じキーの行を渡した順に隣り合わせて並べる
+        rows = heapq.merge(*row_lists, key=self.key_values, reverse=direction == NEXT)
+        unique = (next(group) for _, group in groupby(rows, key=self.key_values))
+        return list(islice(unique, self.page_size + 1))
+
+    def paginate(self, cursor=None):
+        direction, querysets = self._get_queryset_or_404(cursor)
+        return self.build_page(direction, self.merge(direction, [list(queryset) for queryset in querysets]), cursor)
+
+    async def apaginate(self, cursor=None):
+        direction, querysets = self._get_queryset_or_404(cursor)
+        row_lists = [[row async for row in queryset.aiterator()] for queryset in querysets]
+        return self.build_page(direction, self.merge(direction, row_lists), cursor)
@@ -0,0 +1,38 @@
+from django.contrib.auth import get_user_model
+from django.db import router, transaction
+from django.db.models import F
+
+from accounts import user_cache
+from jobs import queue
+from tweets import fragment_cache, pubsub, timeline
+
+User = get_user_model()
+
+
+def post(tweet):
+    """
+    保存前の Tweet を保存し、投稿者のツイート数とタイムラインを更新する。
+    投稿後のリダイレクト先ですぐに見えるよう、投稿者本人のタイムラインにはここで書き込む。
+    フォロワーが多いと時間がかかるので、フォロワーへの配信はワーカーに任せる。
+    """
+    with transaction.atomic():
+        tweet.save()
+        User.objects.filter(pk=tweet.user_id).update(tweets_count=F("tweets_count") + 1)
+        user_cache.invalidate(tweet.user_id)
+        timeline.add_own(tweet)
+        queue.enqueue("tweets.fan_out", tweet_id=tweet.pk)
+        transaction.on_commit(lambda: pubsub.publish_tweet(tweet))
+    return tweet
+
+
+def delete(tweet):
+    """
+    ツイート (アーカイブに移した ArchivedTweet でもよい) を削除し、投稿者のツイート数を減らす。
+    Tweet のタイムラインの行といいねは外部キーで一緒に消える。
+    """
+    fragment_cache.invalidate(tweet)
+    # アーカイブは別のデータベースにありうるので、ツイートを消す側のトランザクションも張る
+    with transaction.atomic(), transaction.atomic(using=router.db_for_write(type(tweet)), savepoint=False):
+        tweet.delete()
+        User.objects.filter(pk=tweet.user_id, tweets_count__gt=0).update(tweets_count=F("tweets_count") - 1)
+        user_cache.invalidate(tweet.user_id)
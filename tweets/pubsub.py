@@ -0,0 +1,124 @@
+import asyncio
+import json
+import threading
+from collections import deque
+from dataclasses import dataclass
+
+from django.core.handlers.asgi import ASGIRequest
+
+from tweets import fragment_cache
+
+
+@dataclass(frozen=True)
+class Event:
+    id: int
+    author_id: int
+    name: str
+    data: str
+
+    def encode(self):
+        return f"id: {self.id}\nevent: {self.name}\ndata: {self.data}\n\n"
+
+
+class Subscription:
+    """
+    接続 1 本ぶんの受信キュー。イベントループ上で読み、publish() からは call_soon_threadsafe で書き込む。
+    キューが溢れたら残りを捨てて None を入れ、ストリームを閉じる (再接続時に Last-Event-ID から再送される)。
+    """
+
+    def __init__(self, broker, user_ids, queue_size):
+        self.broker = broker
+        self.user_ids = frozenset(user_ids)
+        self.queue = asyncio.Queue(queue_size)
+        self.loop = asyncio.get_running_loop()
+
+    def deliver(self, event):
+        if self.queue.full():
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(None)
+            self.broker.unsubscribe(self)
+        else:
+            self.queue.put_nowait(event)
+
+    async def get(self):
+        return await self.queue.get()
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class Broker:
+    """
+    プロセス内のツイート配信。購読者は自分とフォロー中のユーザーの ID を渡し、投稿者 ID で振り分ける。
+    直近 history 件のイベントを残しておき、Last-Event-ID より後のものを再接続時に再送する。
+    """
+
+    def __init__(self, history=1000, queue_size=100):
+        self.queue_size = queue_size
+        self._lock = threading.Lock()
+        self._history = deque(maxlen=history)
+        self._last_id = 0
+        self._by_author = {}
+
+    def subscribe(self, user_ids, last_event_id=None):
+        """(購読, 再送するイベントのリスト, 取りこぼしがあるか) を返す。"""
+        subscription = Subscription(self, user_ids, self.queue_size)
+        with self._lock:
+            for user_id in subscription.user_ids:
+                self._by_author.setdefault(user_id, set()).add(subscription)
+            if last_event_id is None:
+                return subscription, [], False
+            replay = [
+                event
+                for event in self._history
+                if event.id > last_event_id and event.author_id in subscription.user_ids
+            ]
+            oldest = self._history[0].id if self._history else self._last_id + 1
+            # 再起動で ID が巻き戻った場合や、履歴から押し出された分がある場合
+            missed = last_event_id > self._last_id or last_event_id + 1 < oldest
+        return subscription, replay, missed
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for user_id in subscription.user_ids:
+                subscriptions = self._by_author.get(user_id)
+                if subscriptions is None:
+                    continue
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._by_author[user_id]
+
+    def publish(self, author_id, name, data):
+        with self._lock:
+            self._last_id += 1
+            event = Event(self._last_id, author_id, name, data)
+            self._history.append(event)
+            subscriptions = list(self._by_author.get(author_id, ()))
+        for subscription in subscriptions:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.deliver, event)
+            except RuntimeError:
+                # イベントループが既に終了している
+                self.unsubscribe(subscription)
+        return event
+
+    def subscriber_count(self):
+        with self._lock:
+            return len({subscription for subscriptions in self._by_author.values() for subscription in subscriptions})
+
+
+broker = Broker()
+
+
+def is_available(request):
+    """
+    ASGI で動いているときだけ配信できる。WSGI ではレスポンスを返すとビューのイベントループが閉じて publish() から届かず、
+    Django が非同期イテレータを最後まで読んでから返すので、接続が max_duration の間スレッドを塞ぐだけになる。
+    """
+    return isinstance(request, ASGIRequest)
+
+
+def publish_tweet(tweet):
+    data = json.dumps({"id": tweet.pk, "html": fragment_cache.render(tweet)}, ensure_ascii=False)
+    return broker.publish(tweet.user_id, "tweet", data)
@@ -0,0 +1,76 @@
+import heapq
+from collections import namedtuple
+from itertools import islice
+
+from django.db import connections, router
+
+from tweets import archive
+from tweets.models import ArchivedTweet, Tweet
+from tweets.pagination import NEXT, KeysetPaginator, decode_cursor
+
+TABLE = "tweets_tweet_fts"
+# アーカイブしたツイートの索引。ArchivedTweet と同じデータベースにある
+ARCHIVE_TABLE = "tweets_archivedtweet_fts"
+# trigram トークナイザは 3 文字未満の語を索引から引けない
+MIN_TERM_LENGTH = 3
+
+Hit = namedtuple("Hit", ["id", "score"])
+
+
+def match_expression(query):
+    """空白区切りの語をそれぞれフレーズとして AND 検索する式を作る。短すぎる語は使わない。"""
+    terms = [term for term in query.split() if len(term) >= MIN_TERM_LENGTH]
+    return " ".join('"{}"'.format(term.replace('"', '""')) for term in terms)
+
+
+class SearchPaginator(KeysetPaginator):
+    """
+    FTS5 の bm25 の順位と id でキーセットページングする。
+    bm25 は小さいほど関連度が高いので、符号を反転した score の降順に並べる。
+    ツイートとアーカイブの索引を同じ条件で引き、score の順に併合する (ID はアーカイブに移しても変わらない)。
+    """
+
+    def __init__(self, query, page_size):
+        # 索引は元のテーブルと同じデータベースにある。ルーターはレプリカを無作為に選ぶので、
+        # 索引を引くのと行を読むのが同じデータベースになるよう、最初に 1 度だけ選んでおく
+        self.using = router.db_for_read(Tweet)
+        self.archive_using = router.db_for_read(ArchivedTweet)
+        super().__init__(Tweet.objects.using(self.using).select_related("user"), page_size, keys=("score", "id"))
+        self.match = match_expression(query)
+
+    def get_queryset(self, cursor=None):
+        sql = "SELECT id, score FROM (SELECT rowid AS id, -bm25({table}) AS score FROM {table} WHERE {table} MATCH %s)"
+        params = [self.match]
+        direction = NEXT
+        if cursor:
+            direction, (score, pk) = decode_cursor(cursor, (float, int))
+            lookup = "<" if direction == NEXT else ">"
+            sql += f" WHERE score {lookup} %s OR (score = %s AND id {lookup} %s)"
+            params += [score, score, pk]
+        ordering = "DESC" if direction == NEXT else "ASC"
+        sql += f" ORDER BY score {ordering}, id {ordering} LIMIT %s"
+        params.append(self.page_size + 1)
+
+        hits = []
+        for using, table in ((self.using, TABLE), (self.archive_using, ARCHIVE_TABLE)):
+            with connections[using].cursor() as cursor:
+                cursor.execute(sql.format(table=table), params)
+                hits.append([Hit(*row) for row in cursor.fetchall()])
+        if hits[1]:
+            # アーカイブへ移している途中で両方にあるツイートは、ツイートの方だけを残す。
+            # 索引が違えば score も違うので、併合した後では隣り合わず除けない
+            live_ids = set(
+                Tweet.objects.using(self.using).filter(pk__in=[hit.id for hit in hits[1]]).values_list("pk", flat=True)
+            )
+            hits[1] = [hit for hit in hits[1] if hit.id not in live_ids]
+        merged = heapq.merge(*hits, key=lambda hit: (hit.score, hit.id), reverse=direction == NEXT)
+        return direction, list(islice(merged, self.page_size + 1))
+
+    def paginate(self, cursor=None):
+        page = super().paginate(cursor)
+        tweets = self.queryset.in_bulk([hit.id for hit in page])
+        archived_ids = [hit.id for hit in page if hit.id not in tweets]
+        if archived_ids:
+            tweets.update(archive.in_bulk(archived_ids, using=self.archive_using))
+        page.object_list = [tweets[hit.id] for hit in page if hit.id in tweets]
+        return page
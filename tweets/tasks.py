@@ -0,0 +1,12 @@
+from jobs import queue
+from tweets import timeline
+from tweets.models import Tweet
+
+
+@queue.register("tweets.fan_out")
+def fan_out(tweet_id):
+    # 実行までに削除されたツイートは配らない
+    tweet = Tweet.objects.filter(pk=tweet_id).only("user_id", "created_at").first()
+    if tweet is not None:
+        # 投稿者本人の分は投稿したリクエストの中で書き込み済み
+        timeline.fan_out(tweet, include_author=False)
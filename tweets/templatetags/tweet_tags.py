@@ -0,0 +1,17 @@
+from django import template
+from django.utils.safestring import mark_safe
+
+from tweets import fragment_cache
+
+register = template.Library()
+
+
+@register.simple_tag
+def tweet_overview(tweet):
+    return mark_safe(fragment_cache.render(tweet))
+
+
+@register.simple_tag
+def tweet_list(tweets):
+    # 1 件ずつ include やタグを呼ぶと行ごとにキャッシュの往復と Context の生成が発生するので、一覧をまとめて描画する
+    return mark_safe("".join(fragment_cache.render_many(list(tweets))))
@@ -1,8 +1,26 @@
+import asyncio
+import json
+import tempfile
+from io import StringIO
+from pathlib import Path
+from unittest import mock
+
+from asgiref.sync import sync_to_async
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
 from django.urls import reverse
+from django.utils import timezone
 
-from tweets.models import Tweet
+from accounts.models import FriendShip
+from jobs.models import Job
+from mysite.testing import QueryBudgetTestMixin, QueryPlanTestMixin
+from tweets import archive, fragment_cache, likes, pubsub, timeline
+from tweets.management.commands.bench import emit_report, run_threads
+from tweets.models import ArchivedTweet, Like, LikeCounterShard, TimelineEntry, Tweet
+from tweets.pagination import NEXT, encode_cursor
 
 User = get_user_model()
 
@@ -11,6 +29,13 @@ class TestHomeView(TestCase):
     def setUp(self):
         self.url = reverse("tweets:home")
 
+        self.user = User.objects.create_user(
+            username="testuser",
+            email="testuser@example.com",
+            password="asdf!@#$1234",
+        )
+        Tweet.objects.create(user=self.user, body="tweet of testuser")
+
         for user_index in range(3):
             user = User.objects.create_user(
                 username=f"user{user_index}",
@@ -20,20 +45,180 @@ class TestHomeView(TestCase):
 
             for tweet_index in range(3):
                 Tweet.objects.create(user=user, body=f"tweet{tweet_index} of user{user_index}")
-        self.all_tweets = Tweet.objects.select_related("user").order_by("-created_at").all()
 
-        user = User.objects.create_user(
+            # user2 はフォローしない
+            if user_index < 2:
+                self.user.following.add(user)
+        timeline.rebuild(self.user.pk)
+        self.timeline_tweets = (
+            Tweet.objects.select_related("user")
+            .filter(user__username__in=["testuser", "user0", "user1"])
+            .order_by("-created_at")
+        )
+
+        self.client.force_login(self.user)
+
+    def test_success_get(self):
+        response = self.client.get(self.url)
+        self.assertContains(response, "によるツイート", count=len(self.timeline_tweets), status_code=200)
+        self.assertNotContains(response, "of user2")
+        self.assertTemplateUsed(response, "tweets/home.html")
+        self.assertQuerySetEqual(response.context["tweet_list"], self.timeline_tweets)
+
+    def test_success_get_with_cursor(self):
+        user = User.objects.get(username="user0")
+        for tweet in Tweet.objects.bulk_create(Tweet(user=user, body=f"bulk tweet{i}") for i in range(20)):
+            timeline.fan_out(tweet)
+        all_tweets = list(self.timeline_tweets.order_by("-created_at", "-id"))
+
+        response = self.client.get(self.url)
+        page = response.context["page_obj"]
+        self.assertEqual(list(response.context["tweet_list"]), all_tweets[:20])
+        self.assertFalse(page.has_previous())
+        self.assertContains(response, f"?cursor={page.next_cursor}")
+
+        response = self.client.get(self.url, {"cursor": page.next_cursor})
+        page = response.context["page_obj"]
+        self.assertEqual(list(response.context["tweet_list"]), all_tweets[20:])
+        self.assertFalse(page.has_next())
+
+        response = self.client.get(self.url, {"cursor": page.prev_cursor})
+        self.assertEqual(list(response.context["tweet_list"]), all_tweets[:20])
+        self.assertFalse(response.context["page_obj"].has_previous())
+
+    def test_failure_get_with_invalid_cursor(self):
+        response = self.client.get(self.url, {"cursor": "invalid"})
+        self.assertEqual(response.status_code, 404)
+
+    def test_failure_get_with_invalid_cursor_value(self):
+        for values in ([timezone.now(), "invalid"], [timezone.now(), [1]], [timezone.now(), None], ["invalid", 1]):
+            with self.subTest(values=values):
+                response = self.client.get(self.url, {"cursor": encode_cursor(NEXT, values)})
+                self.assertEqual(response.status_code, 404)
+
+    async def test_success_get_via_asgi(self):
+        await sync_to_async(self.async_client.force_login)(self.user)
+        response = await self.async_client.get(self.url)
+        self.assertContains(response, "によるツイート", count=7, status_code=200)
+        self.assertNotContains(response, "of user2")
+
+
+class TestHomeViewQueryPlan(QueryPlanTestMixin, TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
             username="testuser",
             email="testuser@example.com",
             password="asdf!@#$1234",
         )
-        self.client.force_login(user)
+        for tweet in Tweet.objects.bulk_create(Tweet(user=self.user, body=f"tweet{i}") for i in range(30)):
+            timeline.fan_out(tweet)
+        self.client.force_login(self.user)
+
+    def test_home(self):
+        response = self.assertIndexedQueries(reverse("tweets:home"))
+        self.assertIndexedQueries(reverse("tweets:home"), {"cursor": response.context["page_obj"].next_cursor})
+
+
+class TestQueryBudget(QueryBudgetTestMixin, TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username="testuser",
+            email="testuser@example.com",
+            password="asdf!@#$1234",
+        )
+        self.author = User.objects.create_user(
+            username="author",
+            email="author@example.com",
+            password="asdf!@#$1234",
+        )
+        self.user.follow(self.author)
+        self.tweet = Tweet.objects.create(user=self.user, body="tweet of testuser")
+        self.client.force_login(self.user)
+
+    def add_tweets(self, count):
+        for tweet in Tweet.objects.bulk_create(Tweet(user=self.author, body="tweet of author") for _ in range(count)):
+            timeline.fan_out(tweet)
+
+    def test_home(self):
+        self.assertQueryBudget("tweets:home", self.add_tweets)
+
+    def test_create(self):
+        self.assertQueryBudget("tweets:create", self.add_tweets)
+
+    def test_detail(self):
+        self.assertQueryBudget("tweets:detail", self.add_tweets, kwargs={"pk": self.tweet.pk})
+
+    def test_delete(self):
+        self.assertQueryBudget("tweets:delete", self.add_tweets, kwargs={"pk": self.tweet.pk})
+
+    def test_search(self):
+        self.assertQueryBudget("tweets:search", self.add_tweets, data={"q": "author"})
+
+
+class TestTweetOverviewFragmentCache(TestCase):
+    def setUp(self):
+        fragment_cache.get_cache().clear()
+        fragment_cache.stats.reset()
+        self.user = User.objects.create_user(
+            username="testuser",
+            email="testuser@example.com",
+            password="asdf!@#$1234",
+        )
+        self.tweet = Tweet.objects.create(user=self.user, body="tweet of testuser")
+        timeline.fan_out(self.tweet)
+        self.client.force_login(self.user)
+        self.url = reverse("tweets:home")
+
+    def test_success_get_with_cached_fragment(self):
+        self.client.get(self.url)
+        self.assertEqual((fragment_cache.stats.hits, fragment_cache.stats.misses), (0, 1))
 
-    def test_success_get(self):
         response = self.client.get(self.url)
-        self.assertContains(response, "によるツイート", count=len(self.all_tweets), status_code=200)
-        self.assertTemplateUsed(response, "tweets/home.html")
-        self.assertQuerySetEqual(response.context["tweet_list"], self.all_tweets)
+        self.assertContains(response, "tweet of testuser", count=1)
+        self.assertEqual((fragment_cache.stats.hits, fragment_cache.stats.misses), (1, 1))
+
+        fragment_cache.stats.flush()
+        self.assertEqual(fragment_cache.stats.shared(), {"hits": 1, "misses": 1})
+
+    def test_invalidate_on_delete(self):
+        self.client.get(self.url)
+        key = fragment_cache.cache_key(self.tweet)
+        self.assertIsNotNone(fragment_cache.get_cache().get(key))
+
+        self.client.post(reverse("tweets:delete", kwargs={"pk": self.tweet.pk}))
+        self.assertIsNone(fragment_cache.get_cache().get(key))
+
+    def test_invalidate_on_username_change(self):
+        self.client.get(self.url)
+
+        user = User.objects.get(pk=self.user.pk)
+        user.username = "renamed"
+        user.save()
+
+        response = self.client.get(self.url)
+        self.assertContains(response, "renamed</a>によるツイート", count=1)
+        self.assertEqual(fragment_cache.stats.misses, 2)
+
+    def test_render_many_with_one_cache_round_trip(self):
+        tweets = [self.tweet, Tweet.objects.create(user=self.user, body="second tweet of testuser")]
+        fragment_cache.render(tweets[0])
+        fragment_cache.stats.reset()
+
+        html = fragment_cache.render_many(tweets)
+        self.assertEqual(html, [fragment_cache.render(tweet) for tweet in tweets])
+        self.assertIn("second tweet of testuser", html[1])
+        self.assertEqual((fragment_cache.stats.hits, fragment_cache.stats.misses), (3, 1))
+
+    def test_flush_when_stats_key_is_evicted(self):
+        cache = fragment_cache.get_cache()
+        # add が失敗した (キーがあった) 後、incr の前にキーが追い出された場合は add し直す
+        with mock.patch.object(cache, "add", side_effect=[False, True]) as add, mock.patch.object(
+            cache, "incr", side_effect=ValueError
+        ):
+            fragment_cache.stats.record(hits=2)
+            fragment_cache.stats.flush()
+        self.assertEqual(add.call_count, 2)
+        self.assertEqual(add.call_args.args, (fragment_cache.STATS_KEYS["hits"], 2))
 
 
 class TestTweetCreateView(TestCase):
@@ -62,6 +247,33 @@ class TestTweetCreateView(TestCase):
             target_status_code=200,
         )
         self.assertTrue(Tweet.objects.filter(user=self.user).filter(body=valid_data["body"]).exists())
+        self.assertEqual(User.objects.get(pk=self.user.pk).tweets_count, 1)
+
+    def test_success_post_fans_out_to_followers(self):
+        follower = User.objects.create_user(
+            username="follower",
+            email="follower@example.com",
+            password="asdf!@#$1234",
+        )
+        FriendShip.objects.create(follower=follower, followee=self.user)
+
+        self.client.post(self.url, {"body": "Tweet"})
+
+        tweet = Tweet.objects.get(user=self.user)
+        self.assertEqual(
+            set(TimelineEntry.objects.filter(tweet=tweet).values_list("owner", flat=True)),
+            {self.user.pk, follower.pk},
+        )
+
+    def test_success_post_publishes_after_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.client.post(self.url, {"body": "Tweet"})
+        events = [event for event in (callback() for callback in callbacks) if isinstance(event, pubsub.Event)]
+        self.assertEqual(len(events), 1)
+
+        event = events[0]
+        self.assertEqual(event.author_id, self.user.pk)
+        self.assertIn("Tweet", json.loads(event.data)["html"])
 
     def test_failure_post_with_empty_content(self):
         invalid_data = {"body": ""}
@@ -88,6 +300,155 @@ class TestTweetCreateView(TestCase):
         self.assertEqual(len(Tweet.objects.all()), 0)
 
 
+class TestTweetStreamView(TestCase):
+    def setUp(self):
+        self.url = reverse("tweets:stream")
+        self.user, self.followee, self.stranger = [
+            User.objects.create_user(username=name, email=f"{name}@example.com", password="asdf!@#$1234")
+            for name in ("testuser", "followee", "stranger")
+        ]
+        self.user.follow(self.followee)
+
+    @staticmethod
+    @sync_to_async
+    def publish(user, body):
+        return pubsub.publish_tweet(Tweet.objects.create(user=user, body=body))
+
+    async def test_success_get_streams_followee_tweets(self):
+        await sync_to_async(self.async_client.force_login)(self.user)
+        response = await self.async_client.get(self.url)
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        stream = response.streaming_content
+        self.assertTrue((await anext(stream)).startswith(b"retry: "))
+
+        await self.publish(self.stranger, "tweet of stranger")
+        event = await self.publish(self.followee, "tweet of followee")
+        chunk = (await anext(stream)).decode()
+        self.assertTrue(chunk.startswith(f"id: {event.id}\nevent: tweet\n"))
+        self.assertIn("tweet of followee", chunk)
+
+        subscribers = pubsub.broker.subscriber_count()
+        await sync_to_async(response.close)()
+        self.assertEqual(pubsub.broker.subscriber_count(), subscribers - 1)
+
+    def test_success_get_via_wsgi_is_not_streamed(self):
+        self.client.force_login(self.user)
+        subscribers = pubsub.broker.subscriber_count()
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(pubsub.broker.subscriber_count(), subscribers)
+        self.assertNotContains(self.client.get(reverse("tweets:home")), "EventSource")
+
+    async def test_home_subscribes_only_via_asgi(self):
+        await sync_to_async(self.async_client.force_login)(self.user)
+        response = await self.async_client.get(reverse("tweets:home"))
+        self.assertContains(response, f'new EventSource("{self.url}")')
+
+    async def test_success_get_resumes_from_last_event_id(self):
+        first = await self.publish(self.followee, "first tweet")
+        await self.publish(self.followee, "second tweet")
+
+        await sync_to_async(self.async_client.force_login)(self.user)
+        response = await self.async_client.get(self.url, headers={"Last-Event-ID": str(first.id)})
+        stream = response.streaming_content
+        await anext(stream)
+        chunk = (await anext(stream)).decode()
+        self.assertIn("second tweet", chunk)
+        self.assertNotIn("first tweet", chunk)
+        await sync_to_async(response.close)()
+
+    async def test_broker_drops_slow_subscriber(self):
+        broker = pubsub.Broker(history=2, queue_size=1)
+        subscription, _, _ = broker.subscribe({1})
+        for _ in range(3):
+            broker.publish(1, "tweet", "{}")
+        await asyncio.sleep(0)
+        # 溢れたら残りを捨ててストリームを閉じさせる
+        self.assertIsNone(await subscription.get())
+        self.assertEqual(broker.subscriber_count(), 0)
+
+        # 履歴から押し出された分は再送できないことを伝える
+        _, replay, missed = broker.subscribe({1}, last_event_id=0)
+        self.assertEqual([event.id for event in replay], [2, 3])
+        self.assertTrue(missed)
+
+
+class TestTweetSearchView(TestCase):
+    def setUp(self):
+        self.url = reverse("tweets:search")
+        self.json_url = reverse("tweets:search_json")
+        self.user = User.objects.create_user(
+            username="testuser",
+            email="testuser@example.com",
+            password="asdf!@#$1234",
+        )
+        self.weather = Tweet.objects.create(user=self.user, body="今日はいい天気ですね")
+        self.weathers = Tweet.objects.create(user=self.user, body="いい天気、いい天気、いい天気")
+        Tweet.objects.create(user=self.user, body="雨が降っています")
+        self.client.force_login(self.user)
+
+    def test_success_get(self):
+        response = self.client.get(self.url, {"q": "いい天気"})
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(response, "tweets/search.html")
+        # 語が多く含まれるツイートほど上位に並ぶ
+        self.assertEqual(response.context["tweet_list"], [self.weathers, self.weather])
+        self.assertNotContains(response, "雨が降っています")
+
+    def test_success_get_with_cursor(self):
+        Tweet.objects.bulk_create(Tweet(user=self.user, body=f"いい天気 {i}") for i in range(25))
+        response = self.client.get(self.url, {"q": "いい天気"})
+        page = response.context["page_obj"]
+        self.assertContains(response, f"?q=%E3%81%84%E3%81%84%E5%A4%A9%E6%B0%97&amp;cursor={page.next_cursor}")
+
+        response = self.client.get(self.url, {"q": "いい天気", "cursor": page.next_cursor})
+        second = response.context["tweet_list"]
+        self.assertEqual(len(page) + len(second), 27)
+        self.assertFalse(set(page) & set(second))
+        self.assertFalse(response.context["page_obj"].has_next())
+
+        response = self.client.get(self.url, {"q": "いい天気", "cursor": response.context["page_obj"].prev_cursor})
+        self.assertEqual(response.context["tweet_list"], page.object_list)
+
+    def test_failure_get_with_invalid_cursor_value(self):
+        response = self.client.get(self.url, {"q": "いい天気", "cursor": encode_cursor(NEXT, [[1], 1])})
+        self.assertEqual(response.status_code, 404)
+
+    def test_success_get_after_delete(self):
+        self.weathers.delete()
+        response = self.client.get(self.url, {"q": "いい天気"})
+        self.assertEqual(response.context["tweet_list"], [self.weather])
+
+    def test_success_get_json(self):
+        response = self.client.get(self.json_url, {"q": "天気です"})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual([result["id"] for result in data["results"]], [self.weather.pk])
+        self.assertEqual(data["results"][0]["username"], "testuser")
+        self.assertIsNone(data["next_cursor"])
+
+    def test_failure_get_json_with_short_query(self):
+        response = self.client.get(self.json_url, {"q": "天気"})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {"message": "3 文字以上の語で検索してください"})
+
+    def test_failure_get_json_with_invalid_cursor(self):
+        for cursor in ("invalid", encode_cursor(NEXT, [[1], 1])):
+            response = self.client.get(self.json_url, {"q": "いい天気", "cursor": cursor})
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.json(), {"message": "不正なカーソルです"})
+
+    def test_rebuild_search_index(self):
+        with connection.cursor() as cursor:
+            cursor.execute("INSERT INTO tweets_tweet_fts(tweets_tweet_fts) VALUES ('delete-all')")
+        self.assertEqual(self.client.get(self.json_url, {"q": "いい天気"}).json()["results"], [])
+
+        stdout = StringIO()
+        call_command("rebuild_search_index", batch_size=2, stdout=stdout)
+        self.assertIn("3 件のツイートを索引しました", stdout.getvalue())
+        self.assertEqual(len(self.client.get(self.json_url, {"q": "いい天気"}).json()["results"]), 2)
+
+
 class TestTweetDetailView(TestCase):
     def setUp(self):
         user = User.objects.create_user(
@@ -105,6 +466,31 @@ class TestTweetDetailView(TestCase):
         self.assertTemplateUsed(response, "tweets/detail.html")
         self.assertQuerysetEqual([response.context["object"]], [self.tweet])
 
+    def test_num_queries(self):
+        # ログインユーザー, ツイートと投稿者 (セッションはキャッシュから読む)
+        with self.assertNumQueries(2):
+            self.client.get(self.url)
+
+    def test_not_modified(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.headers["Cache-Control"], "private, no-cache")
+        self.assertIn("Cookie", response.headers["Vary"])
+
+        # ETag の材料になるツイートと投稿者の SELECT だけで 304 を返し、テンプレートは描画しない
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url, headers={"If-None-Match": response.headers["ETag"]})
+        self.assertEqual(response.status_code, 304)
+        self.assertTemplateNotUsed(response, "tweets/detail.html")
+
+    def test_modified_after_username_change(self):
+        etag = self.client.get(self.url).headers["ETag"]
+        user = User.objects.get(pk=self.tweet.user_id)
+        user.username = "renamed"
+        user.save()
+
+        response = self.client.get(self.url, headers={"If-None-Match": etag})
+        self.assertContains(response, "renamed</a>によるツイート", status_code=200)
+
 
 class TestTweetDeleteView(TestCase):
     def setUp(self):
@@ -115,6 +501,7 @@ class TestTweetDeleteView(TestCase):
             password="asdfg!@#$%12345",
         )
         self.tweet = Tweet.objects.create(user=user, body="tweet of user1")
+        User.objects.filter(pk=user.pk).update(tweets_count=1)
 
         another_user = User.objects.create_user(
             username="user2",
@@ -135,6 +522,16 @@ class TestTweetDeleteView(TestCase):
         )
         self.assertFalse(Tweet.objects.filter(pk=self.tweet.pk).exists())
         self.assertTrue(Tweet.objects.filter(pk=self.anothers_tweet.pk).exists())
+        self.assertEqual(User.objects.get(pk=self.tweet.user_id).tweets_count, 0)
+
+    def test_num_queries(self):
+        # ツイートと投稿者は test_func と DeleteView で共有する 1 回の SELECT で読み込む
+        with self.assertNumQueries(2):
+            self.client.get(self.get_url(self.tweet.pk))
+        # ツイートと投稿者, SAVEPOINT, タイムライン・いいね・いいね数・ツイートの DELETE, カウンタの UPDATE, RELEASE
+        # (ログインユーザーは直前のリクエストでキャッシュ済み)
+        with self.assertNumQueries(8):
+            self.client.post(self.get_url(self.tweet.pk))
 
     def test_failure_post_with_not_exist_tweet(self):
         response = self.client.post(self.get_url(100))
@@ -147,18 +544,501 @@ class TestTweetDeleteView(TestCase):
         self.assertEqual(len(Tweet.objects.all()), 2)
 
 
-# class TestLikeView(TestCase):
-#     def test_success_post(self):
+class TestLikeView(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="user", email="user@example.com", password="asdfg!@#$%12345")
+        self.tweet = Tweet.objects.create(user=self.user, body="tweet of user")
+        self.client.force_login(self.user)
+        self.url = reverse("tweets:like", kwargs={"pk": self.tweet.pk})
+
+    def test_success_post(self):
+        response = self.client.post(self.url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {"liked": True, "likes_count": 1})
+        self.assertTrue(Like.objects.filter(user=self.user, tweet=self.tweet).exists())
+
+    def test_failure_post_with_not_exist_tweet(self):
+        response = self.client.post(reverse("tweets:like", kwargs={"pk": self.tweet.pk + 1}))
+
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json(), {"message": "指定されたツイートは存在しません"})
+        self.assertFalse(Like.objects.exists())
+
+    def test_failure_post_with_liked_tweet(self):
+        self.client.post(self.url)
+        response = self.client.post(self.url)
+
+        self.assertEqual(response.json(), {"liked": True, "likes_count": 1})
+        self.assertEqual(Like.objects.count(), 1)
+
+    @override_settings(LIKE_COUNTER_SHARDS=4)
+    def test_count_across_shards(self):
+        users = User.objects.bulk_create(User(username=f"liker{i}", email=f"liker{i}@example.com") for i in range(20))
+        for user in users:
+            likes.like(user.pk, self.tweet.pk)
+        likes.unlike(users[0].pk, self.tweet.pk)
+
+        self.assertLessEqual(LikeCounterShard.objects.filter(tweet=self.tweet).count(), 4)
+        self.assertEqual(likes.count(self.tweet.pk), 19)
+        tweet = likes.annotate(Tweet.objects.filter(pk=self.tweet.pk), users[1].pk).get()
+        self.assertEqual((tweet.likes_count, tweet.liked), (19, True))
+
+    def test_detail_shows_likes(self):
+        detail_url = reverse("tweets:detail", kwargs={"pk": self.tweet.pk})
+        etag = self.client.get(detail_url).headers["ETag"]
+        self.client.post(self.url)
+
+        response = self.client.get(detail_url, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, '<span id="likes-count">1</span>')
+        self.assertContains(response, "いいね済み")
+
+
+class TestUnLikeView(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="user", email="user@example.com", password="asdfg!@#$%12345")
+        self.tweet = Tweet.objects.create(user=self.user, body="tweet of user")
+        likes.like(self.user.pk, self.tweet.pk)
+        self.client.force_login(self.user)
+        self.url = reverse("tweets:unlike", kwargs={"pk": self.tweet.pk})
+
+    def test_success_post(self):
+        response = self.client.post(self.url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {"liked": False, "likes_count": 0})
+        self.assertFalse(Like.objects.exists())
+
+    def test_failure_post_with_not_exist_tweet(self):
+        response = self.client.post(reverse("tweets:unlike", kwargs={"pk": self.tweet.pk + 1}))
+
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(Like.objects.count(), 1)
+
+    def test_failure_post_with_unliked_tweet(self):
+        self.client.post(self.url)
+        response = self.client.post(self.url)
+
+        self.assertEqual(response.json(), {"liked": False, "likes_count": 0})
+
+
+class TestBenchCommands(TestCase):
+    def test_seed_bench_and_bench(self):
+        call_command("seed_bench", users=20, tweets=200, follows=5, stdout=StringIO())
+        self.assertEqual(User.objects.filter(username__startswith="bench").count(), 20)
+        self.assertEqual(Tweet.objects.count(), 200)
+        self.assertTrue(FriendShip.objects.exists())
+        self.assertEqual(sum(User.objects.values_list("tweets_count", flat=True)), 200)
+        self.assertTrue(TimelineEntry.objects.exists())
+
+        stdout = StringIO()
+        call_command("bench", requests=3, warmup=0, stdout=stdout)
+        report = json.loads(stdout.getvalue())
+        self.assertEqual(
+            set(report["views"]), {"home", "profile", "following_list", "follower_list", "follow", "tweet_create"}
+        )
+        for result in report["views"].values():
+            self.assertEqual(result["requests"], 3)
+            self.assertLessEqual(result["p50_ms"], result["p99_ms"])
+        # 計測で増えたツイートは片付けられている
+        self.assertEqual(Tweet.objects.count(), 200)
+
+        stdout = StringIO()
+        call_command("bench_asgi", requests=4, concurrency=1, stdout=stdout)
+        report = json.loads(stdout.getvalue())
+        self.assertEqual(set(report["views"]), {"home", "detail", "profile"})
+        for result in report["views"].values():
+            self.assertEqual(result["wsgi"]["requests"], 4)
+            self.assertEqual(result["asgi"]["requests"], 4)
+
+        stdout = StringIO()
+        call_command("bench_sqlite", threads=1, operations=20, write_ratio=0.5, stdout=stdout)
+        report = json.loads(stdout.getvalue())
+        self.assertEqual(report["reads"] + report["writes"], 20)
+        self.assertEqual(report["locked_errors"], 0)
+        self.assertEqual(Tweet.objects.count(), 200)
+        self.assertEqual(sum(User.objects.values_list("tweets_count", flat=True)), 200)
+
+        stdout = StringIO()
+        call_command("bench_templates", tweets=50, repeat=1, stdout=stdout)
+        report = json.loads(stdout.getvalue())
+        self.assertEqual(report["tweets"], 50)
+        self.assertEqual(set(report["results"]), {"include", "tweet_overview", "tweet_list"})
+
+        stdout = StringIO()
+        call_command("bench_likes", threads=1, users=10, shards=[1, 4], stdout=stdout)
+        report = json.loads(stdout.getvalue())
+        for result in report["shards"].values():
+            self.assertEqual(result["operations"], 20)
+            self.assertTrue(result["consistent"])
+            self.assertEqual(result["likes_after"], result["likes_before"])
+
+        stdout = StringIO()
+        call_command("bench_ratelimit", iterations=100, stdout=stdout)
+        report = json.loads(stdout.getvalue())
+        self.assertEqual(report["queries"], 0)
+        self.assertEqual(set(report["results"]), {"hit", "middleware"})
+
+    def test_bench_without_requests(self):
+        call_command("seed_bench", users=3, tweets=3, follows=1, stdout=StringIO())
+        with self.assertRaisesMessage(CommandError, "--requests"):
+            call_command("bench", requests=0, stdout=StringIO())
+
+    def test_bench_without_follow_targets(self):
+        call_command("seed_bench", users=2, tweets=2, follows=0, stdout=StringIO())
+        viewer, other = User.objects.filter(username__startswith="bench")
+        viewer.follow(other)
+        other.follow(viewer)
+        with self.assertRaisesMessage(CommandError, "フォローしていない"):
+            call_command("bench", requests=1, warmup=0, stdout=StringIO())
+
+    @override_settings(JOBS_ALWAYS_EAGER=False)
+    def test_bench_sqlite_writes_through_posting(self):
+        call_command("seed_bench", users=3, tweets=3, follows=2, stdout=StringIO())
+        with mock.patch("tweets.pubsub.publish_tweet") as publish_tweet:
+            with self.captureOnCommitCallbacks(execute=True):
+                call_command("bench_sqlite", threads=1, operations=5, write_ratio=1, stdout=StringIO())
+        # ビューと同じく、フォロワーへの配信をジョブに積み、コミット後に配信する
+        self.assertEqual(Job.objects.filter(name="tweets.fan_out").count(), 5)
+        self.assertEqual(publish_tweet.call_count, 5)
+        self.assertEqual(Tweet.objects.count(), 3)
+        self.assertEqual(sum(User.objects.values_list("tweets_count", flat=True)), 3)
+
+    def test_run_threads_keeps_order(self):
+        self.assertEqual(run_threads(pow, [2, 3, 4], [3, 2, 1]), [8, 9, 4])
+        self.assertEqual(run_threads(pow, [5], [2]), [25])
+
+    def test_emit_report_to_file(self):
+        command = mock.Mock(stdout=StringIO())
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / "report.json"
+            emit_report(command, {"ok": True}, {"output": str(path)})
+            self.assertEqual(json.loads(path.read_text()), {"ok": True})
+        self.assertEqual(command.stdout.getvalue(), "")
+
+
+class TestDataTransfer(TestCase):
+    def setUp(self):
+        self.directory = Path(self.enterContext(tempfile.TemporaryDirectory()))
+        self.alice = User.objects.create_user(username="alice", email="alice@example.com", password="asdfg!@#$%12345")
+        self.bob = User.objects.create_user(username="bob", email="bob@example.com", password="asdfg!@#$%12345")
+        self.alice.follow(self.bob)
+        self.bob.follow(self.alice)
+        for user in (self.alice, self.bob):
+            Tweet.objects.create(user=user, body=f'tweet of {user.username}, "quoted"\n改行')
+
+    def snapshot(self):
+        return {
+            "users": set(User.objects.values_list("username", "email", "password", "date_joined", "last_login")),
+            "tweets": set(Tweet.objects.values_list("user__username", "body", "created_at")),
+            "follows": set(FriendShip.objects.values_list("follower__username", "followee__username", "created_at")),
+        }
+
+    def assertRoundTrip(self, format):
+        expected = self.snapshot()
+        stdout = StringIO()
+        call_command("export_data", str(self.directory), format=format, stdout=stdout)
+        self.assertIn("tweets: 2 行", stdout.getvalue())
+
+        User.objects.all().delete()
+        # 新しい ID が振られるよう、先に別のユーザーを作っておく
+        User.objects.create_user(username="someone", email="someone@example.com", password="asdfg!@#$%12345")
+        stdout = StringIO()
+        call_command("import_data", str(self.directory), format=format, batch_size=1, chunk_size=1, stdout=stdout)
+        self.assertIn("users: 2 行, スキップ 0 行", stdout.getvalue())
+        self.assertIn("行/秒", stdout.getvalue())
+
+        actual = self.snapshot()
+        self.assertEqual({row for row in actual["users"] if row[0] != "someone"}, expected["users"])
+        self.assertEqual(actual["tweets"], expected["tweets"])
+        self.assertEqual(actual["follows"], expected["follows"])
+        # カウンタは読み込んだ行から数え直す
+        self.assertEqual(
+            set(User.objects.values_list("username", "following_count", "followers_count", "tweets_count")),
+            {("alice", 1, 1, 1), ("bob", 1, 1, 1), ("someone", 0, 0, 0)},
+        )
+        self.assertFalse(User.objects.filter(pk__in=[self.alice.pk, self.bob.pk]).exists())
+
+    def test_jsonl(self):
+        self.assertRoundTrip("jsonl")
+
+    def test_csv(self):
+        self.assertRoundTrip("csv")
+
+    def test_failure_with_existing_username(self):
+        call_command("export_data", str(self.directory), stdout=StringIO())
+        User.objects.exclude(pk=self.bob.pk).delete()
+
+        with self.assertRaisesMessage(CommandError, "ユーザー名が既にあるユーザーが 1 人います (bob など)"):
+            call_command("import_data", str(self.directory), stdout=StringIO())
+        # 何も読み込まず、既にある bob にもツイートを付け替えない
+        self.assertEqual(list(User.objects.values_list("username", flat=True)), ["bob"])
+        self.assertEqual(Tweet.objects.filter(user=self.bob).count(), 1)
+
+    def test_existing_username_is_reused_with_merge_existing(self):
+        call_command("export_data", str(self.directory), stdout=StringIO())
+        User.objects.exclude(pk=self.bob.pk).delete()
+
+        stdout = StringIO()
+        call_command("import_data", str(self.directory), merge_existing=True, stdout=stdout)
+        self.assertIn("users: 1 行, スキップ 1 行", stdout.getvalue())
+        self.assertIn("follows: 2 行, スキップ 0 行", stdout.getvalue())
+        alice = User.objects.get(username="alice")
+        self.assertEqual(
+            set(FriendShip.objects.values_list("follower", "followee")),
+            {(alice.pk, self.bob.pk), (self.bob.pk, alice.pk)},
+        )
+        self.assertEqual(Tweet.objects.filter(user=self.bob).count(), 2)
+
+    def test_existing_follows_are_counted_as_skipped(self):
+        call_command("export_data", str(self.directory), stdout=StringIO())
+
+        stdout = StringIO()
+        call_command("import_data", str(self.directory), merge_existing=True, stdout=stdout)
+        self.assertIn("users: 0 行, スキップ 2 行", stdout.getvalue())
+        # 一意制約で読み飛ばしたフォロー関係は、読み込んだ行に数えない
+        self.assertIn("follows: 0 行, スキップ 2 行", stdout.getvalue())
+        self.assertEqual(FriendShip.objects.count(), 2)
+
+    def test_failure_with_missing_file(self):
+        with self.assertRaisesMessage(CommandError, "ファイルがありません"):
+            call_command("import_data", str(self.directory), stdout=StringIO())
+
+
+class TestDataTransferDeferredIndexes(TransactionTestCase):
+    def test_indexes_are_rebuilt(self):
+        directory = Path(self.enterContext(tempfile.TemporaryDirectory()))
+        user = User.objects.create_user(username="alice", email="alice@example.com", password="asdfg!@#$%12345")
+        Tweet.objects.create(user=user, body="tweet of alice")
+        call_command("export_data", str(directory), stdout=StringIO())
+        User.objects.all().delete()
+
+        call_command("import_data", str(directory), defer_indexes=True, stdout=StringIO())
+        self.assertEqual(Tweet.objects.get().user.username, "alice")
+        with connection.cursor() as cursor:
+            for model in (Tweet, FriendShip):
+                constraints = connection.introspection.get_constraints(cursor, model._meta.db_table)
+                for index in model._meta.indexes:
+                    self.assertIn(index.name, constraints)
+
+
+class TestArchive(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="user", email="user@example.com", password="asdfg!@#$%12345")
+        self.follower = User.objects.create_user(
+            username="follower", email="follower@example.com", password="asdfg!@#$%12345"
+        )
+        self.follower.follow(self.user)
+        now = timezone.now()
+        self.old_tweets = [
+            Tweet.objects.create(
+                user=self.user, body=f"old tweet {i}", created_at=now - timezone.timedelta(days=400 + i)
+            )
+            for i in range(3)
+        ]
+        self.new_tweet = Tweet.objects.create(user=self.user, body="new tweet")
+        User.objects.filter(pk=self.user.pk).update(tweets_count=4)
+        for tweet in self.old_tweets + [self.new_tweet]:
+            timeline.fan_out(tweet)
+        likes.like(self.follower.pk, self.old_tweets[0].pk)
+        self.client.force_login(self.follower)
+
+    def archive(self):
+        stdout = StringIO()
+        call_command("archive_tweets", days=365, batch_size=2, stdout=stdout)
+        return stdout.getvalue()
+
+    def test_archive_tweets(self):
+        self.assertIn("3 件のツイートをアーカイブに移しました", self.archive())
+
+        self.assertQuerysetEqual(Tweet.objects.all(), [self.new_tweet])
+        archived = ArchivedTweet.objects.order_by("pk")
+        self.assertEqual(
+            [(tweet.pk, tweet.user_id, tweet.body, tweet.created_at) for tweet in archived],
+            [(tweet.pk, tweet.user_id, tweet.body, tweet.created_at) for tweet in self.old_tweets],
+        )
+        self.assertEqual([tweet.likes_count for tweet in archived], [1, 0, 0])
+        self.assertEqual(set(TimelineEntry.objects.values_list("tweet_id", flat=True)), {self.new_tweet.pk})
+        self.assertFalse(Like.objects.exists())
+        self.assertIn("0 件のツイートをアーカイブに移しました", self.archive())
+
+    def test_detail(self):
+        self.archive()
+        url = reverse("tweets:detail", kwargs={"pk": self.old_tweets[0].pk})
+
+        response = self.client.get(url)
+        self.assertContains(response, "old tweet 0")
+        self.assertContains(response, "1 いいね (アーカイブされたツイートです)")
+        self.assertNotContains(response, "like-button")
+        response = self.client.get(url, headers={"If-None-Match": response.headers["ETag"]})
+        self.assertEqual(response.status_code, 304)
+
+        response = self.client.get(reverse("tweets:detail", kwargs={"pk": self.new_tweet.pk + 1}))
+        self.assertEqual(response.status_code, 404)
+
+    def test_profile(self):
+        self.archive()
+        # アーカイブされていない古いツイートも日時の順に混ざる
+        middle = Tweet.objects.create(
+            user=self.user, body="not archived yet", created_at=timezone.now() - timezone.timedelta(days=401)
+        )
+        url = reverse("accounts:user_profile", kwargs={"username": self.user.username})
+
+        response = self.client.get(url)
+        self.assertEqual(
+            [tweet.pk for tweet in response.context["tweets"]],
+            [self.new_tweet.pk, self.old_tweets[0].pk, middle.pk, self.old_tweets[1].pk, self.old_tweets[2].pk],
+        )
+        self.assertContains(response, "old tweet 2")
 
-#     def test_failure_post_with_not_exist_tweet(self):
+    def test_profile_pagination(self):
+        Tweet.objects.bulk_create(Tweet(user=self.user, body=f"tweet {i}") for i in range(18))
+        self.archive()
+        url = reverse("accounts:user_profile", kwargs={"username": self.user.username})
 
-#     def test_failure_post_with_liked_tweet(self):
+        first = self.client.get(url).context["page_obj"]
+        self.assertEqual(len(first), 20)
+        second = self.client.get(url, {"cursor": first.next_cursor}).context["page_obj"]
+        self.assertEqual([tweet.pk for tweet in second], [self.old_tweets[1].pk, self.old_tweets[2].pk])
+        self.assertFalse(second.has_next())
+        previous = self.client.get(url, {"cursor": second.prev_cursor}).context["page_obj"]
+        self.assertEqual([tweet.pk for tweet in previous], [tweet.pk for tweet in first])
 
+    def test_search(self):
+        self.archive()
+        response = self.client.get(reverse("tweets:search"), {"q": "tweet"})
+        self.assertEqual(
+            {tweet.pk for tweet in response.context["tweet_list"]},
+            {self.new_tweet.pk, *(tweet.pk for tweet in self.old_tweets)},
+        )
+        self.assertContains(response, "old tweet 1")
+
+    def test_export_includes_archived_tweets(self):
+        expected = set(Tweet.objects.values_list("user__username", "body", "created_at"))
+        self.archive()
+        directory = Path(self.enterContext(tempfile.TemporaryDirectory()))
+        stdout = StringIO()
+        call_command("export_data", str(directory), stdout=stdout)
+        self.assertIn("tweets: 4 行", stdout.getvalue())
+
+        # アーカイブしたツイートは読み込むと Tweet に戻る
+        User.objects.all().delete()
+        ArchivedTweet.objects.all().delete()
+        call_command("import_data", str(directory), stdout=StringIO())
+        self.assertEqual(set(Tweet.objects.values_list("user__username", "body", "created_at")), expected)
+        self.assertEqual(Tweet.objects.count(), 4)
+        self.assertEqual(User.objects.get(username="user").tweets_count, 4)
+
+    def copy_without_delete(self):
+        """元の行を消す前に止まった実行のように、古いツイートを両方のテーブルに置く。"""
+        ArchivedTweet.objects.bulk_create(
+            ArchivedTweet(id=tweet.pk, user_id=tweet.user_id, body=tweet.body, created_at=tweet.created_at)
+            for tweet in self.old_tweets
+        )
+
+    def test_tweets_in_both_tables_are_read_once(self):
+        self.copy_without_delete()
+
+        response = self.client.get(reverse("accounts:user_profile", kwargs={"username": self.user.username}))
+        self.assertEqual(
+            [tweet.pk for tweet in response.context["tweets"]],
+            [self.new_tweet.pk, *(tweet.pk for tweet in self.old_tweets)],
+        )
+        self.assertFalse(any(tweet.is_archived for tweet in response.context["tweets"]))
+
+        response = self.client.get(reverse("tweets:search"), {"q": "old tweet"})
+        self.assertEqual(sorted(tweet.pk for tweet in response.context["tweet_list"]), [t.pk for t in self.old_tweets])
+
+        directory = Path(self.enterContext(tempfile.TemporaryDirectory()))
+        stdout = StringIO()
+        call_command("export_data", str(directory), stdout=stdout)
+        self.assertIn("tweets: 4 行", stdout.getvalue())
+
+        # 次の実行で元の行が消える
+        self.assertIn("3 件のツイートをアーカイブに移しました", self.archive())
+        self.assertQuerysetEqual(Tweet.objects.all(), [self.new_tweet])
+        self.assertEqual(ArchivedTweet.objects.count(), 3)
+
+    def test_archive_batch_rolls_back_together_on_same_database(self):
+        with mock.patch("django.db.models.query.QuerySet.delete", side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                archive.archive_batch(archive.cutoff(days=365))
+        # アーカイブへの書き込みも取り消され、同じ ID が両方に残らない
+        self.assertFalse(ArchivedTweet.objects.exists())
+        self.assertEqual(Tweet.objects.count(), 4)
+
+    def test_delete_archived_tweet(self):
+        self.archive()
+        tweet = self.old_tweets[0]
+        url = reverse("tweets:delete", kwargs={"pk": tweet.pk})
+        # 投稿者でなければ消せない
+        self.assertEqual(self.client.post(url).status_code, 403)
+
+        self.client.force_login(self.user)
+        response = self.client.get(reverse("tweets:detail", kwargs={"pk": tweet.pk}))
+        self.assertContains(response, f'<a href="{url}">削除する</a>', html=True)
+        fragment_cache.get_cache().set(fragment_cache.cache_key(ArchivedTweet.objects.get(pk=tweet.pk)), "stale")
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+        response = self.client.post(url)
+        self.assertRedirects(response, reverse("tweets:home"))
+        self.assertFalse(ArchivedTweet.objects.filter(pk=tweet.pk).exists())
+        self.assertEqual(User.objects.get(pk=self.user.pk).tweets_count, 3)
+        self.assertIsNone(fragment_cache.get_cache().get(fragment_cache.cache_key(tweet)))
+        self.assertEqual(self.client.get(reverse("tweets:detail", kwargs={"pk": tweet.pk})).status_code, 404)
+
+    def test_api_reads_archived_tweets(self):
+        self.archive()
+        response = self.client.get(reverse("api:v1:tweet_detail", kwargs={"pk": self.old_tweets[0].pk}))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["body"], "old tweet 0")
+        self.assertEqual(response.json()["username"], self.user.username)
+
+        response = self.client.get(reverse("api:v1:user_tweets", kwargs={"username": self.user.username}))
+        self.assertEqual(
+            [row["id"] for row in response.json()["results"]],
+            [self.new_tweet.pk, *(tweet.pk for tweet in self.old_tweets)],
+        )
+
+        response = self.client.get(reverse("api:v1:tweet_detail", kwargs={"pk": self.new_tweet.pk + 1}))
+        self.assertEqual(response.status_code, 404)
+
+    def test_recount_includes_archived_tweets(self):
+        self.archive()
+        call_command("recount", stdout=StringIO())
+        self.assertEqual(User.objects.get(pk=self.user.pk).tweets_count, 4)
+
+
+@override_settings(ARCHIVE_DATABASE="archive")
+class TestArchiveDatabase(TestCase):
+    databases = {"default", "archive"}
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="user", email="user@example.com", password="asdfg!@#$%12345")
+        self.tweet = Tweet.objects.create(
+            user=self.user, body="old tweet", created_at=timezone.now() - timezone.timedelta(days=400)
+        )
+        self.client.force_login(self.user)
 
-# class TestUnLikeView(TestCase):
+    def test_archive_to_other_database(self):
+        call_command("archive_tweets", stdout=StringIO())
+        self.assertFalse(Tweet.objects.exists())
+        self.assertEqual(ArchivedTweet.objects.using("archive").get().pk, self.tweet.pk)
+        self.assertFalse(ArchivedTweet.objects.using("default").exists())
 
-#     def test_success_post(self):
+        response = self.client.get(reverse("tweets:detail", kwargs={"pk": self.tweet.pk}))
+        self.assertContains(response, "old tweet")
+        response = self.client.get(reverse("accounts:user_profile", kwargs={"username": "user"}))
+        self.assertEqual([tweet.pk for tweet in response.context["tweets"]], [self.tweet.pk])
+        response = self.client.get(reverse("tweets:search"), {"q": "old tweet"})
+        self.assertEqual([tweet.pk for tweet in response.context["tweet_list"]], [self.tweet.pk])
 
-#     def test_failure_post_with_not_exist_tweet(self):
+    def test_delete_archived_tweet_on_other_database(self):
+        call_command("archive_tweets", stdout=StringIO())
+        User.objects.filter(pk=self.user.pk).update(tweets_count=1)
 
-#     def test_failure_post_with_unliked_tweet(self):
+        response = self.client.post(reverse("tweets:delete", kwargs={"pk": self.tweet.pk}))
+        self.assertRedirects(response, reverse("tweets:home"))
+        self.assertFalse(ArchivedTweet.objects.using("archive").exists())
+        self.assertEqual(User.objects.get(pk=self.user.pk).tweets_count, 0)
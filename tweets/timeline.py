@@ -0,0 +1,68 @@
+from itertools import chain, islice
+
+from django.db.models import Window
+from django.db.models.functions import RowNumber
+
+from accounts.models import FriendShip
+from tweets.models import TimelineEntry, Tweet
+
+# フォロー時に取り込む相手の過去ツイートの件数
+BACKFILL_SIZE = 100
+BATCH_SIZE = 1000
+
+
+def _batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def _insert(entries):
+    for batch in _batched(entries, BATCH_SIZE):
+        TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def add_own(tweet):
+    """投稿者本人のタイムラインにツイートを書き込む。"""
+    _insert([TimelineEntry(owner_id=tweet.user_id, tweet_id=tweet.pk, created_at=tweet.created_at)])
+
+
+def fan_out(tweet, include_author=True):
+    """フォロワー全員と、include_author が真なら投稿者本人のタイムラインにツイートを書き込む。"""
+    follower_ids = (
+        FriendShip.objects.filter(followee_id=tweet.user_id)
+        .values_list("follower_id", flat=True)
+        .iterator(chunk_size=BATCH_SIZE)
+    )
+    _insert(
+        TimelineEntry(owner_id=owner_id, tweet_id=tweet.pk, created_at=tweet.created_at)
+        for owner_id in chain([tweet.user_id] if include_author else [], follower_ids)
+    )
+
+
+def backfill(owner_id, followee_ids, size=BACKFILL_SIZE):
+    """フォローした相手それぞれの直近 size 件のツイートを、1 回の SELECT でタイムラインに取り込む。"""
+    if not followee_ids:
+        return
+    tweets = (
+        Tweet.objects.filter(user_id__in=followee_ids)
+        .annotate(rank=Window(RowNumber(), partition_by="user_id", order_by=["-created_at", "-id"]))
+        .filter(rank__lte=size)
+        .values_list("id", "created_at")
+    )
+    _insert(
+        TimelineEntry(owner_id=owner_id, tweet_id=tweet_id, created_at=created_at)
+        for tweet_id, created_at in tweets.iterator(chunk_size=BATCH_SIZE)
+    )
+
+
+def prune(owner_id, followee_ids):
+    """フォローを解除した相手のツイートをタイムラインから取り除く。"""
+    if followee_ids:
+        TimelineEntry.objects.filter(owner_id=owner_id, tweet__user_id__in=followee_ids).delete()
+
+
+def rebuild(owner_id):
+    TimelineEntry.objects.filter(owner_id=owner_id).delete()
+    followee_ids = FriendShip.objects.filter(follower_id=owner_id).values_list("followee_id", flat=True)
+    backfill(owner_id, [owner_id, *followee_ids])
@@ -0,0 +1,117 @@
+import csv
+import gzip
+import json
+from contextlib import contextmanager
+from datetime import datetime
+from itertools import islice
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+
+from accounts.models import FriendShip
+from tweets.models import ArchivedTweet, Tweet
+
+User = get_user_model()
+
+FORMATS = ("jsonl", "csv")
+# 書き出す順番。読み込むときにユーザーの ID の対応表を先に作れるよう、ユーザーを最初にする
+TABLES = {
+    "users": (
+        User,
+        (
+            "id",
+            "username",
+            "email",
+            "password",
+            "first_name",
+            "last_name",
+            "is_active",
+            "is_staff",
+            "is_superuser",
+            "date_joined",
+            "last_login",
+        ),
+    ),
+    "tweets": (Tweet, ("id", "user_id", "body", "created_at")),
+    "follows": (FriendShip, ("follower_id", "followee_id", "created_at")),
+}
+# 同じ列を持ち、続けて書き出すテーブル。アーカイブしたツイートは読み込むと Tweet に戻る
+ARCHIVES = {"tweets": ArchivedTweet}
+# 圧縮率より速度を優先する (既定の 9 は 6 の数倍遅いわりに小さくならない)
+COMPRESS_LEVEL = 6
+
+
+def path_for(directory, name, format):
+    return directory / f"{name}.{format}.gz"
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def _encode(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def write_rows(path, format, fields, rows):
+    """rows (タプルのイテラブル) を 1 行ずつ圧縮して書き出し、書いた行数を返す。"""
+    count = 0
+    with gzip.open(path, "wt", encoding="utf-8", newline="", compresslevel=COMPRESS_LEVEL) as f:
+        if format == "csv":
+            writer = csv.writer(f)
+            writer.writerow(fields)
+            for row in rows:
+                writer.writerow([_encode(value) for value in row])
+                count += 1
+        else:
+            for row in rows:
+                f.write(json.dumps(dict(zip(fields, map(_encode, row))), ensure_ascii=False) + "\n")
+                count += 1
+    return count
+
+
+def read_rows(path, format, model, fields):
+    """path を 1 行ずつ読み、fields の値をモデルのフィールドの型に直した dict を返すジェネレータ。"""
+    converters = [_converter(model._meta.get_field(field)) for field in fields]
+    with gzip.open(path, "rt", encoding="utf-8", newline="") as f:
+        if format == "csv":
+            reader = csv.reader(f)
+            header = next(reader)
+            if tuple(header) != tuple(fields):
+                raise ValueError(f"{path} の列が {', '.join(fields)} ではありません")
+            rows = reader
+        else:
+            rows = ([record.get(field) for field in fields] for record in map(json.loads, f))
+        for row in rows:
+            yield {field: convert(value) for field, convert, value in zip(fields, converters, row)}
+
+
+def _converter(field):
+    def convert(value):
+        # CSV では NULL を空文字列で表す
+        if value == "" and field.null:
+            return None
+        return field.to_python(value)
+
+    return convert
+
+
+@contextmanager
+def deferred_indexes(*models):
+    """
+    models の (一意制約でない) 索引を消してから読み込み、最後にまとめて作り直す。
+    行を足すたびに索引を更新するより速いが、その間は索引を使う読み取りが遅くなるので、サイトを止めて使う。
+    """
+    with connection.schema_editor() as editor:
+        for model in models:
+            for index in model._meta.indexes:
+                editor.remove_index(model, index)
+    try:
+        yield
+    finally:
+        with connection.schema_editor() as editor:
+            for model in models:
+                for index in model._meta.indexes:
+                    editor.add_index(model, index)
@@ -6,9 +6,12 @@ app_name = "tweets"
 
 urlpatterns = [
     path("home/", views.HomeView.as_view(), name="home"),
+    path("stream/", views.TweetStreamView.as_view(), name="stream"),
+    path("search/", views.TweetSearchView.as_view(), name="search"),
+    path("search/json/", views.TweetSearchJsonView.as_view(), name="search_json"),
     path("create/", views.TweetCreateView.as_view(), name="create"),
     path("<int:pk>/", views.TweetDetailView.as_view(), name="detail"),
     path("<int:pk>/delete/", views.TweetDeleteView.as_view(), name="delete"),
-    # path('<int:pk>/like/', views.LikeView, name='like'),
-    # path('<int:pk>/unlike/', views.UnlikeView, name='unlike'),
+    path("<int:pk>/like/", views.LikeView.as_view(), name="like"),
+    path("<int:pk>/unlike/", views.UnlikeView.as_view(), name="unlike"),
 ]
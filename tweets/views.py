@@ -1,14 +1,154 @@
+import asyncio
+import time
+from urllib.parse import urlencode
+
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
-from django.http import HttpResponseRedirect
+from django.http import Http404, HttpResponse, HttpResponseRedirect, JsonResponse, StreamingHttpResponse
 from django.urls import reverse_lazy
-from django.views.generic import CreateView, DeleteView, DetailView, ListView
+from django.views.generic import CreateView, DeleteView, DetailView, TemplateView, View
 
-from tweets.models import Tweet
+from accounts import suggestions
+from accounts.models import FriendShip
+from mysite import conditional
+from mysite.mixins import AsyncLoginRequiredMixin, CachedObjectMixin
+from tweets import archive, likes, posting, pubsub
+from tweets.models import TimelineEntry, Tweet
+from tweets.pagination import KeysetPaginator
+from tweets.search import MIN_TERM_LENGTH, SearchPaginator, match_expression
 
 
-class HomeView(LoginRequiredMixin, ListView):
+class HomeView(AsyncLoginRequiredMixin, TemplateView):
     template_name = "tweets/home.html"
-    queryset = Tweet.objects.select_related("user").order_by("-created_at")
+    replica_reads = True
+    paginate_by = 20
+
+    async def get(self, request, *args, **kwargs):
+        entries = TimelineEntry.objects.filter(owner_id=request.user.pk).select_related("tweet__user")
+        paginator = KeysetPaginator(entries, self.paginate_by, keys=("created_at", "tweet_id"))
+        page, suggested_users = await asyncio.gather(
+            paginator.apaginate(request.GET.get("cursor")),
+            suggestions.afor_user(request.user.pk),
+        )
+        page.object_list = [entry.tweet for entry in page.object_list]
+        context = self.get_context_data(
+            page_obj=page,
+            is_paginated=page.has_other_pages(),
+            tweet_list=page.object_list,
+            suggestions=suggested_users,
+            event_stream=pubsub.is_available(request),
+            **kwargs,
+        )
+        return self.render_to_response(context)
+
+
+class EventStream:
+    """
+    StreamingHttpResponse は close() を持つイテレータならレスポンスの終了時に呼び出すので、
+    ジェネレータの後始末を待たずにそこで購読を解除する。
+    """
+
+    def __init__(self, events, subscription):
+        self.events = events
+        self.subscription = subscription
+
+    def __aiter__(self):
+        return self.events
+
+    def close(self):
+        self.subscription.close()
+
+
+class TweetStreamView(AsyncLoginRequiredMixin, View):
+    """
+    自分とフォロー中のユーザーの新しいツイートを Server-Sent Events で送る。
+    接続はイベントループ上で待つだけなので、スレッドを占有しない。
+    配信はプロセス内で行うので、ASGI サーバーを 1 プロセスで動かす必要がある。
+    """
+
+    heartbeat_interval = 15
+    # 切断を検知できないサーバーでも購読が残り続けないよう、一定時間で閉じてブラウザに再接続させる
+    max_duration = 300
+    retry_ms = 3000
+
+    async def get(self, request, *args, **kwargs):
+        if not pubsub.is_available(request):
+            # EventSource は 204 を受け取ると再接続しない
+            return HttpResponse(status=204)
+        followees = FriendShip.objects.filter(follower_id=request.user.pk).values_list("followee_id", flat=True)
+        user_ids = {pk async for pk in followees} | {request.user.pk}
+        try:
+            last_event_id = int(request.headers["Last-Event-ID"])
+        except (KeyError, ValueError):
+            last_event_id = None
+
+        subscription, replay, missed = pubsub.broker.subscribe(user_ids, last_event_id)
+        response = StreamingHttpResponse(
+            EventStream(self.stream(subscription, replay, missed), subscription), content_type="text/event-stream"
+        )
+        response["Cache-Control"] = "no-cache"
+        response["X-Accel-Buffering"] = "no"
+        return response
+
+    async def stream(self, subscription, replay, missed):
+        try:
+            yield f"retry: {self.retry_ms}\n\n"
+            if missed:
+                # 再送しきれないイベントがあるので、クライアントにページの再読み込みを促す
+                yield "event: reset\ndata: {}\n\n"
+            for event in replay:
+                yield event.encode()
+
+            deadline = time.monotonic() + self.max_duration
+            while (remaining := deadline - time.monotonic()) > 0:
+                try:
+                    event = await asyncio.wait_for(subscription.get(), min(self.heartbeat_interval, remaining))
+                except asyncio.TimeoutError:
+                    yield ": heartbeat\n\n"
+                    continue
+                if event is None:
+                    break
+                yield event.encode()
+        finally:
+            subscription.close()
+
+
+class TweetSearchView(LoginRequiredMixin, TemplateView):
+    template_name = "tweets/search.html"
+    replica_reads = True
+    paginate_by = 20
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        query = context["query"] = self.request.GET.get("q", "").strip()
+        if match_expression(query):
+            page = SearchPaginator(query, self.paginate_by).paginate(self.request.GET.get("cursor"))
+            context.update(page_obj=page, tweet_list=page.object_list, pager_query=urlencode({"q": query}))
+        return context
+
+
+class TweetSearchJsonView(LoginRequiredMixin, View):
+    replica_reads = True
+    paginate_by = 20
+
+    def get(self, request, *args, **kwargs):
+        query = request.GET.get("q", "").strip()
+        if not match_expression(query):
+            return self.error(f"{MIN_TERM_LENGTH} 文字以上の語で検索してください")
+
+        try:
+            page = SearchPaginator(query, self.paginate_by).paginate(request.GET.get("cursor"))
+        except Http404 as e:
+            return self.error(str(e))
+        results = [
+            {"id": tweet.pk, "username": tweet.user.username, "body": tweet.body, "created_at": tweet.created_at}
+            for tweet in page
+        ]
+        return JsonResponse({"results": results, "next_cursor": page.next_cursor, "prev_cursor": page.prev_cursor})
+
+    def error(self, message):
+        response = JsonResponse({"message": message})
+        response.status_code = 400
+        return response
 
 
 class TweetCreateView(LoginRequiredMixin, CreateView):
@@ -20,22 +160,86 @@ class TweetCreateView(LoginRequiredMixin, CreateView):
     def form_valid(self, form):
         tweet = form.save(commit=False)
         tweet.user = self.request.user
-        tweet.save()
-        self.object = tweet
+        self.object = posting.post(tweet)
         return HttpResponseRedirect(self.get_success_url())
 
 
-class TweetDetailView(LoginRequiredMixin, DetailView):
+class ArchivedTweetMixin(CachedObjectMixin):
+    """get_object() で見つからないツイートは、アーカイブに移された古いツイート (ArchivedTweet) から探す。"""
+
+    def get_uncached_object(self):
+        try:
+            return super().get_uncached_object()
+        except Http404:
+            tweet = archive.get(self.kwargs[self.pk_url_kwarg])
+            if tweet is None:
+                raise
+            return tweet
+
+
+class TweetDetailView(AsyncLoginRequiredMixin, ArchivedTweetMixin, DetailView):
     template_name = "tweets/detail.html"
+    # アーカイブしたツイート (ArchivedTweet) も同じ名前でテンプレートに渡す
+    context_object_name = "tweet"
+    replica_reads = True
     model = Tweet
+    owner_field = "user"
+
+    def get_queryset(self):
+        # いいね数といいね済みかどうかも、ツイートと同じ SELECT で読む
+        return likes.annotate(super().get_queryset(), self.request.user.pk)
+
+    async def get(self, request, *args, **kwargs):
+        self.object = tweet = await self.aget_object()
+        # 本文は変更できないので、表示が変わるのは投稿者のユーザー名といいねが変わったときと、アーカイブに移されたときだけ
+        etag = conditional.make_page_etag(
+            request, tweet.pk, tweet.user.profile_version, tweet.likes_count, tweet.liked, tweet.is_archived
+        )
+        response = conditional.get_not_modified(request, etag)
+        if response is None:
+            response = self.render_to_response(self.get_context_data(object=tweet))
+            conditional.set_validators(response, etag)
+        return response
 
 
-class TweetDeleteView(UserPassesTestMixin, DeleteView):
+class TweetDeleteView(UserPassesTestMixin, ArchivedTweetMixin, DeleteView):
     template_name = "tweets/delete.html"
     success_url = reverse_lazy("tweets:home")
     model = Tweet
+    owner_field = "user"
+
+    def form_valid(self, form):
+        posting.delete(self.object)
+        return HttpResponseRedirect(self.get_success_url())
 
     def test_func(self):
         tweet = self.get_object()
         if tweet.user == self.request.user:
             return True
+
+
+class LikeBaseView(LoginRequiredMixin, View):
+    """
+    いいね・いいねの取り消しの共通部分。サブクラスは (user_id, tweet_id) を受け取る action と、
+    実行後の状態 liked を定義する。結果の状態といいね数を JSON で返す。
+    """
+
+    def post(self, request, *args, **kwargs):
+        tweet_id = kwargs["pk"]
+        if not Tweet.objects.filter(pk=tweet_id).exists():
+            response = JsonResponse({"message": "指定されたツイートは存在しません"})
+            response.status_code = 404
+            return response
+
+        self.action(request.user.pk, tweet_id)
+        return JsonResponse({"liked": self.liked, "likes_count": likes.count(tweet_id)})
+
+
+class LikeView(LikeBaseView):
+    action = staticmethod(likes.like)
+    liked = True
+
+
+class UnlikeView(LikeBaseView):
+    action = staticmethod(likes.unlike)
+    liked = False